@@ -0,0 +1,25 @@
+#########################################################
+#   Assembler package. Created on 18/10/26
+#   Intent: The ISA assembler, disassembler and simulator, as a package: 'from assembler import ISA_compiler'.
+#           Nothing is imported here eagerly, so importing the package (e.g. by the isa command, look at cli.py)
+#           costs only the modules which are actually used. The names below are imported on their first use.
+
+_EXPORTS = {
+    'ISA_compiler': 'isa_compiler',
+    'AssemblySimulator': 'simulator',
+    'AssemblyCache': 'assembly_cache',
+    'PeepholeOptimizer': 'peephole',
+    'link': 'linker',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    import importlib
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,161 @@
+#########################################################
+#   Assembly cache file. Created on 18/10/26
+#   Intent: On-disk cache of assembled programs, so that builds and test runs don't reassemble unchanged .asm files.
+#           Used by ISA_compiler(cache=AssemblyCache()).
+#
+#           An entry is keyed by the sha256 of:
+#               the assembler version (ASSEMBLER_VERSION in isa_compiler.py, bumped when the encoding changes),
+#               the opcode table - the contents of opcodes.py and the opcode values, so any change of opcodes.py
+#                                  invalidates every entry by itself,
+#               the contents of the source file.
+#           The file name isn't part of the key, so identical sources share an entry.
+#
+#           Every entry is a single file '<key>.entry' in the cache directory:
+#               header - magic 'ASMC', format version (16 bits), length of the labels JSON (32 bits)
+#               labels - the label table (label name -> byte address) as JSON
+#               the bytecode
+#           Entries are written to a temporary file and renamed, so concurrent processes (e.g. the workers of
+#           regression_runner.py) never see a partial entry. The size is bounded: a hit touches the entry's modification
+#           time, and beyond max_entries the least recently used entries are removed.
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+
+from . import opcodes as op
+
+MAGIC = b'ASMC'
+VERSION = 1
+
+HEADER = struct.Struct(">4sHI")
+SUFFIX = '.entry'
+READ_CHUNK = 1024 * 1024
+
+_opcodes_fingerprint = None
+
+
+def opcodes_fingerprint():
+    """ sha256 of opcodes.py and of the opcode table. Computed once per process. """
+    global _opcodes_fingerprint
+    if _opcodes_fingerprint is None:
+        digest = hashlib.sha256()
+        with open(op.__file__, "rb") as f:
+            digest.update(f.read())
+        digest.update(repr(sorted((opcode.name, opcode.value) for opcode in op.Opcode)).encode('utf-8'))
+        _opcodes_fingerprint = digest.hexdigest()
+    return _opcodes_fingerprint
+
+
+def default_directory():
+    return os.environ.get('ISA_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'isa_assembler')
+
+
+class AssemblyCache:
+    """
+        * directory   - where the entries are kept. By default $ISA_CACHE_DIR, or ~/.cache/isa_assembler.
+        * max_entries - the maximal number of entries. The least recently used ones are removed beyond it.
+
+        * functions interface - key, get, put, clear.
+        \t key - the key of a source file.
+        \t get - (bytecode, labels) of the key, or None if it's not cached.
+        \t put - stores the bytecode and the labels of the key.
+
+        hits and misses count the get calls.
+    """
+    def __init__(self, directory=None, max_entries=1024):
+        self.directory = directory or default_directory()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, source_file_name, assembler_version):
+        digest = hashlib.sha256()
+        digest.update(f"{assembler_version}\n{opcodes_fingerprint()}\n".encode('utf-8'))
+        with open(source_file_name, "rb") as f:
+            while chunk := f.read(READ_CHUNK):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+
+        entry = self._unpack(data)
+        if entry is None:
+            # an entry of another format version, or a damaged one
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry
+
+    def put(self, key, bytecode, labels):
+        labels_json = json.dumps(labels, sort_keys=True).encode('utf-8')
+        data = HEADER.pack(MAGIC, VERSION, len(labels_json)) + labels_json + bytes(bytecode)
+
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, "wb") as f:
+                f.write(data)
+            os.replace(temporary, self._path(key))
+        except BaseException:
+            self._remove(temporary)
+            raise
+
+        self._evict()
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                self._remove(os.path.join(self.directory, name))
+
+    #
+    # UTILITY FUNCTIONS
+    #
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def _unpack(self, data):
+        if len(data) < HEADER.size:
+            return None
+        magic, version, labels_length = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or HEADER.size + labels_length > len(data):
+            return None
+
+        try:
+            labels = json.loads(data[HEADER.size:HEADER.size + labels_length])
+        except ValueError:
+            return None
+        return data[HEADER.size + labels_length:], labels
+
+    def _evict(self):
+        """ removes the least recently used entries beyond max_entries """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.stat(path).st_mtime_ns, path))
+                except OSError: # removed by another process meanwhile
+                    pass
+
+        if len(entries) > self.max_entries:
+            entries.sort()
+            for _, path in entries[:len(entries) - self.max_entries]:
+                self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -3,12 +3,21 @@
 #   Intent: The main reason was to separate the lexing part of the assembly from the isa_compiler.py file. 
 #           Though the syntax is trivial, there were several problems with comments and commas.
 #           They were too verbose to solve in the compiler file.
-#           I don't use the custom iterator object either, because it turned out to be easier to just use the split function
+#
+#           The text is lexed line by line with a single compiled regex, and the words are classified with set lookups.
+#           stream() yields the tokens lazily from a file object, so large files are never held in memory whole.
 #           
 #           The lexer supports comments, all opcodes, all registers, numerical (signed and unsigned) immediate values, hex immediate values and also labels.
 
-import opcodes as op
-from tokens import Token
+import io
+import re
+
+from . import opcodes as op
+from .tokens import Token
+
+# a label with its ':', a comment till the end of the line, a word (opcode, register, number or identifier), or a lone ':'.
+# Words are separated by whitespace and commas.
+TOKEN_REGEX = re.compile(r"(?P<LABEL>[^\s,:;]+)[\s,]*:|(?P<COMMENT>;.*)|(?P<WORD>[^\s,:;]+)|(?P<COLON>:)")
 
 # TODO: write a better test. Compare the tokens with desired output.
 
@@ -16,8 +25,12 @@ from tokens import Token
 class AssemblyLexer:
     def __init__(self, ):
 
-        self.opcodes = [op.name for op in op.Opcode] # all possible opcodes
-        self.registers = ['r'+str(i) for i in range(32)] # all possible registers (r0-r31)
+        opcodes, _, registers = op.lookup_tables()
+        self.opcodes = list(opcodes) # all possible opcodes
+        self.registers = list(registers) # all possible registers (r0-r31)
+        self.opcode_set = opcodes.keys()
+        self.register_set = registers.keys()
+        self.keywords = {} # spelling -> (token type, value) of the opcodes and registers seen so far
 
         self.tokens = []
 
@@ -43,77 +56,73 @@ class AssemblyLexer:
             i+=1
 
     def tokenize(self, input_text:str):
-        # The idea is to split the text into preprocessed tokens. We suppose that the program is written syntatically correct,
-        # and it allows us to split 'addi r0, r1, r2' into 'addi', 'r0', 'r1', 'r2', just using whitespace.
-        # In the case that whitespace is not mandatory as with commas and columns, we add it artificially.
-        # This approach is more elegant than iteration and suits better for simple syntax languages like our assembler.
+        """ returns the list of all the tokens of the text, ending with EOF. Also kept in self.tokens for pretty. """
         self.text = input_text
-        self.tokens = []
-
-        # Preprocess text for simple lexing, avoiding cases like 'label:' vs 'label :'
-        text = self.text.replace(';', ' ; ')
-        text = text.replace(':', ' : ')
-        text = text.replace(',', ' ')
-        text = text.replace('\n', ' __TOKENIZATION__NEW__LINE__ ')
-
-        words = text.split()
-        i = 0
-        line = 1
-        word = 1
-
-        while i < len(words):
-            s = words[i]
-
-            # thrack lines
-            if s == '__TOKENIZATION__NEW__LINE__':
-                line += 1
-                word = 0
-
-            # labels
-            elif i + 1 < len(words) and words[i + 1] == ':':
-                self.tokens.append(Token("LABEL", s, line, word))
-                i += 1  # Skip the ':'
-
-            # opcodes
-            elif s.upper() in self.opcodes:
-                self.tokens.append(Token("OPCODE", s.upper(), line, word))
-
-            #  registers
-            elif s.lower() in self.registers:
-                self.tokens.append(Token("REGISTER", s.lower(), line, word))
-
-            # unsigned numbers
-            elif s.isdigit():
-                self.tokens.append(Token("NUMERIC", s, line, word))
-
-            # signed numbers
-            elif s.startswith('-') and s[1:].isdigit():
-                self.tokens.append(Token("SIGNED", s, line, word))
-
-            # hex
-            elif s.startswith('0x'):
-                self.tokens.append(Token("HEX", s.upper(), line, word))
-
-            # comments
-            elif s == ';':
-                # Skip all words until newline
-                while i < len(words) and words[i] != '__TOKENIZATION__NEW__LINE__':
-                    i += 1
-                line += 1
-                word = 0
-
-            # identifiers. Either syntatically incorrect words, or label jumps e.g. 'j label'. The first case must be handled by parser.
-            else:
-                self.tokens.append(Token("IDENTIFIER", s, line, word))
-
-            # iterate
-            i += 1
-            word += 1
-
-        # add eof. End of lexing.
-        self.tokens.append(Token("EOF", 0, line, word))
+        self.tokens = list(self.stream(io.StringIO(input_text)))
         return self.tokens
 
+    def stream(self, file):
+        """
+            yields the tokens of a text file object (or any iterable of lines) one by one, ending with EOF.
+            It reads a single line at a time, so the memory doesn't depend on the size of the file,
+            and the encoder can consume the tokens while the file is being read.
+        """
+        # lines and words are counted from 1. A label and its ':' are a single word.
+        line = 0
+        word = 0
+        text = '\n'
+        keywords = self.keywords
+
+        for line, text in enumerate(file, 1):
+            word = 0
+            # the groups which didn't match are empty strings
+            for label, comment, s, colon in TOKEN_REGEX.findall(text):
+                word += 1
+
+                if label:
+                    yield Token("LABEL", label, line, word)
+                    continue
+                if comment:
+                    break
+                if not s:
+                    s = colon
+
+                # opcodes and registers, in any spelling seen before
+                if (keyword := keywords.get(s)) is not None:
+                    yield Token(keyword[0], keyword[1], line, word)
+
+                # unsigned numbers
+                elif s.isdigit():
+                    yield Token("NUMERIC", s, line, word)
+
+                # signed numbers
+                elif s.startswith('-') and s[1:].isdigit():
+                    yield Token("SIGNED", s, line, word)
+
+                # opcodes
+                elif (upper := s.upper()) in self.opcode_set:
+                    keywords[s] = ("OPCODE", upper)
+                    yield Token("OPCODE", upper, line, word)
+
+                # registers
+                elif (lower := s.lower()) in self.register_set:
+                    keywords[s] = ("REGISTER", lower)
+                    yield Token("REGISTER", lower, line, word)
+
+                # hex
+                elif s.startswith('0x'):
+                    yield Token("HEX", upper, line, word)
+
+                # identifiers. Either syntatically incorrect words, or label jumps e.g. 'j label'. The first case must be handled by parser.
+                else:
+                    yield Token("IDENTIFIER", s, line, word)
+
+        # add eof. End of lexing. It's placed after the last line, or at the start of a new one if the text ends with a newline.
+        if text.endswith('\n'):
+            yield Token("EOF", 0, line + 1, 1)
+        else:
+            yield Token("EOF", 0, line, word + 1)
+
 
 # just for future testing. A redundant part. Should be removed after everything's done.
 TESTING = False
@@ -0,0 +1,378 @@
+#########################################################
+#   Batch simulator. Created on 18/10/26
+#   Intent: Runs the same program against many inputs at once. Keeps N machine states ('lanes') as numpy arrays,
+#           (N x 32 uint32 registers, N x ram_size uint8 RAM) and executes every instruction across all lanes
+#           with vectorized operations, instead of running N separate AssemblySimulators.
+#
+#           Lanes may diverge on branches, so each lane has its own PC. At every step the smallest PC among the
+#           running lanes is executed for all lanes which are at it (the PC mask). The lanes that went ahead wait,
+#           so the diverged lanes reconverge as soon as they reach the same PC again.
+#
+#           The results of every lane are identical to the ones of AssemblySimulator. The only difference is the errors:
+#           a lane that divides by zero, accesses memory out of bounds or executes an undecodable word is stopped and
+#           its error is kept in 'faults', while the other lanes continue.
+#
+#           Requires numpy. The rest of the assembler doesn't.
+
+import numpy as np
+
+from . import opcodes as op
+from .simulator import AssemblySimulator
+
+MASK = 0xFF_FF_FF_FF
+
+
+class BatchSimulator:
+    """
+        * lanes - the number of machine states simulated in lockstep.
+        * ram_size - the number of RAM bytes of every lane.
+
+        * registers - (lanes x 32) uint32 array. Set the initial registers of every lane here before running.
+        * RAM       - (lanes x ram_size) uint8 array. RAM[i] is the memory of lane i. Words are big endian, as in memory.py.
+        * pc        - the byte address of the next instruction of every lane.
+        * instruction_count - the number of instructions each lane has executed.
+        * faults    - dict of lane -> error message, for the lanes that stopped because of an error.
+
+        * functions interface - simulate, load_program, run, lane_registers, lane_ram.
+    """
+    def __init__(self, lanes, ram_size=256):
+        self.lanes = lanes
+        self.ram_size = ram_size
+
+        self.registers = np.zeros((lanes, 32), dtype=np.uint32)
+        self.RAM = np.zeros((lanes, ram_size), dtype=np.uint8)
+
+        self.pc = np.zeros(lanes, dtype=np.int64)
+        self.instruction_count = np.zeros(lanes, dtype=np.int64)
+        self.halted = np.zeros(lanes, dtype=bool)
+        self.faults = {}
+
+        self.dispatch_table = self._build_dispatch_table()
+
+    def simulate(self, input_file_name='isa-encoder-output', max_instructions=None):
+        """
+            loads the bytecode file (or the bytecode itself, as a bytes-like object) and runs it on every lane.
+            Initial registers and RAM must be set before calling it.
+        """
+        if isinstance(input_file_name, (bytes, bytearray, memoryview)):
+            data = input_file_name
+        else:
+            with open(input_file_name, "rb") as f:
+                data = f.read()
+
+        self.load_program(data)
+        self.run(max_instructions)
+
+    def load_program(self, data):
+        """ predecodes the bytecode, using the same decoder as AssemblySimulator. Resets the PCs, but not registers and RAM. """
+        decoder = AssemblySimulator()
+        decoder.load_program(data)
+
+        self.program_size = decoder.program_size
+        self.decoded = []
+        for word, (handler, arg1, arg2, arg3) in zip(decoder.program_words, decoder.decoded):
+            if handler == decoder._op_invalid:
+                self.decoded.append((self._exec_invalid, arg1, arg2, arg3))
+            else:
+                self.decoded.append((self.dispatch_table[word >> 24], arg1, arg2, arg3))
+
+        self.pc[:] = 0
+        self.instruction_count[:] = 0
+        self.halted[:] = False
+        self.faults = {}
+
+    def run(self, max_instructions=None):
+        """ runs until every lane leaves the program, faults or executes max_instructions instructions. """
+        while True:
+            running = ~self.halted & (self.pc < self.program_size)
+            if max_instructions is not None:
+                running &= self.instruction_count < max_instructions
+
+            if not running.any():
+                break
+
+            # execute the smallest PC for every lane which is at it
+            cursor_byte = int(self.pc[running].min())
+            lanes = np.nonzero(running & (self.pc == cursor_byte))[0]
+
+            handler, arg1, arg2, arg3 = self.decoded[cursor_byte >> 2]
+            next_pc = handler(lanes, arg1, arg2, arg3, cursor_byte)
+
+            # the handlers may fault some lanes, they don't advance. Branches and jumps never fault.
+            lanes = lanes[~self.halted[lanes]]
+            self.pc[lanes] = cursor_byte + 4 if next_pc is None else next_pc
+            self.instruction_count[lanes] += 1
+
+    def lane_registers(self, lane):
+        """ the registers of the lane as a list of python ints, like AssemblySimulator.registers_file """
+        return [int(value) for value in self.registers[lane]]
+
+    def lane_ram(self, lane):
+        """ the RAM of the lane as bytes, like AssemblySimulator.RAM.snapshot() """
+        return self.RAM[lane].tobytes()
+
+    #
+    # UTILITY FUNCTIONS
+    #
+    def _read(self, lanes, reg):
+        """ the register values of the lanes, as uint64 so that intermediate results don't overflow """
+        return self.registers[lanes, reg].astype(np.uint64)
+
+    def _write(self, lanes, reg, values):
+        """ the vectorized _write_register. Keeps r0 constantly 0. """
+        if reg != 0:
+            self.registers[lanes, reg] = np.asarray(values, dtype=np.uint64) & MASK
+
+    def _fault(self, lanes, message):
+        self.halted[lanes] = True
+        for lane in lanes:
+            self.faults[int(lane)] = message
+
+    def _addresses(self, lanes, base, offset, width):
+        """
+            computes the (base register + offset) addresses and faults the lanes which access memory out of bounds.
+            Returns (lanes, addresses) of the lanes that remain.
+        """
+        addresses = (self._read(lanes, base) + np.uint64(offset)) & np.uint64(MASK)
+        out_of_bounds = addresses + np.uint64(width) > np.uint64(self.ram_size)
+        if out_of_bounds.any():
+            for lane, address in zip(lanes[out_of_bounds], addresses[out_of_bounds]):
+                self._fault([lane], f"Memory access out of bounds: {width} byte(s) at address {int(address)}. Memory size is {self.ram_size} bytes")
+            lanes = lanes[~out_of_bounds]
+            addresses = addresses[~out_of_bounds]
+        return lanes, addresses.astype(np.int64)
+
+    def _load(self, lanes, addresses, width):
+        """ big endian load of width bytes per lane """
+        values = np.zeros(len(lanes), dtype=np.uint64)
+        for i in range(width):
+            values = (values << np.uint64(8)) | self.RAM[lanes, addresses + i].astype(np.uint64)
+        return values
+
+    def _store(self, lanes, addresses, values, width):
+        """ big endian store of the lowest width bytes of the values """
+        values = np.asarray(values, dtype=np.uint64)
+        for i in range(width):
+            shift = np.uint64(8 * (width - 1 - i))
+            self.RAM[lanes, addresses + i] = ((values >> shift) & np.uint64(0xFF)).astype(np.uint8)
+
+    def _shift_left(self, values, amounts):
+        """ (values << amounts) & MASK, where amounts may be larger than 32 """
+        amounts = np.asarray(amounts, dtype=np.uint64)
+        return np.where(amounts >= 32, np.uint64(0), (values << np.minimum(amounts, np.uint64(32))) & np.uint64(MASK))
+
+    def _shift_right(self, values, amounts):
+        amounts = np.asarray(amounts, dtype=np.uint64)
+        return np.where(amounts >= 32, np.uint64(0), values >> np.minimum(amounts, np.uint64(32)))
+
+    def _sign_extend(self, value, input_bits, output_bits):
+        sign_bit = 1 << (input_bits - 1)
+        if value & sign_bit:
+            return (value | ((1 << output_bits) - (1 << input_bits))) & ((1 << output_bits) - 1)
+        return value
+
+    #
+    # OPCODE DISPATCH
+    # Same layout as in simulator.py. Every handler takes (lanes, arg1, arg2, arg3, cursor_byte) and returns the next PC:
+    # None for the next instruction, a number if every lane jumps to it, or an array with a PC per lane.
+    # Register values are never negative, so the abs() comparisons and arithmetic shifts of the scalar simulator
+    # are the same as the unsigned ones.
+    #
+    def _build_dispatch_table(self):
+        handlers = {
+            # DSS
+            op.Opcode.NOP:   self._exec_nop,
+            op.Opcode.ADD:   self._exec_add,
+            op.Opcode.MUL:   self._exec_mul,
+            op.Opcode.MULH:  self._exec_mulh,
+            op.Opcode.DIV:   self._exec_div,
+            op.Opcode.REM:   self._exec_rem,
+            op.Opcode.AND:   self._exec_and,
+            op.Opcode.OR:    self._exec_or,
+            op.Opcode.XOR:   self._exec_xor,
+            op.Opcode.NOT:   self._exec_not,
+            op.Opcode.SLL:   self._exec_sll,
+            op.Opcode.SRL:   self._exec_srl,
+            op.Opcode.SRA:   self._exec_srl,
+            op.Opcode.SLT:   self._exec_slt,
+            op.Opcode.SLTS:  self._exec_slt,
+            # DSI
+            op.Opcode.ADDI:  self._exec_addi,
+            op.Opcode.ANDI:  self._exec_andi,
+            op.Opcode.ORI:   self._exec_ori,
+            op.Opcode.XORI:  self._exec_xori,
+            op.Opcode.SLLI:  self._exec_slli,
+            op.Opcode.SRLI:  self._exec_srli,
+            op.Opcode.SRAI:  self._exec_srli,
+            op.Opcode.SLTI:  self._exec_slti,
+            op.Opcode.SLTSI: self._exec_sltsi,
+            op.Opcode.LB:    self._exec_lb,
+            op.Opcode.LH:    self._exec_lh,
+            op.Opcode.LW:    self._exec_lw,
+            op.Opcode.SB:    self._exec_sb,
+            op.Opcode.SH:    self._exec_sh,
+            op.Opcode.SW:    self._exec_sw,
+            op.Opcode.BEQ:   self._exec_beq,
+            op.Opcode.BNEQ:  self._exec_bneq,
+            op.Opcode.BLT:   self._exec_blt,
+            op.Opcode.BLE:   self._exec_ble,
+            op.Opcode.BLTS:  self._exec_blt,
+            op.Opcode.BLTES: self._exec_blt,
+            op.Opcode.JALR:  self._exec_jalr,
+            # DS
+            op.Opcode.SEQZ:  self._exec_seqz,
+            # DI
+            op.Opcode.JAL:   self._exec_jal,
+            op.Opcode.LUI:   self._exec_lui,
+            op.Opcode.LLI:   self._exec_lli,
+            # I
+            op.Opcode.J:     self._exec_j,
+        }
+
+        table = [None] * 256
+        for opcode, handler in handlers.items():
+            table[opcode] = handler
+        return table
+
+    # DSS
+    def _exec_nop(self, lanes, reg1, reg2, reg3, cursor_byte):
+        return None
+
+    def _exec_add(self, lanes, reg1, reg2, reg3, cursor_byte):
+        self._write(lanes, reg1, self._read(lanes, reg2) + self._read(lanes, reg3))
+
+    def _exec_mul(self, lanes, reg1, reg2, reg3, cursor_byte):
+        self._write(lanes, reg1, (self._read(lanes, reg2) * self._read(lanes, reg3)) & np.uint64(0x0000_FFFF))
+
+    def _exec_mulh(self, lanes, reg1, reg2, reg3, cursor_byte):
+        result = self._read(lanes, reg2) * self._read(lanes, reg3)
+        self._write(lanes, reg1, (result << np.uint64(16)) & np.uint64(0xFFFF_0000))
+
+    def _exec_div(self, lanes, reg1, reg2, reg3, cursor_byte):
+        lanes = self._nonzero_divisor(lanes, reg1, reg2, reg3, "Divison by zero at div instruction DIV")
+        self._write(lanes, reg1, self._read(lanes, reg2) // self._read(lanes, reg3))
+
+    def _exec_rem(self, lanes, reg1, reg2, reg3, cursor_byte):
+        lanes = self._nonzero_divisor(lanes, reg1, reg2, reg3, "integer modulo by zero at rem instruction REM")
+        self._write(lanes, reg1, self._read(lanes, reg2) % self._read(lanes, reg3))
+
+    def _nonzero_divisor(self, lanes, reg1, reg2, reg3, message):
+        """ faults the lanes which divide by zero, returns the rest """
+        zero = self.registers[lanes, reg3] == 0
+        if zero.any():
+            self._fault(lanes[zero], f"{message} r{reg1}, r{reg2}, r{reg3}")
+            lanes = lanes[~zero]
+        return lanes
+
+    def _exec_and(self, lanes, reg1, reg2, reg3, cursor_byte):
+        self._write(lanes, reg1, self._read(lanes, reg2) & self._read(lanes, reg3))
+
+    def _exec_or(self, lanes, reg1, reg2, reg3, cursor_byte):
+        self._write(lanes, reg1, self._read(lanes, reg2) | self._read(lanes, reg3))
+
+    def _exec_xor(self, lanes, reg1, reg2, reg3, cursor_byte):
+        self._write(lanes, reg1, self._read(lanes, reg2) ^ self._read(lanes, reg3))
+
+    def _exec_not(self, lanes, reg1, reg2, reg3, cursor_byte):
+        self._write(lanes, reg1, ~self._read(lanes, reg2))
+
+    def _exec_sll(self, lanes, reg1, reg2, reg3, cursor_byte):
+        self._write(lanes, reg1, self._shift_left(self._read(lanes, reg2), self._read(lanes, reg3)))
+
+    def _exec_srl(self, lanes, reg1, reg2, reg3, cursor_byte):
+        self._write(lanes, reg1, self._shift_right(self._read(lanes, reg2), self._read(lanes, reg3)))
+
+    def _exec_slt(self, lanes, reg1, reg2, reg3, cursor_byte):
+        self._write(lanes, reg1, self._read(lanes, reg2) < self._read(lanes, reg3))
+
+    # DSI
+    def _exec_addi(self, lanes, reg1, reg2, imm, cursor_byte):
+        self._write(lanes, reg1, self._read(lanes, reg2) + np.uint64(self._sign_extend(imm, 8, 32)))
+
+    def _exec_andi(self, lanes, reg1, reg2, imm, cursor_byte):
+        self._write(lanes, reg1, self._read(lanes, reg2) & np.uint64(imm))
+
+    def _exec_ori(self, lanes, reg1, reg2, imm, cursor_byte):
+        self._write(lanes, reg1, self._read(lanes, reg2) | np.uint64(imm))
+
+    def _exec_xori(self, lanes, reg1, reg2, imm, cursor_byte):
+        self._write(lanes, reg1, self._read(lanes, reg2) ^ np.uint64(imm))
+
+    def _exec_slli(self, lanes, reg1, reg2, imm, cursor_byte):
+        self._write(lanes, reg1, self._shift_left(self._read(lanes, reg2), imm))
+
+    def _exec_srli(self, lanes, reg1, reg2, imm, cursor_byte):
+        self._write(lanes, reg1, self._shift_right(self._read(lanes, reg2), imm))
+
+    def _exec_slti(self, lanes, reg1, reg2, imm, cursor_byte):
+        self._write(lanes, reg1, self._read(lanes, reg2) < np.uint64(imm))
+
+    def _exec_sltsi(self, lanes, reg1, reg2, imm, cursor_byte):
+        self._write(lanes, reg1, self._read(lanes, reg2) < np.uint64(self._sign_extend(imm, 8, 32)))
+
+    # LOADING. Byte offsets are unsigned, half-word and word offsets are signed, as in simulator.py
+    def _exec_lb(self, lanes, reg1, reg2, imm, cursor_byte):
+        lanes, addresses = self._addresses(lanes, reg2, imm, 1)
+        self._write(lanes, reg1, self._load(lanes, addresses, 1))
+
+    def _exec_lh(self, lanes, reg1, reg2, imm, cursor_byte):
+        lanes, addresses = self._addresses(lanes, reg2, self._sign_extend(imm, 8, 32), 2)
+        self._write(lanes, reg1, self._load(lanes, addresses, 2))
+
+    def _exec_lw(self, lanes, reg1, reg2, imm, cursor_byte):
+        lanes, addresses = self._addresses(lanes, reg2, self._sign_extend(imm, 8, 32), 4)
+        self._write(lanes, reg1, self._load(lanes, addresses, 4))
+
+    # SAVING
+    def _exec_sb(self, lanes, reg1, reg2, imm, cursor_byte):
+        lanes, addresses = self._addresses(lanes, reg1, imm, 1)
+        self._store(lanes, addresses, self._read(lanes, reg2), 1)
+
+    def _exec_sh(self, lanes, reg1, reg2, imm, cursor_byte):
+        lanes, addresses = self._addresses(lanes, reg1, self._sign_extend(imm, 8, 32), 2)
+        self._store(lanes, addresses, self._read(lanes, reg2), 2)
+
+    def _exec_sw(self, lanes, reg1, reg2, imm, cursor_byte):
+        lanes, addresses = self._addresses(lanes, reg1, self._sign_extend(imm, 8, 32), 4)
+        self._store(lanes, addresses, self._read(lanes, reg2), 4)
+
+    # BRANCHING. The immediate is the label address
+    def _exec_beq(self, lanes, reg1, reg2, imm, cursor_byte):
+        return np.where(self.registers[lanes, reg1] == self.registers[lanes, reg2], imm, cursor_byte + 4)
+
+    def _exec_bneq(self, lanes, reg1, reg2, imm, cursor_byte):
+        return np.where(self.registers[lanes, reg1] != self.registers[lanes, reg2], imm, cursor_byte + 4)
+
+    def _exec_blt(self, lanes, reg1, reg2, imm, cursor_byte):
+        return np.where(self.registers[lanes, reg1] < self.registers[lanes, reg2], imm, cursor_byte + 4)
+
+    def _exec_ble(self, lanes, reg1, reg2, imm, cursor_byte):
+        return np.where(self.registers[lanes, reg1] <= self.registers[lanes, reg2], imm, cursor_byte + 4)
+
+    # jump. The source is read before the return address is written, in case they're the same register
+    def _exec_jalr(self, lanes, reg1, reg2, imm, cursor_byte):
+        targets = self.registers[lanes, reg2].astype(np.int64) + imm + 4
+        self._write(lanes, reg1, cursor_byte)
+        return targets
+
+    # DS
+    def _exec_seqz(self, lanes, reg1, reg2, _unused, cursor_byte):
+        self._write(lanes, reg1, self.registers[lanes, reg2] == 0)
+
+    # DI
+    def _exec_jal(self, lanes, reg, imm, _unused, cursor_byte):
+        self._write(lanes, reg, cursor_byte)
+        return imm
+
+    def _exec_lui(self, lanes, reg, imm, _unused, cursor_byte):
+        self._write(lanes, reg, (self._read(lanes, reg) & np.uint64(0x0000_FFFF)) | np.uint64(imm << 16))
+
+    def _exec_lli(self, lanes, reg, imm, _unused, cursor_byte):
+        self._write(lanes, reg, (self._read(lanes, reg) & np.uint64(0xFFFF_0000)) | np.uint64(imm))
+
+    # I
+    def _exec_j(self, lanes, imm, _unused1, _unused2, cursor_byte):
+        return imm
+
+    def _exec_invalid(self, lanes, message, _unused1, _unused2, cursor_byte):
+        self._fault(lanes, message)
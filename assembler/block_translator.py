@@ -0,0 +1,266 @@
+#########################################################
+#   Basic block translator. Created on 18/10/26
+#   Intent: The second execution engine of the simulator. Instead of calling a handler per instruction,
+#           the program is split into basic blocks and every block is translated once into python source,
+#           compiled with compile() and cached. Running a block is a single function call.
+#
+#           A block starts at the program start, at a branch/jump target or after a branch/jump, and ends with
+#           a branch/jump (BEQ..BLTES, JALR, JAL, J) or right before the next block start. Targets of JALR are known
+#           only at run time, so blocks are translated lazily, the first time the execution reaches their start.
+#
+#           The generated code must behave exactly as the interpreter's handlers in simulator.py. When an instruction
+#           is rare or has a complicated error path (e.g. DIV), the generated code just calls the interpreter's handler.
+
+from . import opcodes as op
+
+MASK = 0xFF_FF_FF_FF
+
+# instructions which end a basic block
+BRANCHES = {op.Opcode.BEQ, op.Opcode.BNEQ, op.Opcode.BLT, op.Opcode.BLE, op.Opcode.BLTS, op.Opcode.BLTES}
+JUMPS = {op.Opcode.JALR, op.Opcode.JAL, op.Opcode.J}
+
+# conditions of the branches, given the source expressions of the two registers
+BRANCH_CONDITIONS = {
+    op.Opcode.BEQ:   "{0} == {1}",
+    op.Opcode.BNEQ:  "{0} != {1}",
+    op.Opcode.BLT:   "abs({0}) < abs({1})",
+    op.Opcode.BLE:   "abs({0}) <= abs({1})",
+    op.Opcode.BLTS:  "{0} < {1}",
+    op.Opcode.BLTES: "{0} < {1}",
+}
+
+# DSS expressions, given the source expressions of the two source registers. Results are masked afterwards.
+DSS_EXPRESSIONS = {
+    op.Opcode.ADD:  "{0} + {1}",
+    op.Opcode.MUL:  "({0} * {1}) & 0x0000_FFFF",
+    op.Opcode.MULH: "(({0} * {1}) << 16) & 0xFFFF_0000",
+    op.Opcode.REM:  "{0} % {1}",
+    op.Opcode.AND:  "{0} & {1}",
+    op.Opcode.OR:   "{0} | {1}",
+    op.Opcode.XOR:  "{0} ^ {1}",
+    op.Opcode.NOT:  "~{0}",
+    op.Opcode.SLL:  "{0} << {1}",
+    op.Opcode.SRL:  "{0} >> {1}",
+    op.Opcode.SRA:  "({0} >> {1} if {0} >= 0 else -((-{0}) >> {1}))",
+    op.Opcode.SLT:  "int(abs({0}) < abs({1}))",
+    op.Opcode.SLTS: "int({0} < {1})",
+}
+
+# DSI expressions, given the source register expression and the immediate.
+# The immediate is already sign extended for the opcodes listed in SIGNED_IMMEDIATES.
+DSI_EXPRESSIONS = {
+    op.Opcode.ADDI:  "{0} + {1}",
+    op.Opcode.ANDI:  "{0} & {1}",
+    op.Opcode.ORI:   "{0} | {1}",
+    op.Opcode.XORI:  "{0} ^ {1}",
+    op.Opcode.SLLI:  "{0} << {1}",
+    op.Opcode.SRLI:  "{0} >> {1}",
+    op.Opcode.SRAI:  "({0} >> {1} if {0} >= 0 else -((-{0}) >> {1}))",
+    op.Opcode.SLTI:  "int(abs({0}) < abs({1}))",
+    op.Opcode.SLTSI: "int({0} < {1})",
+}
+
+# loads and stores, given the ram method name
+LOADS = {op.Opcode.LB: "read_byte", op.Opcode.LH: "read_half", op.Opcode.LW: "read_word"}
+STORES = {op.Opcode.SB: "write_byte", op.Opcode.SH: "write_half", op.Opcode.SW: "write_word"}
+
+SIGNED_IMMEDIATES = {op.Opcode.ADDI, op.Opcode.SLTSI, op.Opcode.LH, op.Opcode.LW, op.Opcode.SH, op.Opcode.SW}
+
+
+class BlockTranslator:
+    """
+        * simulator - the AssemblySimulator with a loaded program. Its predecoded table is used for translation,
+        \t and its handlers are called for the instructions that aren't translated inline.
+
+        * functions interface - run, block_at, invalidate.
+        \t run       - runs the program from the byte address until it reaches the end. Returns the final address.
+        \t block_at  - returns the compiled block starting at the byte address, translating it on the first call.
+        \t invalidate - drops the cached blocks which contain the byte address. Called when code gets overwritten.
+    """
+    def __init__(self, simulator):
+        self.simulator = simulator
+
+        self.blocks = {}  # start address -> (compiled function, end address, number of instructions)
+        self.leaders = self._find_leaders()
+
+    def run(self, cursor_byte=0, end_address=None, checkpoint_every=None, max_instructions=None):
+        """
+            runs the blocks starting at cursor_byte, until the address reaches end_address (by default the end of the program).
+            If checkpoint_every is given, a checkpoint is taken after the first block that reaches that many more instructions.
+            If max_instructions is given, stops after exactly that many instructions. The block that would cross
+            the budget runs instruction by instruction with the predecoded handlers.
+        """
+        if end_address is None:
+            end_address = self.simulator.program_size
+
+        blocks = self.blocks
+        registers = self.simulator.registers_file
+        ram = self.simulator.RAM
+        count = self.simulator.instruction_count
+        next_checkpoint = count + checkpoint_every if checkpoint_every else float('inf')
+        stop_count = count + max_instructions if max_instructions is not None else float('inf')
+        try:
+            while cursor_byte < end_address:
+                block = blocks.get(cursor_byte)
+                if block is None:
+                    block = self.block_at(cursor_byte)
+                if count + block[2] > stop_count:
+                    break
+                cursor_byte = block[0](registers, ram)
+                count += block[2]
+
+                if count >= next_checkpoint:
+                    self.simulator._auto_checkpoint(cursor_byte, count)
+                    next_checkpoint = count + checkpoint_every
+
+            decoded = self.simulator.decoded
+            while cursor_byte < end_address and count < stop_count:
+                handler, arg1, arg2, arg3 = decoded[cursor_byte >> 2]
+                cursor_byte = handler(arg1, arg2, arg3, cursor_byte) + 4
+                count += 1
+        finally:
+            # if a block raises, the simulator's PC is the start of that block and its instructions are not counted
+            self.simulator.pc = cursor_byte
+            self.simulator.instruction_count = count
+
+        return cursor_byte
+
+    def block_at(self, cursor_byte):
+        if cursor_byte not in self.blocks:
+            self.blocks[cursor_byte] = self._translate(cursor_byte)
+        return self.blocks[cursor_byte]
+
+    def invalidate(self, address):
+        self.leaders = self._find_leaders()
+        for start, (_, end, _) in list(self.blocks.items()):
+            if start <= address < end:
+                del self.blocks[start]
+
+    #
+    # TRANSLATION
+    #
+    def _find_leaders(self):
+        """ returns the set of byte addresses which start a basic block: static branch/jump targets and addresses after them. """
+        leaders = {0}
+
+        for index, word in enumerate(self.simulator.program_words):
+            opcode = word >> 24
+            if opcode in BRANCHES:
+                leaders.add(word & 0xFF)
+            elif opcode == op.Opcode.JAL:
+                leaders.add(word & 0xFF_FF)
+            elif opcode == op.Opcode.J:
+                leaders.add(word & 0xFF_FF_FF)
+
+            if opcode in BRANCHES or opcode in JUMPS:
+                leaders.add(index * 4 + 4)
+        return leaders
+
+    def _translate(self, start):
+        """ generates the python source of the block at the start address and compiles it. Returns (function, end address, number of instructions). """
+        namespace = {}
+        lines = [f"def block_{start}(R, ram):"]
+
+        cursor_byte = start
+        terminated = False
+        while cursor_byte < self.simulator.program_size:
+            word = self.simulator.program_words[cursor_byte >> 2]
+            lines.append(f"    # {cursor_byte}: {self.simulator.opcode_names.get(word >> 24, bin(word >> 24))} {(word >> 16) & 0xFF} {(word >> 8) & 0xFF} {word & 0xFF}")
+
+            terminated = self._translate_instruction(cursor_byte, lines, namespace)
+            cursor_byte += 4
+
+            if terminated or cursor_byte in self.leaders:
+                break
+
+        # the block falls through into the next one
+        if not terminated:
+            lines.append(f"    return {cursor_byte}")
+
+        source = "\n".join(lines) + "\n"
+        code = compile(source, f"<block {start}>", "exec")
+        exec(code, namespace)
+
+        return (namespace[f"block_{start}"], cursor_byte, (cursor_byte - start) // 4)
+
+    def _translate_instruction(self, cursor_byte, lines, namespace):
+        """
+            appends the source lines of the instruction at cursor_byte. Returns True if the instruction ends the block,
+            in which case the lines already return the next address.
+        """
+        handler, arg1, arg2, arg3 = self.simulator.decoded[cursor_byte >> 2]
+        opcode = self.simulator.program_words[cursor_byte >> 2] >> 24
+
+        # words that couldn't be decoded raise only when executed, through their handler
+        if handler == self.simulator._op_invalid:
+            opcode = None
+
+        # DSS
+        if opcode in DSS_EXPRESSIONS:
+            self._write(lines, arg1, DSS_EXPRESSIONS[opcode].format(f"R[{arg2}]", f"R[{arg3}]"))
+
+        elif opcode == op.Opcode.NOP:
+            pass
+
+        # DSI
+        elif opcode in DSI_EXPRESSIONS:
+            self._write(lines, arg1, DSI_EXPRESSIONS[opcode].format(f"R[{arg2}]", self._immediate(opcode, arg3)))
+
+        elif opcode in LOADS:
+            self._write(lines, arg1, f"ram.{LOADS[opcode]}((R[{arg2}] + {self._immediate(opcode, arg3)}) & {MASK})")
+
+        elif opcode in STORES:
+            lines.append(f"    ram.{STORES[opcode]}((R[{arg1}] + {self._immediate(opcode, arg3)}) & {MASK}, R[{arg2}])")
+
+        elif opcode in BRANCHES:
+            condition = BRANCH_CONDITIONS[opcode].format(f"R[{arg1}]", f"R[{arg2}]")
+            lines.append(f"    return {arg3} if {condition} else {cursor_byte + 4}")
+            return True
+
+        # the source is read before the return address is written, in case they're the same register
+        elif opcode == op.Opcode.JALR:
+            lines.append(f"    target = R[{arg2}] + {arg3}")
+            self._write(lines, arg1, f"{cursor_byte}")
+            lines.append(f"    return target + 4")
+            return True
+
+        # DS
+        elif opcode == op.Opcode.SEQZ:
+            self._write(lines, arg1, f"int(R[{arg2}] == 0)")
+
+        # DI
+        elif opcode == op.Opcode.JAL:
+            self._write(lines, arg1, f"{cursor_byte}")
+            lines.append(f"    return {arg2}")
+            return True
+
+        elif opcode == op.Opcode.LUI:
+            self._write(lines, arg1, f"(R[{arg1}] & 0x0000_FFFF) | {arg2 << 16}")
+
+        elif opcode == op.Opcode.LLI:
+            self._write(lines, arg1, f"(R[{arg1}] & 0xFFFF_0000) | {arg2}")
+
+        # I
+        elif opcode == op.Opcode.J:
+            lines.append(f"    return {arg1}")
+            return True
+
+        # everything else (DIV, undecodable words) calls the interpreter's handler
+        else:
+            name = f"handler_{cursor_byte}"
+            namespace[name] = handler
+            lines.append(f"    {name}({repr(arg1)}, {repr(arg2)}, {repr(arg3)}, {cursor_byte})")
+
+        return False
+
+    def _write(self, lines, reg, expression):
+        """ the translation of _write_register. Writes into r0 are dropped, but the expression is still evaluated, as it may raise. """
+        if reg == 0:
+            lines.append(f"    {expression}")
+        else:
+            lines.append(f"    R[{reg}] = ({expression}) & {MASK}")
+
+    def _immediate(self, opcode, imm):
+        if opcode in SIGNED_IMMEDIATES:
+            return self.simulator._sign_extend(imm, 8, 32)
+        return imm
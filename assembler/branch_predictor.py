@@ -0,0 +1,179 @@
+#########################################################
+#   Branch predictor file. Created on 18/10/26
+#   Intent: Models branch predictors alongside the simulation, to choose what to build in hardware and to find the branches
+#           the compiler should lay out differently. Only the conditional branches (BEQ, BNEQ, BLT, BLE, BLTS, BLTES) are
+#           predicted, the jumps always redirect.
+#
+#           Every predictor has the same interface: predict(pc, target) -> bool and update(pc, target, taken).
+#               StaticNotTaken - always not taken.
+#               BackwardTaken  - backward branches (loops) taken, forward branches not taken.
+#               OneBit         - table of the last outcome per branch, indexed by the PC.
+#               TwoBit         - table of 2 bit saturating counters (bimodal).
+#               GShare         - 2 bit counters indexed by the PC xor the global history of the last outcomes.
+#
+#           BranchPredictorModel is a simulator observer (look at AssemblySimulator.simulate) running several predictors
+#           on the same branches. Its report lists the accuracy of every predictor and the misprediction rate of every branch.
+#           To use a predictor in the pipeline timing, pass a separate instance to TimingModel(predictor=...).
+#
+#           Usage: python -m assembler.branch_predictor program.asm [--entries 1024] [--history 8]
+
+import argparse
+from collections import defaultdict
+
+from . import opcodes as op
+from .profiler import Symbols
+from .simulator import AssemblySimulator
+
+BRANCHES = {op.Opcode.BEQ, op.Opcode.BNEQ, op.Opcode.BLT, op.Opcode.BLE, op.Opcode.BLTS, op.Opcode.BLTES}
+
+
+def branch_target(word):
+    """ branches jump to the absolute byte address in the immediate """
+    return word & 0xFF
+
+
+def check_entries(entries):
+    if entries <= 0 or entries & (entries - 1):
+        raise RuntimeError(f"Predictor table size must be a power of 2, got {entries}")
+
+
+class StaticNotTaken:
+    name = 'not-taken'
+
+    def predict(self, pc, target):
+        return False
+
+    def update(self, pc, target, taken):
+        pass
+
+
+class BackwardTaken:
+    name = 'backward-taken'
+
+    def predict(self, pc, target):
+        return target <= pc
+
+    def update(self, pc, target, taken):
+        pass
+
+
+class OneBit:
+    """ entries - size of the table (power of 2), indexed by the lowest bits of the instruction index """
+    def __init__(self, entries=1024):
+        check_entries(entries)
+        self.name = f'1-bit/{entries}'
+        self.mask = entries - 1
+        self.table = [False] * entries
+
+    def predict(self, pc, target):
+        return self.table[(pc >> 2) & self.mask]
+
+    def update(self, pc, target, taken):
+        self.table[(pc >> 2) & self.mask] = taken
+
+
+class TwoBit:
+    """ entries - size of the table of 2 bit counters (0, 1 predict not taken, 2, 3 taken). They start weakly not taken. """
+    def __init__(self, entries=1024):
+        check_entries(entries)
+        self.name = f'2-bit/{entries}'
+        self.mask = entries - 1
+        self.table = [1] * entries
+
+    def _index(self, pc):
+        return (pc >> 2) & self.mask
+
+    def predict(self, pc, target):
+        return self.table[self._index(pc)] >= 2
+
+    def update(self, pc, target, taken):
+        index = self._index(pc)
+        counter = self.table[index]
+        self.table[index] = min(counter + 1, 3) if taken else max(counter - 1, 0)
+
+
+class GShare(TwoBit):
+    """ history_bits - number of the last branch outcomes xor-ed into the table index """
+    def __init__(self, entries=1024, history_bits=8):
+        super().__init__(entries)
+        self.name = f'gshare/{entries}/h{history_bits}'
+        self.history_mask = (1 << history_bits) - 1
+        self.history = 0
+
+    def _index(self, pc):
+        return ((pc >> 2) ^ self.history) & self.mask
+
+    def update(self, pc, target, taken):
+        super().update(pc, target, taken)
+        self.history = ((self.history << 1) | taken) & self.history_mask
+
+
+def default_predictors(entries=1024, history_bits=8):
+    return [StaticNotTaken(), BackwardTaken(), OneBit(entries), TwoBit(entries), GShare(entries, history_bits)]
+
+
+class BranchPredictorModel:
+    """
+        * predictors - list of predictor instances, default_predictors() by default.
+        * labels     - label name -> byte address, used to symbolize the branches in the report.
+
+        * functions interface - on_step, accuracy, report.
+    """
+    def __init__(self, predictors=None, labels=None):
+        self.predictors = default_predictors() if predictors is None else list(predictors)
+        self.symbols = Symbols(labels)
+
+        self.executions = defaultdict(int) # branch pc -> number of executions
+        self.taken = defaultdict(int)      # branch pc -> number of taken executions
+        self.mispredictions = [defaultdict(int) for _ in self.predictors] # per predictor: branch pc -> mispredictions
+
+    def set_labels(self, labels):
+        self.symbols = Symbols(labels)
+
+    def on_step(self, simulator, cursor_byte, word, next_cursor_byte):
+        if word >> 24 not in BRANCHES:
+            return
+
+        target = branch_target(word)
+        taken = simulator.branch_taken(word)
+        self.executions[cursor_byte] += 1
+        self.taken[cursor_byte] += taken
+
+        for predictor, mispredictions in zip(self.predictors, self.mispredictions):
+            if predictor.predict(cursor_byte, target) != taken:
+                mispredictions[cursor_byte] += 1
+            predictor.update(cursor_byte, target, taken)
+
+    def accuracy(self, index):
+        """ the ratio of correct predictions of the index-th predictor """
+        total = sum(self.executions.values())
+        return 1 - sum(self.mispredictions[index].values()) / total if total else 1.0
+
+    def report(self, top=20):
+        total = sum(self.executions.values())
+        lines = [f"Branch prediction: {total} branches executed, {len(self.executions)} distinct branches"]
+
+        for index, predictor in enumerate(self.predictors):
+            lines.append(f"  {predictor.name:<20} accuracy {100 * self.accuracy(index):6.2f}%, "
+                         f"{sum(self.mispredictions[index].values())} mispredictions")
+
+        lines.append("\nMisprediction rate per branch (most executed first):")
+        lines.append(f"  {'pc':<6} {'label':<20} {'executed':>10} {'taken':>8}  " + ' '.join(f"{p.name:>18}" for p in self.predictors))
+        for pc, executions in sorted(self.executions.items(), key=lambda item: (-item[1], item[0]))[:top]:
+            rates = ' '.join(f"{100 * mispredictions[pc] / executions:>17.2f}%" for mispredictions in self.mispredictions)
+            lines.append(f"  {pc:#06x} {self.symbols.symbolize(pc):<20} {executions:>10} {100 * self.taken[pc] / executions:>7.2f}%  {rates}")
+
+        return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assemble and simulate a program, comparing branch predictors")
+    parser.add_argument('program')
+    parser.add_argument('--entries', type=int, default=1024, help="size of the prediction tables (power of 2)")
+    parser.add_argument('--history', type=int, default=8, help="global history bits of gshare")
+    parser.add_argument('--top', type=int, default=20, help="number of listed branches")
+    args = parser.parse_args()
+
+    model = BranchPredictorModel(default_predictors(args.entries, args.history))
+    model.set_labels(AssemblySimulator().simulate_assembly(args.program, observers=[model]))
+    print(model.report(args.top))
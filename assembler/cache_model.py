@@ -0,0 +1,212 @@
+#########################################################
+#   Cache model file. Created on 18/10/26
+#   Intent: Models the instruction and data caches of the next CPU revision, to size them.
+#           Cache is a single set-associative cache: size, line size, associativity, LRU or FIFO replacement,
+#           write-back (write allocate) or write-through (no write allocate).
+#           CacheModel is a simulator observer (look at AssemblySimulator.simulate), which drives an I-cache with every
+#           instruction fetch and a D-cache with every LB/LH/LW/SB/SH/SW access. Either cache can be left out.
+#           Like every observer it's only called when it's passed to simulate, so uncached runs pay nothing.
+#
+#           The report lists hit/miss rates, the most missed addresses (code addresses by label) and the cycles lost
+#           to misses, write-backs and write-throughs. Pass the model to TimingModel(caches=...) to add those cycles
+#           to the pipeline timing.
+#
+#           Usage: python -m assembler.cache_model program.asm [--icache 1024:16:2] [--dcache 1024:16:2:lru:write-back]
+
+import argparse
+from collections import OrderedDict, defaultdict
+
+from .profiler import Symbols
+from .simulator import AssemblySimulator
+from .timing_model import TimingModel
+
+REPLACEMENTS = ('lru', 'fifo')
+WRITE_POLICIES = ('write-back', 'write-through')
+
+
+class Cache:
+    """
+        * size          - capacity in bytes.
+        * line_size     - bytes per line (power of 2).
+        * associativity - lines per set. size / line_size gives a fully associative cache.
+        * replacement   - 'lru' or 'fifo'.
+        * write_policy  - 'write-back' (writes allocate lines and mark them dirty, dirty lines are written back when evicted)
+                          or 'write-through' (every write goes to memory, write misses don't allocate).
+        * miss_penalty, writeback_penalty, write_through_penalty - cycles lost to every miss, write-back and write-through.
+
+        * functions interface - access, miss_rate, cycles_lost, report.
+    """
+    def __init__(self, size=1024, line_size=16, associativity=2, replacement='lru', write_policy='write-back',
+                 miss_penalty=10, writeback_penalty=10, write_through_penalty=1, name='cache'):
+        if line_size <= 0 or line_size & (line_size - 1):
+            raise RuntimeError(f"Cache line size must be a power of 2, got {line_size}")
+        if associativity <= 0 or size % (line_size * associativity):
+            raise RuntimeError(f"Cache size {size} must be a multiple of line size {line_size} times associativity {associativity}")
+        if replacement not in REPLACEMENTS:
+            raise RuntimeError(f"Unknown replacement policy {repr(replacement)}. Use one of {REPLACEMENTS}")
+        if write_policy not in WRITE_POLICIES:
+            raise RuntimeError(f"Unknown write policy {repr(write_policy)}. Use one of {WRITE_POLICIES}")
+
+        self.name = name
+        self.size = size
+        self.line_size = line_size
+        self.associativity = associativity
+        self.replacement = replacement
+        self.write_policy = write_policy
+        self.miss_penalty = miss_penalty
+        self.writeback_penalty = writeback_penalty
+        self.write_through_penalty = write_through_penalty
+
+        self.line_shift = line_size.bit_length() - 1
+        self.set_count = size // (line_size * associativity)
+        # every set maps tag -> dirty flag, ordered from the first line to evict
+        self.sets = [OrderedDict() for _ in range(self.set_count)]
+
+        self.reads = self.writes = 0
+        self.hits = self.misses = 0
+        self.writebacks = self.write_throughs = 0
+        self.miss_addresses = defaultdict(int) # address of the missed access -> number of misses
+        self.lost = 0                          # total cycles lost
+
+    def access(self, address, is_write=False):
+        """ accesses the line of the address. Returns the cycles lost by the access. """
+        line = address >> self.line_shift
+        cache_set = self.sets[line % self.set_count]
+        tag = line // self.set_count
+        write_back = self.write_policy == 'write-back'
+        lost = 0
+
+        if is_write:
+            self.writes += 1
+            if not write_back:
+                self.write_throughs += 1
+                lost += self.write_through_penalty
+        else:
+            self.reads += 1
+
+        if tag in cache_set:
+            self.hits += 1
+            if self.replacement == 'lru':
+                cache_set.move_to_end(tag)
+            if is_write and write_back:
+                cache_set[tag] = True
+            self.lost += lost
+            return lost
+
+        self.misses += 1
+        self.miss_addresses[address] += 1
+
+        # write-through caches don't allocate on write misses, the write-through is the only cost
+        if is_write and not write_back:
+            self.lost += lost
+            return lost
+        lost += self.miss_penalty
+
+        if len(cache_set) >= self.associativity:
+            _, dirty = cache_set.popitem(last=False)
+            if dirty:
+                self.writebacks += 1
+                lost += self.writeback_penalty
+        cache_set[tag] = is_write and write_back
+        self.lost += lost
+        return lost
+
+    def accesses(self):
+        return self.hits + self.misses
+
+    def miss_rate(self):
+        return self.misses / self.accesses() if self.accesses() else 0.0
+
+    def cycles_lost(self):
+        return self.lost
+
+    def report(self, top=10, symbolize=None):
+        lines = [f"{self.name}: {self.size} bytes, {self.line_size} byte lines, {self.associativity}-way, "
+                 f"{self.replacement}, {self.write_policy}",
+                 f"  {self.accesses()} accesses ({self.reads} reads, {self.writes} writes), "
+                 f"{self.hits} hits, {self.misses} misses, miss rate {100 * self.miss_rate():.2f}%",
+                 f"  {self.writebacks} write-backs, {self.write_throughs} write-throughs, {self.cycles_lost()} cycles lost"]
+
+        if self.miss_addresses:
+            lines.append("  Most missed addresses:")
+            for address, count in sorted(self.miss_addresses.items(), key=lambda item: (-item[1], item[0]))[:top]:
+                lines.append(f"    {count:>10}  {symbolize(address) if symbolize is not None else f'{address:#06x}'}")
+        return '\n'.join(lines)
+
+
+class CacheModel:
+    """
+        * icache - Cache of the instruction fetches, or None.
+        * dcache - Cache of the loads and stores, or None.
+        * labels - label name -> byte address, used to symbolize the missed instruction addresses.
+
+        * functions interface - before_step, cycles_lost, report.
+        \t last_cycles_lost - the cycles lost by the last instruction, read by TimingModel.
+    """
+    def __init__(self, icache=None, dcache=None, labels=None):
+        self.icache = icache
+        self.dcache = dcache
+        self.symbols = Symbols(labels)
+        self.last_cycles_lost = 0
+
+    def set_labels(self, labels):
+        self.symbols = Symbols(labels)
+
+    def before_step(self, simulator, cursor_byte, word):
+        lost = 0
+        if self.icache is not None:
+            lost += self.icache.access(cursor_byte)
+
+        if self.dcache is not None:
+            access = simulator.memory_access(word)
+            if access is not None:
+                address, width, is_store = access
+                lost += self.dcache.access(address, is_store)
+                # unaligned accesses may touch the next line as well
+                last = address + width - 1
+                if last >> self.dcache.line_shift != address >> self.dcache.line_shift:
+                    lost += self.dcache.access(last, is_store)
+
+        self.last_cycles_lost = lost
+
+    def cycles_lost(self):
+        return sum(cache.cycles_lost() for cache in (self.icache, self.dcache) if cache is not None)
+
+    def report(self, top=10):
+        lines = []
+        if self.icache is not None:
+            lines.append(self.icache.report(top, self.symbols.symbolize))
+        if self.dcache is not None:
+            lines.append(self.dcache.report(top))
+        lines.append(f"Total cycles lost to caches: {self.cycles_lost()}")
+        return '\n\n'.join(lines)
+
+
+def parse_cache(text, name):
+    """ parses 'size:line_size:associativity[:replacement[:write_policy]]' into a Cache """
+    parts = text.split(':')
+    if not 3 <= len(parts) <= 5:
+        raise argparse.ArgumentTypeError(f"Invalid cache {repr(text)}, expected size:line_size:associativity[:replacement[:write_policy]]")
+
+    size, line_size, associativity = (int(part, 0) for part in parts[:3])
+    return Cache(size, line_size, associativity, *parts[3:], name=name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assemble and simulate a program through I-cache and D-cache models")
+    parser.add_argument('program')
+    parser.add_argument('--icache', default='1024:16:2', help="size:line_size:associativity[:lru|fifo[:write-back|write-through]]")
+    parser.add_argument('--dcache', default='1024:16:2', help="same as --icache")
+    parser.add_argument('--no-icache', action='store_true')
+    parser.add_argument('--no-dcache', action='store_true')
+    parser.add_argument('--top', type=int, default=10, help="number of listed miss addresses")
+    args = parser.parse_args()
+
+    model = CacheModel(None if args.no_icache else parse_cache(args.icache, 'I-cache'),
+                       None if args.no_dcache else parse_cache(args.dcache, 'D-cache'))
+    timing = TimingModel(caches=model)
+
+    model.set_labels(AssemblySimulator().simulate_assembly(args.program, observers=[model, timing]))
+    print(model.report(args.top))
+    print()
+    print(timing.report())
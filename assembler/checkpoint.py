@@ -0,0 +1,79 @@
+#########################################################
+#   Checkpoint file. Created on 18/10/26
+#   Intent: Serializes the machine state of AssemblySimulator into a compact binary form and restores it,
+#           so that long simulations can be resumed from the middle instead of restarting from PC 0.
+#
+#           Layout (big endian, like everything else in the assembler):
+#               header      - magic 'CPUS', format version (16 bits), crc32 of the program image (32 bits),
+#                             PC (signed 64 bits), instruction count (64 bits), RAM size in bytes (64 bits),
+#                             number of RAM chunks (32 bits)
+#               registers   - r0 through r31, 32 bits each
+#               RAM chunks  - address (64 bits), length (32 bits) and the raw bytes of every allocated part of the RAM
+#                             (look at dump_pages in memory.py). Bytes outside of the chunks are 0.
+#
+#           The program itself isn't stored, only its crc32, which is checked when restoring. Code overwritten with
+#           AssemblySimulator.write_code is not part of the checkpoint.
+#
+#           The cost of a checkpoint is a copy of the allocated RAM: cheap for the default 256 bytes and for sparse
+#           PagedMemory, but a MappedMemory (ram_file) is copied whole, so every checkpoint of a mapped image is
+#           O(image size). Use a large checkpoint_every there, or a PagedMemory if the image is mostly zeros.
+
+import struct
+
+MAGIC = b'CPUS'
+VERSION = 2
+
+HEADER = struct.Struct(">4sHIqQQI")
+REGISTERS = struct.Struct(">32I")
+CHUNK = struct.Struct(">QI")
+
+
+def pack_checkpoint(simulator):
+    """ returns the machine state of the simulator as bytes. Costs a copy of the registers and the allocated RAM pages (all of a mapped image). """
+    chunks = simulator.RAM.dump_pages()
+    parts = [HEADER.pack(MAGIC, VERSION, simulator.program_crc, simulator.pc, simulator.instruction_count, len(simulator.RAM), len(chunks)),
+             REGISTERS.pack(*simulator.registers_file)]
+    for address, chunk in chunks:
+        parts.append(CHUNK.pack(address, len(chunk)))
+        parts.append(chunk)
+    return b''.join(parts)
+
+
+def unpack_checkpoint(simulator, data):
+    """ restores the machine state, packed by pack_checkpoint, into the simulator. The same program must be loaded. """
+    if len(data) < HEADER.size + REGISTERS.size:
+        raise RuntimeError(f"Checkpoint is too short: {len(data)} bytes")
+
+    magic, version, program_crc, pc, instruction_count, ram_size, chunk_count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise RuntimeError(f"Not a checkpoint, or an unsupported version: magic {magic}, version {version}")
+    if program_crc != simulator.program_crc:
+        raise RuntimeError(f"Checkpoint was made for another program (crc32 {program_crc:#010x}, loaded program has {simulator.program_crc:#010x})")
+    if ram_size != len(simulator.RAM):
+        raise RuntimeError(f"Checkpoint RAM size {ram_size} doesn't match the simulator's RAM size {len(simulator.RAM)}")
+
+    # everything is parsed and checked first, so that a damaged checkpoint leaves the simulator as it was
+    data = memoryview(data)
+    registers = REGISTERS.unpack_from(data, HEADER.size)
+    chunks = []
+    position = HEADER.size + REGISTERS.size
+    for _ in range(chunk_count):
+        if position + CHUNK.size > len(data):
+            raise RuntimeError(f"Checkpoint is truncated at RAM chunk header {len(chunks)}")
+        address, length = CHUNK.unpack_from(data, position)
+        position += CHUNK.size
+        if position + length > len(data):
+            raise RuntimeError(f"Checkpoint is truncated at RAM chunk of address {address}")
+        if address + length > ram_size:
+            raise RuntimeError(f"Checkpoint RAM chunk of address {address} and length {length} is outside of the RAM")
+
+        chunks.append((address, data[position:position + length]))
+        position += length
+
+    # registers are restored in place, so the running engines keep referring to the same list
+    simulator.registers_file[:] = registers
+    simulator.RAM.clear()
+    for address, chunk in chunks:
+        simulator.RAM.load_image(chunk, address)
+    simulator.pc = pc
+    simulator.instruction_count = instruction_count
@@ -0,0 +1,135 @@
+#########################################################
+#   Command line file. Created on 18/10/26
+#   Intent: The single 'isa' command (the console script of pyproject.toml, or 'python -m assembler') with the subcommands:
+#               asm     - assembles a .asm file into bytecode or into an object file.
+#               disasm  - disassembles bytecode back into assembly.
+#               sim     - simulates a bytecode file, or a .asm file which is assembled in memory, and prints the registers.
+#               compile - lexes and parses a high level language file and prints the syntax tree.
+#                         The code generator doesn't exist yet, so nothing is compiled into assembly.
+#
+#           It's called thousands of times from scripts, so the start must be quick: only argparse is imported here,
+#           every subcommand imports just the modules it needs. Check it with 'python -X importtime -m assembler sim ...'.
+#
+#           Usage: isa asm program.asm [-o program] [--optimize] [--object] [--cache [DIRECTORY]]
+#                  isa disasm program [-o program.asm] [--lower] [--bulk] [--labels-from program.asm]
+#                  isa sim program [--engine blocks] [--max-instructions N] [--detect-loops] [--ram-size N] [--json]
+#                  isa compile program.txt
+
+import argparse
+import sys
+
+
+def assemble_command(args):
+    from .isa_compiler import ISA_compiler
+
+    cache = None
+    if args.cache is not None:
+        from .assembly_cache import AssemblyCache
+        cache = AssemblyCache(args.cache or None)
+
+    compiler = ISA_compiler(cache, optimize=args.optimize)
+    if args.object:
+        compiler.encode_object(args.program, args.output)
+    else:
+        compiler.encode(args.program, args.output)
+
+    if args.optimize and compiler.optimizer is not None:
+        print(compiler.optimizer.report(), file=sys.stderr)
+
+
+def disassemble_command(args):
+    from .isa_compiler import ISA_compiler
+
+    compiler = ISA_compiler()
+    if not args.bulk and args.labels_from is None:
+        compiler.decode(args.program, args.output, lower_case=args.lower)
+        return
+
+    # numpy is needed only here
+    labels = compiler.assemble_file(args.labels_from)[1] if args.labels_from is not None else None
+    compiler.decode_bulk(args.program, args.output, args.lower, labels)
+
+
+def simulate_command(args):
+    from .simulator import AssemblySimulator
+
+    simulator = AssemblySimulator(ram_size=args.ram_size)
+    budget = args.max_instructions
+    arguments = dict(engine=args.engine, detect_loops=args.detect_loops,
+                     early_stopping=budget is not None, max_iterations=budget if budget is not None else 2**32)
+    if args.program.endswith('.asm'):
+        simulator.simulate_assembly(args.program, **arguments)
+    else:
+        simulator.simulate(args.program, **arguments)
+
+    loop = simulator.detected_loop
+    if args.json:
+        import json
+        print(json.dumps({'registers': simulator.registers_file, 'pc': simulator.pc,
+                          'instruction_count': simulator.instruction_count, 'loop': list(loop) if loop else None}))
+        return
+
+    for number, value in enumerate(simulator.registers_file):
+        if value:
+            print(f"r{number} = {value}")
+    print(f"pc = {simulator.pc}, {simulator.instruction_count} instructions")
+    if loop is not None:
+        print(f"infinite loop between {loop.start:#06x} and {loop.end:#06x}, repeating every {loop.instructions} instructions")
+
+
+def compile_command(args):
+    from high_language_compiler.lexer import Lexer
+    from high_language_compiler.parser2 import Parser2
+
+    with open(args.program, "r") as f:
+        tokens = Lexer(f.read()).tokenize()
+    print(Parser2().parse(tokens))
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog='isa', description="Assembler, disassembler and simulator of the custom ISA")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    asm = commands.add_parser('asm', help="assemble a .asm file")
+    asm.add_argument('program', help="assembly source")
+    asm.add_argument('-o', '--output', default='isa-encoder-output')
+    asm.add_argument('--optimize', action='store_true', help="run the peephole optimizer, the report goes to stderr")
+    asm.add_argument('--object', action='store_true', help="write a relocatable object file for the linker")
+    asm.add_argument('--cache', nargs='?', const='', default=None, metavar='DIRECTORY',
+                     help="cache the assembled programs, by default in $ISA_CACHE_DIR or ~/.cache/isa_assembler")
+    asm.set_defaults(function=assemble_command)
+
+    disasm = commands.add_parser('disasm', help="disassemble a bytecode file")
+    disasm.add_argument('program', help="bytecode file")
+    disasm.add_argument('-o', '--output', default='isa-decoder-output')
+    disasm.add_argument('--lower', action='store_true', help="lower case mnemonics")
+    disasm.add_argument('--bulk', action='store_true', help="the numpy disassembler, for large files. Recovers the labels")
+    disasm.add_argument('--labels-from', default=None, help="assembly source of the file, to name the labels like it. Implies --bulk")
+    disasm.set_defaults(function=disassemble_command)
+
+    sim = commands.add_parser('sim', help="simulate a bytecode file, or a .asm file")
+    sim.add_argument('program', help="bytecode file, or assembly source if it ends with .asm")
+    sim.add_argument('--engine', default='interpreter', choices=['interpreter', 'blocks'])
+    sim.add_argument('--max-instructions', type=int, default=None, help="instruction budget")
+    sim.add_argument('--detect-loops', action='store_true', help="stop infinite loops (interpreter engine only)")
+    sim.add_argument('--ram-size', type=int, default=256)
+    sim.add_argument('--json', action='store_true', help="print the registers, pc, instruction count and loop as JSON")
+    sim.set_defaults(function=simulate_command)
+
+    compile_parser = commands.add_parser('compile', help="parse a high level language file and print its syntax tree")
+    compile_parser.add_argument('program', help="high level language source")
+    compile_parser.set_defaults(function=compile_command)
+    return parser
+
+
+def main(argv=None):
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    try:
+        args.function(args)
+    except (RuntimeError, SyntaxError, OSError, IndexError, ZeroDivisionError) as e:
+        parser.exit(1, f"isa {args.command}: {type(e).__name__}: {e}\n")
+
+
+if __name__ == "__main__":
+    main()
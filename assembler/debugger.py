@@ -0,0 +1,292 @@
+#########################################################
+#   Debugger file. Created on 18/10/26
+#   Intent: Programmatic debugger for AssemblySimulator: PC breakpoints (by address or label), conditional breakpoints,
+#           register and RAM watchpoints, step(n), cont() and state queries, instead of scrolling through
+#           print_instructions/log_registers dumps.
+#
+#           The debugger runs its own copy of the predecoded table. Breakpoints and watchpoints don't cost anything on
+#           the other instructions, because they are traps patched into the table:
+#               * a breakpoint replaces the entry of its PC with a trap, which stops before the instruction executes.
+#               * a register watchpoint wraps only the instructions whose destination is the watched register.
+#               * a RAM watchpoint wraps only the store instructions, and checks the address of every store against it.
+#           A watchpoint stops after the instruction which changed the watched value.
+#
+#           Usage:
+#               debugger = Debugger(AssemblySimulator())
+#               debugger.load_assembly('examples/gcd.asm')
+#               debugger.break_at('done')
+#               debugger.watch_register('r2')
+#               event = debugger.cont()           # StopEvent(reason='watchpoint', pc=..., detail=...)
+#               debugger.register('r2'), debugger.where()
+
+from collections import namedtuple
+
+from .isa_compiler import ISA_compiler
+from .profiler import Symbols
+from .timing_model import STORES, register_usage
+
+# reason - 'breakpoint', 'watchpoint', 'step' (the number of steps was executed) or 'end' (the program finished)
+StopEvent = namedtuple('StopEvent', ['reason', 'pc', 'detail'])
+
+
+class _Stop(Exception):
+    """ raised by the traps. next_cursor_byte is None if the instruction didn't execute. """
+    def __init__(self, reason, detail, next_cursor_byte=None):
+        self.reason = reason
+        self.detail = detail
+        self.next_cursor_byte = next_cursor_byte
+
+
+class Debugger:
+    """
+        * simulator - the AssemblySimulator to debug. Load the program with load or load_assembly.
+        * labels    - label name -> byte address. Set by load_assembly.
+
+        * functions interface:
+        \t load, load_assembly                   - load the bytecode or assembly file, starting at PC 0.
+        \t break_at, remove_breakpoint           - breakpoints on an address or label, optionally with a condition(simulator) -> bool.
+        \t watch_register, watch_memory, unwatch - watchpoints, stopping when the watched value changes.
+        \t step, cont                            - run a number of instructions or until something stops the execution.
+        \t pc, where, register, registers, memory, instruction - state queries.
+        \t write_code                            - overwrite an instruction while debugging.
+    """
+    def __init__(self, simulator, labels=None):
+        self.simulator = simulator
+        self.labels = dict(labels or {})
+        self.symbols = Symbols(self.labels)
+
+        self.breakpoints = {}        # byte address -> condition or None
+        self.register_watches = {}   # register number -> condition or None
+        self.memory_watches = {}     # (start, end) byte range -> condition or None
+
+        self.table = []              # the predecoded table with the traps
+        self.resume_table = []       # the same table without the breakpoints, used for the first instruction after a breakpoint stop
+        self.breakpoint_stop = None  # the PC where a breakpoint stopped the execution last, None after any other stop
+
+    #
+    # LOADING
+    #
+    def load(self, bytecode_file_name):
+        """ loads the bytecode file, or the bytecode itself given as a bytes-like object """
+        if isinstance(bytecode_file_name, (bytes, bytearray, memoryview)):
+            self.simulator.load_program(bytecode_file_name)
+        else:
+            with open(bytecode_file_name, "rb") as f:
+                self.simulator.load_program(f.read())
+        self.breakpoint_stop = None
+        self._rebuild()
+
+    def load_assembly(self, assembly_file_name):
+        """ assembles the file and loads it. The assembler's labels can be used for breakpoints. """
+        bytecode, labels = ISA_compiler().assemble_file(assembly_file_name)
+        self.labels = dict(labels)
+        self.symbols = Symbols(self.labels)
+        self.load(bytecode)
+
+    def write_code(self, address, word):
+        self.simulator.write_code(address, word)
+        self._rebuild()
+
+    #
+    # BREAKPOINTS AND WATCHPOINTS
+    #
+    def break_at(self, location, condition=None):
+        """
+            sets a breakpoint at the byte address or label. If condition (a function of the simulator) is given,
+            the execution stops only when it returns True. Returns the address.
+        """
+        address = self._address(location)
+        self.breakpoints[address] = condition
+        self._rebuild()
+        return address
+
+    def remove_breakpoint(self, location):
+        self.breakpoints.pop(self._address(location), None)
+        self._rebuild()
+
+    def watch_register(self, register, condition=None):
+        """ stops after an instruction changes the register ('r3' or 3), and condition(simulator) returns True if given """
+        self.register_watches[self._register(register)] = condition
+        self._rebuild()
+
+    def watch_memory(self, address, length=1, condition=None):
+        """ stops after a store changes any of the length bytes starting at the address """
+        if length < 1 or address < 0 or address + length > len(self.simulator.RAM):
+            raise ValueError(f"Invalid memory watch of {length} bytes at {address}. RAM size is {len(self.simulator.RAM)} bytes")
+        self.memory_watches[(address, address + length)] = condition
+        self._rebuild()
+
+    def unwatch(self, register=None, address=None, length=1):
+        if register is not None:
+            self.register_watches.pop(self._register(register), None)
+        if address is not None:
+            self.memory_watches.pop((address, address + length), None)
+        self._rebuild()
+
+    #
+    # EXECUTION
+    #
+    def step(self, count=1):
+        """ executes count instructions, unless a breakpoint or watchpoint stops it earlier. Returns the StopEvent. """
+        return self._run(count)
+
+    def cont(self):
+        """ continues until a breakpoint, a watchpoint or the end of the program. Returns the StopEvent. """
+        return self._run(None)
+
+    #
+    # STATE
+    #
+    def pc(self):
+        return self.simulator.pc
+
+    def where(self):
+        """ the current PC as 'label+offset' """
+        return self.symbols.symbolize(self.simulator.pc)
+
+    def register(self, register):
+        return self.simulator.registers_file[self._register(register)]
+
+    def registers(self):
+        return {f"r{number}": value for number, value in enumerate(self.simulator.registers_file)}
+
+    def memory(self, address, length=1):
+        return bytes(self.simulator.RAM.dump_range(address, address + length))
+
+    def instruction(self, address=None):
+        """ the instruction at the byte address (by default the PC) as 'OPCODE field field field' """
+        address = self.simulator.pc if address is None else address
+        word = self.simulator.program_words[address >> 2]
+        return f"{self.simulator.opcode_names.get(word >> 24, bin(word >> 24))} {(word >> 16) & 0xFF} {(word >> 8) & 0xFF} {word & 0xFF}"
+
+    #
+    # UTILITY FUNCTIONS
+    #
+    def _run(self, limit):
+        simulator = self.simulator
+        table = self.table
+        end = simulator.program_size
+        cursor_byte = simulator.pc
+        count = simulator.instruction_count
+        stop_count = float('inf') if limit is None else count + limit
+        start_count = count
+        resume = cursor_byte == self.breakpoint_stop
+
+        try:
+            if resume and cursor_byte < end and count < stop_count:
+                # the breakpoint at the current PC already stopped the execution, so the first instruction ignores it
+                handler, arg1, arg2, arg3 = self.resume_table[cursor_byte >> 2]
+                cursor_byte = handler(arg1, arg2, arg3, cursor_byte) + 4
+                count += 1
+
+            if limit is None:
+                while cursor_byte < end:
+                    handler, arg1, arg2, arg3 = table[cursor_byte >> 2]
+                    cursor_byte = handler(arg1, arg2, arg3, cursor_byte) + 4
+                    count += 1
+            else:
+                while cursor_byte < end and count < stop_count:
+                    handler, arg1, arg2, arg3 = table[cursor_byte >> 2]
+                    cursor_byte = handler(arg1, arg2, arg3, cursor_byte) + 4
+                    count += 1
+
+        except _Stop as stop:
+            if stop.next_cursor_byte is not None:
+                cursor_byte = stop.next_cursor_byte + 4
+                count += 1
+            self.breakpoint_stop = cursor_byte if stop.reason == 'breakpoint' else None
+            return StopEvent(stop.reason, cursor_byte, stop.detail)
+
+        finally:
+            simulator.pc = cursor_byte
+            simulator.instruction_count = count
+
+        if count != start_count: # the stop is behind, unless nothing ran (e.g. step(0))
+            self.breakpoint_stop = None
+        return StopEvent('end' if cursor_byte >= end else 'step', cursor_byte, None)
+
+    def _rebuild(self):
+        """ copies the predecoded table of the simulator and patches the traps into it """
+        simulator = self.simulator
+        self.resume_table = []
+        self.table = []
+
+        for index, entry in enumerate(simulator.decoded):
+            word = simulator.program_words[index]
+            _, destination = register_usage(word)
+
+            if destination in self.register_watches:
+                entry = self._register_trap(entry, destination)
+            if self.memory_watches and word >> 24 in STORES:
+                entry = self._memory_trap(entry, word)
+            self.resume_table.append(entry)
+
+            if index * 4 in self.breakpoints:
+                entry = self._breakpoint_trap(entry, index * 4)
+            self.table.append(entry)
+
+    def _breakpoint_trap(self, entry, address):
+        handler = entry[0]
+        condition = self.breakpoints[address]
+
+        def breakpoint_trap(arg1, arg2, arg3, cursor_byte):
+            if condition is None or condition(self.simulator):
+                raise _Stop('breakpoint', self.symbols.symbolize(address))
+            return handler(arg1, arg2, arg3, cursor_byte)
+
+        return (breakpoint_trap,) + entry[1:]
+
+    def _register_trap(self, entry, register):
+        handler = entry[0]
+        condition = self.register_watches[register]
+        registers = self.simulator.registers_file
+
+        def register_trap(arg1, arg2, arg3, cursor_byte):
+            old = registers[register]
+            next_cursor_byte = handler(arg1, arg2, arg3, cursor_byte)
+            if registers[register] != old and (condition is None or condition(self.simulator)):
+                raise _Stop('watchpoint', (f"r{register}", old, registers[register]), next_cursor_byte)
+            return next_cursor_byte
+
+        return (register_trap,) + entry[1:]
+
+    def _memory_trap(self, entry, word):
+        handler = entry[0]
+        simulator = self.simulator
+
+        def memory_trap(arg1, arg2, arg3, cursor_byte):
+            access = simulator.memory_access(word)
+            if access is None: # a malformed register byte, the handler reports it
+                return handler(arg1, arg2, arg3, cursor_byte)
+            address, width, _ = access
+            touched = [(start, end) for start, end in self.memory_watches if address < end and start < address + width]
+            if not touched:
+                return handler(arg1, arg2, arg3, cursor_byte)
+
+            old = [self.memory(start, end - start) for start, end in touched]
+            next_cursor_byte = handler(arg1, arg2, arg3, cursor_byte)
+            for (start, end), before in zip(touched, old):
+                after = self.memory(start, end - start)
+                condition = self.memory_watches[(start, end)]
+                if after != before and (condition is None or condition(simulator)):
+                    raise _Stop('watchpoint', (start, before, after), next_cursor_byte)
+            return next_cursor_byte
+
+        return (memory_trap,) + entry[1:]
+
+    def _address(self, location):
+        if isinstance(location, str):
+            if location not in self.labels:
+                raise RuntimeError(f"Unknown label {location}")
+            return self.labels[location]
+
+        if location % 4 != 0 or not (0 <= location < self.simulator.program_size):
+            raise RuntimeError(f"Invalid breakpoint address {location}. Program size is {self.simulator.program_size} bytes")
+        return location
+
+    def _register(self, register):
+        if isinstance(register, str):
+            if register not in self.simulator.registers_dict:
+                raise RuntimeError(f"Unknown register {register}")
+            return self.simulator.registers_dict[register]
+        return register
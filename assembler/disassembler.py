@@ -0,0 +1,180 @@
+#########################################################
+#   Bulk disassembler file. Created on 18/10/26
+#   Intent: Disassembles whole bytecode images at once, for images too large for ISA_compiler.decode, which reads
+#           4 bytes at a time, looks every opcode and register up with a linear search and builds its text with +=.
+#
+#           The image is read with a single numpy.frombuffer and the fields of all the words are extracted with
+#           vectorized masks and shifts. Every distinct word is formatted only once, with the mnemonics and register
+#           names taken from precomputed tables, so compiled code, which repeats the same words a lot, is mostly lookups.
+#
+#           Labels are recovered: the static targets of BEQ..BLTES, JAL and J get a label (L_address, or the name from
+#           a given label table), which replaces the numeric target, so the listing assembles back into the same image.
+#           Words which aren't valid instructions are written as '; unknown word 0x...' comments.
+#           The listing is streamed into the output file in chunks.
+#
+#           Requires numpy. The rest of the assembler doesn't.
+#
+#           Usage: python -m assembler.disassembler program.bin [-o program.asm] [--lower] [--labels-from program.asm]
+
+import argparse
+
+import numpy as np
+
+from . import opcodes as op
+from .isa_compiler import ISA_compiler
+
+# instruction types, look at ISA_compiler._find_opcode_type
+INVALID, DSS, DSI, DS, DI, I = range(6)
+
+OPCODE_NAMES = {opcode.value: opcode.name for opcode in op.Opcode}
+REGISTER_NAMES = [f"r{number}" for number in range(32)]
+
+BRANCHES = {op.Opcode.BEQ, op.Opcode.BNEQ, op.Opcode.BLT, op.Opcode.BLE, op.Opcode.BLTS, op.Opcode.BLTES}
+
+LINES_PER_WRITE = 65536
+
+
+def _opcode_type(opcode):
+    if opcode not in OPCODE_NAMES:
+        return INVALID
+    if opcode & op.IMMEDIATE_BIT:
+        if opcode in (op.Opcode.JAL, op.Opcode.LUI, op.Opcode.LLI):
+            return DI
+        return I if opcode == op.Opcode.J else DSI
+    return DS if opcode == op.Opcode.SEQZ else DSS
+
+
+# opcode byte -> instruction type
+TYPES = np.array([_opcode_type(opcode) for opcode in range(256)], dtype=np.uint8)
+TYPE_LIST = TYPES.tolist()
+
+
+def decode_fields(words):
+    """ returns the (opcode, arg1, arg2, arg3) arrays of the uint32 words """
+    return words >> 24, (words >> 16) & 0xFF, (words >> 8) & 0xFF, words & 0xFF
+
+
+def valid_words(words):
+    """ boolean array of the words which are instructions with valid register numbers """
+    opcode, arg1, arg2, arg3 = decode_fields(words)
+    types = TYPES[opcode]
+    low16 = words & 0xFF_FF
+
+    return (((types == DSS) & (arg1 < 32) & (arg2 < 32) & (arg3 < 32)) |
+            ((types == DSI) & (arg1 < 32) & (arg2 < 32)) |
+            ((types == DS) & (arg1 < 32) & (low16 < 32)) |
+            ((types == DI) & (arg1 < 32)) |
+            (types == I))
+
+
+def branch_targets(words, valid=None):
+    """ returns the sorted array of the distinct static targets of the branches, JAL and J among the words """
+    if valid is None:
+        valid = valid_words(words)
+    opcode = words >> 24
+
+    branches = np.isin(opcode, list(BRANCHES)) & valid
+    jal = (opcode == op.Opcode.JAL) & valid
+    jumps = (opcode == op.Opcode.J) & valid
+
+    return np.unique(np.concatenate([words[branches] & 0xFF, words[jal] & 0xFF_FF, words[jumps] & 0xFF_FF_FF]))
+
+
+def make_labels(words, labels=None):
+    """
+        returns byte address -> label name for every branch/jump target inside the program (or at its end), and every
+        label of the given table (label name -> byte address). Targets without a name get 'L_address'.
+    """
+    program_size = len(words) * 4
+    names = {address: name for name, address in (labels or {}).items()}
+
+    for address in branch_targets(words).tolist():
+        if address <= program_size and address % 4 == 0 and address not in names:
+            names[address] = f"L_{address:04x}"
+    return names
+
+
+def disassemble(data, labels=None, lower_case=False):
+    """
+        returns the list of the lines of the listing of the bytecode image (bytes-like).
+        Trailing bytes which don't make a word are ignored.
+        labels - optional label name -> byte address table, e.g. ISA_compiler.labels, used for the names of the labels.
+    """
+    return [line for chunk in _listing_chunks(data, labels, lower_case) for line in chunk]
+
+
+def disassemble_file(input_file_name, output_file_name, labels=None, lower_case=False):
+    with open(input_file_name, "rb") as f:
+        data = f.read()
+
+    with open(output_file_name, "w", buffering=1024 * 1024) as f:
+        for chunk in _listing_chunks(data, labels, lower_case):
+            if chunk:
+                f.write('\n'.join(chunk) + '\n')
+
+
+#
+# UTILITY FUNCTIONS
+#
+def _listing_chunks(data, labels, lower_case):
+    """ yields the listing as lists of at most LINES_PER_WRITE lines """
+    words = np.frombuffer(data, dtype='>u4', count=len(data) // 4).astype(np.uint32)
+    names = make_labels(words, labels)
+
+    # format every distinct word once
+    unique_words, inverse = np.unique(words, return_inverse=True)
+    valid = valid_words(unique_words)
+    texts = np.empty(len(unique_words), dtype=object)
+    texts[valid] = [_format(word, names, lower_case) for word in unique_words[valid].tolist()]
+    texts[~valid] = _unknown_words(unique_words[~valid])
+    lines = texts[inverse.reshape(-1)]
+
+    # the labels split the listing into runs of instructions
+    start = 0
+    for address in sorted(address for address in names if address <= len(words) * 4):
+        for position in range(start, address >> 2, LINES_PER_WRITE):
+            yield lines[position:min(position + LINES_PER_WRITE, address >> 2)].tolist()
+        yield [f"{names[address]}:"]
+        start = address >> 2
+    for position in range(start, len(lines), LINES_PER_WRITE):
+        yield lines[position:position + LINES_PER_WRITE].tolist()
+
+
+def _unknown_words(words):
+    """ '; unknown word 0x...' comments of the words, with the hex digits of all of them made in a single call """
+    digits = np.frombuffer(words.astype('>u4').tobytes().hex().encode('utf-32-le'), dtype='<U8')
+    return np.char.add('; unknown word 0x', digits).astype(object)
+
+
+def _format(word, names, lower_case):
+    opcode = word >> 24
+    name = OPCODE_NAMES[opcode].lower() if lower_case else OPCODE_NAMES[opcode]
+    arg1, arg2, arg3 = (word >> 16) & 0xFF, (word >> 8) & 0xFF, word & 0xFF
+    typ = TYPE_LIST[opcode]
+
+    if typ == DSS:
+        return f"{name} {REGISTER_NAMES[arg1]}, {REGISTER_NAMES[arg2]}, {REGISTER_NAMES[arg3]}"
+    if typ == DSI:
+        target = names.get(arg3) if opcode in BRANCHES else None
+        return f"{name} {REGISTER_NAMES[arg1]}, {REGISTER_NAMES[arg2]}, {target or arg3}"
+    if typ == DS:
+        return f"{name} {REGISTER_NAMES[arg1]}, {REGISTER_NAMES[word & 0xFF_FF]}"
+    if typ == DI:
+        target = names.get(word & 0xFF_FF) if opcode == op.Opcode.JAL else None
+        return f"{name} {REGISTER_NAMES[arg1]}, {target or word & 0xFF_FF}"
+    return f"{name} {names.get(word & 0xFF_FF_FF) or word & 0xFF_FF_FF}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Disassemble a bytecode image, recovering the labels")
+    parser.add_argument('program', help="bytecode file")
+    parser.add_argument('-o', '--output', default='isa-decoder-output')
+    parser.add_argument('--lower', action='store_true', help="lower case mnemonics")
+    parser.add_argument('--labels-from', default=None, help="assembly source of the image, to name the labels like it")
+    args = parser.parse_args()
+
+    labels = None
+    if args.labels_from is not None:
+        _, labels = ISA_compiler().assemble_file(args.labels_from)
+
+    disassemble_file(args.program, args.output, labels, args.lower)
@@ -0,0 +1,72 @@
+#########################################################
+#   Dispatch microbenchmark. Created on 18/10/26
+#   Intent: Measures how much it costs to choose the operation of a single instruction, per opcode.
+#           "before" is the old way of the simulator: an if/elif chain over the instruction type and then
+#           an if/elif chain comparing the opcode name against each string in turn.
+#           "after" is the dispatch table, indexed by the numeric opcode value.
+#
+#           Only the dispatch is measured, the handlers do nothing. Run it with 'python -m assembler.dispatch_benchmark'.
+
+import timeit
+
+from . import opcodes as op
+
+# the order of the comparisons in the old simulate_dss, simulate_dsi, simulate_ds, simulate_di and simulate_i functions
+LEGACY_CHAINS = {
+    'DSS': ['ADD', 'MUL', 'MULH', 'DIV', 'REM', 'AND', 'OR', 'XOR', 'NOT', 'SLL', 'SRL', 'SRA', 'SLT', 'SLTS', 'NOP'],
+    'DSI': ['ADDI', 'ANDI', 'ORI', 'XORI', 'SLLI', 'SRLI', 'SRAI', 'SLTI', 'SLTSI', 'LB', 'LH', 'LW', 'SB', 'SH', 'SW',
+            'BEQ', 'BNEQ', 'BLT', 'BLE', 'BLTS', 'BLTES', 'JALR'],
+    'DS':  ['SEQZ'],
+    'DI':  ['JAL', 'LUI', 'LLI'],
+    'I':   ['J'],
+}
+
+
+def build_legacy_dispatch():
+    """
+        Generates the old two level if/elif chain as real python code, so that the string comparisons are exactly the ones
+        the simulator used to do. Returns a function legacy(typ, opcode) -> position of the opcode in its chain.
+    """
+    lines = ["def legacy(typ, opcode):"]
+    for i, (typ, chain) in enumerate(LEGACY_CHAINS.items()):
+        lines.append(f"    {'if' if i == 0 else 'elif'} typ == {repr(typ)}:")
+        for j, name in enumerate(chain):
+            lines.append(f"        {'if' if j == 0 else 'elif'} opcode == {repr(name)}:")
+            lines.append(f"            return {j}")
+
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace['legacy']
+
+
+def build_table_dispatch():
+    """ the new dispatch. A list of 256 handlers, indexed by the opcode value. """
+    def handler(arg1, arg2, arg3, cursor_byte):
+        return cursor_byte
+
+    table = [None] * 256
+    for opcode in op.Opcode:
+        table[opcode.value] = handler
+    return table
+
+
+def run(number=200_000):
+    legacy = build_legacy_dispatch()
+    table = build_table_dispatch()
+
+    print(f"{'opcode':<8}{'type':<6}{'before (ns)':>14}{'after (ns)':>14}{'speedup':>10}")
+
+    for typ, chain in LEGACY_CHAINS.items():
+        for name in chain:
+            value = op.Opcode[name].value
+
+            before = timeit.timeit("legacy(typ, name)", globals={'legacy': legacy, 'typ': typ, 'name': name}, number=number)
+            after = timeit.timeit("table[value](1, 2, 3, 0)", globals={'table': table, 'value': value}, number=number)
+
+            before_ns = before / number * 1e9
+            after_ns = after / number * 1e9
+            print(f"{name:<8}{typ:<6}{before_ns:>14.1f}{after_ns:>14.1f}{before_ns / after_ns:>9.2f}x")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,19 +1,20 @@
 ; created at 25/6/25. Simple test program.
-; load 255 fibonacci numbers into ram
+; load 64 fibonacci numbers into ram (64 words fill the whole 256 byte ram)
 
 lli r1, 1  ; x=1
 lli r2, 2  ; y=2
 lli r3, 0  ; n=0
-lli r5, 255 ; max_n=32
+lli r5, 64 ; max_n=64
+lli r6, 0  ; address=0
 
 loop:
     add r4, r2, r1 ; z = x+y
     add r1, r0, r2 ; x = y
     add r2, r0, r4 ; y = z
 
-    sw r3, r4, 0   ; save z into ram
+    sw r6, r4, 0   ; save z into ram
+    addi r6, r6, 4 ; address = address + 4 (a word is 4 bytes)
 
-    addi r3, r3, 1 ; n = n - 1
+    addi r3, r3, 1 ; n = n + 1
 
     bneq r3, r5, loop   ; loop back if n != max_n
-
@@ -0,0 +1,8 @@
+; a jump to a numeric address, assembled with the peephole optimizer (look at numeric_jump.expected.json).
+; The no-op is removed, so 'j 16' must be moved to 'j 12', otherwise it would jump past the end of the program.
+main:
+    addi    r1, r1, 0       ; no-op, at 0
+    addi    r2, r0, 5       ; at 4
+    j       16
+    addi    r2, r0, 9       ; at 12, skipped
+    addi    r3, r0, 7       ; at 16
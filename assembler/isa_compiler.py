@@ -13,145 +13,112 @@
 
 # ! TODO WRITE TESTS 
 
-import opcodes as op
+import hashlib
+import io
+import itertools
+from . import opcodes as op
 import struct
 
-from assembly_lexer import AssemblyLexer
+from .assembly_lexer import AssemblyLexer
+from .object_file import ObjectFile, Relocation, write_object
+
+# bump it when the produced bytecode changes, so that the cached programs (look at assembly_cache.py) and the object
+# files (look at linker.py) get reassembled
+ASSEMBLER_VERSION = 1
+
+WORD = struct.Struct(">I")
+
+# the number of operand tokens of every instruction type
+OPERANDS = {'DSS': 3, 'DSI': 3, 'DS': 2, 'DI': 2, 'I': 1}
+
+
+def assembler_fingerprint():
+    """ sha256 digest of ASSEMBLER_VERSION and of the opcodes, stored in the object files """
+    from .assembly_cache import opcodes_fingerprint # hashes opcodes.py, only needed for the objects
+    return hashlib.sha256(f"{ASSEMBLER_VERSION}\n{opcodes_fingerprint()}\n".encode('utf-8')).digest()
+
 
 class ISA_compiler:
-    def __init__(self):
-        self.opcodes_dict = {op.name: op.value for op in op.Opcode}
-        self.registers_dict = {'r'+str(i): i for i in range(32)}
+    def __init__(self, cache=None, optimize=False):
+        """
+            cache    - optional AssemblyCache (look at assembly_cache.py). encode returns the cached bytecode and labels
+                       of sources which were assembled before, instead of assembling them again.
+            optimize - whether to run the peephole optimizer (look at peephole.py) on the tokens before encoding them.
+                       self.optimizer.removed then counts the removed instructions of the last assembled file.
+        """
+        self.opcodes_dict, _, self.registers_dict = op.lookup_tables()
+        self.cache = cache
+        self.optimize = optimize
+        self.optimizer = None
 
     def encode(self, input_file_name='isa-encoder-input', output_file_name='isa-encoder-output', print_instructions=False):
         """
             Takes assembly file name (input_file_name), output file name (output_file_name) and creates the file with bytecode representation. 
-        """
 
-        tokens=[]
-
-        text = ""
-        # read the input file
-        with open(input_file_name, "r") as read_file:
-            text = read_file.read()
+            The tokens are encoded in a single pass, as the lexer streams them from the file, into a bytearray which
+            doubles when it's full. A label used before its definition goes on a fixup list with the position of its field,
+            which is patched in place when the label gets defined. The bytecode is written with a single write at the end.
+        """
 
-        # instantiate lexer and tokens
-        lexer = AssemblyLexer()
-        tokens = lexer.tokenize(text)
+        # print_instructions needs the real assembly, not the cached one
+        bytecode, _ = self.assemble_file(input_file_name, use_cache=not print_instructions)
+
+        if print_instructions:
+            for (word,) in WORD.iter_unpack(bytecode):
+                opcode_type = self._find_opcode_type(word >> 24)
+                if opcode_type == 'DI':
+                    print(word >> 24, (word >> 16) & 0xFF, word & 0xFF_FF, 0)
+                elif opcode_type == 'I':
+                    print(word >> 24, word & 0xFF_FF_FF, 0, 0)
+                elif opcode_type == 'DS':
+                    print(word >> 24, (word >> 16) & 0xFF, word & 0xFF, 0)
+                else:
+                    print(word >> 24, (word >> 16) & 0xFF, (word >> 8) & 0xFF, word & 0xFF)
 
-        self.labels = {}
-        
         # write into the file
         with open(output_file_name, "wb") as write_file:
+            write_file.write(bytecode)
 
-            # find labels
-            i=0
-            byte_index = 0
-            # find labels' byte indexes
-            while tokens[i].token_type != 'EOF':
-                if tokens[i].token_type == 'OPCODE':
-                    byte_index += 4
-
-                elif tokens[i].token_type == 'LABEL':
-                    self.labels[tokens[i].value] = byte_index
-                
-                i += 1
-
-            # iterate over opcodes
-            i=0
-            while tokens[i].token_type != 'EOF':
-
-                opcode  =0b0000_0000
-                arg1    =0b0000_0000
-                arg2    =0b0000_0000
-                arg3    =0b0000_0000
-
-                data    =bytes()
-
-                
-
-                # skip labels
-                if tokens[i].token_type == 'LABEL':
-                    i += 1
-                    continue
-
-                # opcode found
-                elif tokens[i].token_type == 'OPCODE':
-                    # opcode byte representation
-                    opcode = self.opcodes_dict[tokens[i].value]
-
-                    # DSS (8,8,8,8), DSI (8,8,8,8), DS (8,8,16), DI (8,8,16), I (8,24)
-                    opcode_type = self._find_opcode_type(opcode)
-
-                    if opcode_type == 'DSS':
-                        # check if all arguments are present
-                        if i+3 >= len(tokens):
-                            raise SyntaxError(f"incomplete instruction with opcode {opcode} at line {tokens[i].line}")
-                        
-                        # convert names into register bytecode. Make sure they're 8 bit
-                        arg1 = self.registers_dict[tokens[i+1].value]   & 0xFF
-                        arg2 = self.registers_dict[tokens[i+2].value]   & 0xFF
-                        arg3 = self.registers_dict[tokens[i+3].value]   & 0xFF
-
-                        # make a single 32 bit instruction
-                        data = struct.pack(">I", (opcode << 24) | (arg1 << 16) | (arg2 << 8) | arg3)
-
-                        # skip opcode and arguments
-                        i+=4
-
-                    # the same logic applies here
-                    elif opcode_type == 'DSI':
-                        if i+3 >= len(tokens):
-                            raise SyntaxError(f"incomplete instruction with opcode {opcode} at line {tokens[i].line}")
-                        
-                        arg1 = self.registers_dict[tokens[i+1].value]   & 0xFF
-                        arg2 = self.registers_dict[tokens[i+2].value]   & 0xFF
-                        arg3 = self._label_or_numeric(tokens[i+3], bits=8, called_from='DSI')      & 0xFF
-                        data = struct.pack(">I", (opcode << 24) | (arg1 << 16) | (arg2 << 8) | arg3)
-
-                        i+=4
-
-                    # notice : arg2 for DS and DI, also arg1 for I, must be masked correctly and not shifted in order to make a correct instruction
-                    elif opcode_type == 'DS':
-                        if i+2 >= len(tokens):
-                            raise SyntaxError(f"incomplete instruction with opcode {opcode} at line {tokens[i].line}")
-                        
-                        arg1 = self.registers_dict[tokens[i+1].value]   & 0xFF
-                        arg2 = self.registers_dict[tokens[i+2].value]   & 0xFF
-
-                        data = struct.pack(">I", (opcode << 24) | (arg1 << 16) | (arg2))
-
-                        i+=3
-
-                    elif opcode_type == 'DI':
-                        if i+2 >= len(tokens):
-                            raise SyntaxError(f"incomplete instruction with opcode {opcode} at line {tokens[i].line}")
-                        
-                        arg1 = self.registers_dict[tokens[i+1].value]   & 0xFF
-                        arg2 = self._label_or_numeric(tokens[i+2], 16, called_from='DI')      & 0xFF_FF
-                        data = struct.pack(">I", (opcode << 24) | (arg1 << 16) | (arg2))
-
-                        i+=3
-
-                    elif opcode_type == 'I':
-                        if i+1 >= len(tokens):
-                            raise SyntaxError(f"incomplete instruction with opcode {opcode} at line {tokens[i].line}")
-                        
-                        # 24 bit number
-                        arg1 = self._label_or_numeric(tokens[i+1], 24, called_from='I')      & 0xFF_FF_FF
-                        data = struct.pack(">I", (opcode << 24) | arg1)
-
-                        i+=2
-
-                    write_file.write(data)
+    def assemble(self, source):
+        """
+            Assembles the source text in memory, without touching any file. Returns (bytecode, labels): the bytecode
+            as bytes, which AssemblySimulator.simulate takes directly, and the label name -> byte address table.
+            The cache is used only for files.
+        """
+        bytecode = self._assemble(io.StringIO(source))
+        return bytes(bytecode), self.labels
 
-                else:
-                    raise SyntaxError(f"unknown token {tokens[i]}")
-                
-                if print_instructions:
-                    print(opcode, arg1 , arg2, arg3)
+    def assemble_file(self, input_file_name, use_cache=True):
+        """
+            Like encode, but returns (bytecode, labels) instead of writing the bytecode into a file.
+            use_cache - whether to use the cache, if there's one.
+        """
+        # unchanged sources come from the cache
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = self.cache.key(input_file_name, f"{ASSEMBLER_VERSION}-peephole" if self.optimize else ASSEMBLER_VERSION)
+            entry = self.cache.get(cache_key)
+            if entry is not None:
+                bytecode, self.labels = entry
+                return bytecode, self.labels
+
+        with open(input_file_name, "r") as read_file:
+            bytecode = bytes(self._assemble(read_file))
+
+        if cache_key is not None:
+            self.cache.put(cache_key, bytecode, self.labels)
+        return bytecode, self.labels
+
+    def encode_object(self, input_file_name='isa-encoder-input', output_file_name='isa-object-output'):
+        """
+            Assembles the file into a relocatable object file (look at object_file.py) instead of bytecode.
+            Every label reference, to this file or to another one, becomes a relocation and its field stays 0.
+            Objects are combined into a program by linker.py, so labels can be defined in any of the linked files.
+        """
+        with open(input_file_name, "r") as read_file:
+            code = self._assemble(read_file, relocatable=True)
+        write_object(ObjectFile(bytes(code), dict(self.labels), self.relocations, assembler_fingerprint()), output_file_name)
 
-                
     def decode(self, input_file_name='isa-encoder-output', output_file_name='isa-decoder-output', print_machine_code=False, lower_case=False):
         """
             ** notice that the input_file_name must be the output file of an encoder, i.e. contain byte code
@@ -163,73 +130,163 @@ class ISA_compiler:
             Note that labels don't get decoded.
 
         """
-        text = ""
-
         # open the file for byte reading
         with open(input_file_name, "rb") as file:
-            byte_index=0
+            text = self.disassemble(file.read(), print_machine_code, lower_case)
 
-            while chunk := file.read(4): # read 4 bytes of memory in a single iteration
-                byte_index+=1
+        # open the file to write the decoded instructions
+        with open(output_file_name, "w") as file:
+            file.write(text)
 
-                word = int.from_bytes(chunk, byteorder="big")
-                
-                # Instruction masking. Opcode is supposed to be the first byte, arg1 second byte, arg2 third and arg4 the forth.
-                # After masking they are shifted to get the real bytecode representation
-                opcode = (word     & 0xFF_00_00_00) >> 24
-                arg1 =   (word     & 0x00_FF_00_00) >> 16
-                arg2 =   (word     & 0x00_00_FF_00) >> 8
-                arg3 =   (word     & 0x00_00_00_FF)
+    def disassemble(self, data, print_machine_code=False, lower_case=False):
+        """
+            Like decode, but takes the bytecode as a bytes-like object (bytes, bytearray, memoryview) and returns the assembly
+            text, without touching any file. Trailing bytes which don't make a word are ignored.
+        """
+        lines = [] # joined at the end, growing a string instruction by instruction is quadratic
+        byte_index=0
 
-                if print_machine_code:
-                    print(bin(word))
+        data = memoryview(data).cast('B')
+        for (word,) in WORD.iter_unpack(data[:len(data) - len(data) % 4]): # a single 32 bit word in an iteration
+            byte_index+=1
 
-                # find type and opcode
-                typ = self._find_opcode_type(opcode)
-                opcode_reversed = self._opcode_reverse(opcode, byte_index)
+            # Instruction masking. Opcode is supposed to be the first byte, arg1 second byte, arg2 third and arg4 the forth.
+            # After masking they are shifted to get the real bytecode representation
+            opcode = (word     & 0xFF_00_00_00) >> 24
+            arg1 =   (word     & 0x00_FF_00_00) >> 16
+            arg2 =   (word     & 0x00_00_FF_00) >> 8
+            arg3 =   (word     & 0x00_00_00_FF)
 
-                if lower_case:
-                    opcode_reversed.lower()
+            if print_machine_code:
+                print(bin(word))
 
-                # depending on the type, decode the instruction and add to the text. Notice the default case is upper-case.
-                if typ == 'DSS':
-                    reg1_reverse = self._register_reverse(arg1, byte_index)
-                    reg2_reverse = self._register_reverse(arg2, byte_index)
-                    reg3_reverse = self._register_reverse(arg3, byte_index)
+            # find type and opcode
+            typ = self._find_opcode_type(opcode)
+            opcode_reversed = self._opcode_reverse(opcode, byte_index)
 
-                    text += f"{opcode_reversed} {reg1_reverse}, {reg2_reverse}, {reg3_reverse}\n"
-                elif typ == 'DSI':
-                    reg1_reverse = self._register_reverse(arg1, byte_index)
-                    reg2_reverse = self._register_reverse(arg2, byte_index)
-                    arg3_full = word & 0x00_00_00_FF 
+            if lower_case:
+                opcode_reversed = opcode_reversed.lower()
 
-                    text += f"{opcode_reversed} {reg1_reverse}, {reg2_reverse}, {arg3_full}\n"
-                elif typ == 'DS':
-                    reg1_reverse = self._register_reverse(arg1, byte_index)
+            # depending on the type, decode the instruction and add to the text. Notice the default case is upper-case.
+            if typ == 'DSS':
+                reg1_reverse = self._register_reverse(arg1, byte_index)
+                reg2_reverse = self._register_reverse(arg2, byte_index)
+                reg3_reverse = self._register_reverse(arg3, byte_index)
 
-                    arg2_full = word & 0x00_00_FF_FF 
+                lines.append(f"{opcode_reversed} {reg1_reverse}, {reg2_reverse}, {reg3_reverse}")
+            elif typ == 'DSI':
+                reg1_reverse = self._register_reverse(arg1, byte_index)
+                reg2_reverse = self._register_reverse(arg2, byte_index)
+                arg3_full = word & 0x00_00_00_FF 
 
-                    reg2_reverse = self._register_reverse(arg2_full, byte_index)
+                lines.append(f"{opcode_reversed} {reg1_reverse}, {reg2_reverse}, {arg3_full}")
+            elif typ == 'DS':
+                reg1_reverse = self._register_reverse(arg1, byte_index)
 
-                    text += f"{opcode_reversed} {reg1_reverse}, {reg2_reverse}\n"
-                elif typ == 'DI':
-                    reg1_reverse = self._register_reverse(arg1, byte_index)
-                    arg2_full = word & 0x00_00_FF_FF 
+                arg2_full = word & 0x00_00_FF_FF 
 
-                    text += f"{opcode_reversed} {reg1_reverse}, {arg2_full}\n"
-                elif typ == 'I':
-                    reg1_reverse = self._register_reverse(arg1, byte_index)
-                    arg1_full = word & 0x00_FF_FF_FF 
+                reg2_reverse = self._register_reverse(arg2_full, byte_index)
 
-                    text += f"{opcode_reversed} {arg1_full}\n"
-    
-        # open the file to write the decoded instructions
-        with open(output_file_name, "w") as file:
-            file.write(text)
+                lines.append(f"{opcode_reversed} {reg1_reverse}, {reg2_reverse}")
+            elif typ == 'DI':
+                reg1_reverse = self._register_reverse(arg1, byte_index)
+                arg2_full = word & 0x00_00_FF_FF 
+
+                lines.append(f"{opcode_reversed} {reg1_reverse}, {arg2_full}")
+            elif typ == 'I':
+                reg1_reverse = self._register_reverse(arg1, byte_index)
+                arg1_full = word & 0x00_FF_FF_FF 
+
+                lines.append(f"{opcode_reversed} {arg1_full}")
+
+        return ''.join(line + '\n' for line in lines)
+
+    def decode_bulk(self, input_file_name='isa-encoder-output', output_file_name='isa-decoder-output', lower_case=False, labels=None):
+        """
+            Like decode, but decodes the whole file at once with numpy (look at disassembler.py), which is much faster
+            for large files, and recovers the labels of branch and jump targets.
+            labels - optional label name -> byte address table (e.g. self.labels after encode) to name the labels.
+        """
+        from .disassembler import disassemble_file # numpy is needed only here
+        disassemble_file(input_file_name, output_file_name, labels, lower_case)
 
     #
     # UTILITY FUNCTIONS
     #
+    def _assemble(self, lines, relocatable=False):
+        """
+            the single pass of encode over the lines of the source (a text file object, or any iterable of lines).
+            Returns the bytecode as a memoryview and sets self.labels.
+            relocatable - if True, the label references are collected into self.relocations instead of being resolved.
+        """
+        self.labels = {}
+        self.fixups = {} # label name -> list of (byte index of the instruction, field mask, token) waiting for the label
+        self.relocations = [] if relocatable else None
+
+        bytecode = bytearray(4096)
+        byte_index = 0
+
+        registers = self.registers_dict
+        instruction_types = self._instruction_types()
+        pack_into = WORD.pack_into
+
+        # read the input, line by line
+        tokens = AssemblyLexer().stream(lines)
+        if self.optimize:
+            from .peephole import PeepholeOptimizer # imported only when used, for a quick start
+            self.optimizer = PeepholeOptimizer()
+            tokens = self.optimizer.optimize(tokens)
+
+        while (token := next(tokens)).token_type != 'EOF':
+
+            # a label is defined: patch the instructions that used it before
+            if token.token_type == 'LABEL':
+                if token.value in self.labels:
+                    raise SyntaxError(f"duplicate label {token.value} at line {token.line}")
+                self.labels[token.value] = byte_index
+
+                for position, mask, _ in self.fixups.pop(token.value, ()):
+                    pack_into(bytecode, position, WORD.unpack_from(bytecode, position)[0] | (byte_index & mask))
+                continue
+
+            elif token.token_type != 'OPCODE':
+                raise SyntaxError(f"unknown token {token}")
+
+            # opcode byte representation and its type:
+            # DSS (8,8,8,8), DSI (8,8,8,8), DS (8,8,16), DI (8,8,16), I (8,24)
+            opcode, opcode_type = instruction_types[token.value]
+
+            # check if all arguments are present
+            args = tuple(itertools.islice(tokens, OPERANDS[opcode_type]))
+            if len(args) < OPERANDS[opcode_type] or args[-1].token_type == 'EOF':
+                raise SyntaxError(f"incomplete instruction with opcode {opcode} at line {token.line}")
+
+            # convert names into register bytecode and make a single 32 bit instruction
+            # notice : arg2 for DS and DI, also arg1 for I, are masked correctly and not shifted in order to make a correct instruction
+            if opcode_type == 'DSS':
+                word = registers[args[0].value] << 16 | registers[args[1].value] << 8 | registers[args[2].value]
+            elif opcode_type == 'DSI':
+                word = (registers[args[0].value] << 16 | registers[args[1].value] << 8
+                        | self._immediate(args[2], 8, byte_index, called_from='DSI'))
+            elif opcode_type == 'DS':
+                word = registers[args[0].value] << 16 | registers[args[1].value]
+            elif opcode_type == 'DI':
+                word = registers[args[0].value] << 16 | self._immediate(args[1], 16, byte_index, called_from='DI')
+            else:
+                # 24 bit number
+                word = self._immediate(args[0], 24, byte_index, called_from='I')
+
+            if byte_index == len(bytecode):
+                bytecode.extend(bytes(len(bytecode)))
+            pack_into(bytecode, byte_index, opcode << 24 | word)
+            byte_index += 4
+
+        # labels which were used, but never defined
+        if self.fixups:
+            raise RuntimeError(f"no known label {next(iter(self.fixups.values()))[0][2]}")
+
+        return memoryview(bytecode)[:byte_index]
+
     def _opcode_reverse(self,number:int, error_occurance_place):
         for name, val in self.opcodes_dict.items():
             if val == number:
@@ -258,6 +315,28 @@ class ISA_compiler:
             else:
                 return 'DSS'
     
+    _instruction_table = None
+
+    def _instruction_types(self):
+        """ opcode name -> (opcode byte, instruction type). Built on the first use and shared by all the instances. """
+        if ISA_compiler._instruction_table is None:
+            ISA_compiler._instruction_table = {name: (opcode, self._find_opcode_type(opcode)) for name, opcode in self.opcodes_dict.items()}
+        return ISA_compiler._instruction_table
+
+    def _immediate(self, token, bits, byte_index, called_from):
+        """
+            returns the masked immediate field. A label that isn't defined yet goes on the fixup list and the field stays 0.
+            When assembling an object, every label goes on the relocation list.
+        """
+        mask = (1 << bits) - 1
+        if token.token_type == 'IDENTIFIER' and self.relocations is not None:
+            self.relocations.append(Relocation(byte_index, bits, token.value))
+            return 0
+        if token.token_type == 'IDENTIFIER' and token.value not in self.labels:
+            self.fixups.setdefault(token.value, []).append((byte_index, mask, token))
+            return 0
+        return self._label_or_numeric(token, bits, called_from) & mask
+
     def _label_or_numeric(self, token, bits, called_from):
         if token.token_type == 'IDENTIFIER':
             if token.value in self.labels:
@@ -276,7 +355,8 @@ class ISA_compiler:
             raise SyntaxError(f"Compilation error from {called_from}: unknown label or numeric token {token}")
 
 
-isa_compiler = ISA_compiler()
+if __name__ == "__main__":
+    isa_compiler = ISA_compiler()
 
-isa_compiler.encode('test_input.asm', 'output')
-isa_compiler.decode('output', 'decoded')
\ No newline at end of file
+    isa_compiler.encode('test_input.asm', 'output')
+    isa_compiler.decode('output', 'decoded')
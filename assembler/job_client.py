@@ -0,0 +1,125 @@
+#########################################################
+#   Simulation job client. Created on 18/10/26
+#   Intent: Client library of job_server.py. A single connection can have many jobs in flight; every submit returns
+#           the result dictionary of its job (look at the protocol in job_server.py), with the trace file bytes
+#           collected into result['trace'] if the job asked for a trace.
+#
+#           Usage:
+#               async with await SimulationClient.connect(unix='/tmp/simulator.sock') as client:
+#                   result = await client.submit(program_bytes, max_instructions=10000)
+#
+#               or, without asyncio: run_job(program_bytes, unix='/tmp/simulator.sock')
+
+import asyncio
+import base64
+import itertools
+import json
+
+# maximal size of a single message. Program images and traces are sent whole.
+MESSAGE_LIMIT = 256 * 1024 * 1024
+
+
+class SimulationClient:
+    """
+        Connect with SimulationClient.connect(unix=path) or SimulationClient.connect(host=..., port=...).
+
+        * functions interface - submit, close.
+    """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count()
+        self.pending = {}   # job id -> future of the result
+        self.traces = {}    # job id -> list of the received trace chunks
+        self.receiver = asyncio.create_task(self._receive())
+
+    @classmethod
+    async def connect(cls, unix=None, host='127.0.0.1', port=8765):
+        if unix is not None:
+            reader, writer = await asyncio.open_unix_connection(unix, limit=MESSAGE_LIMIT)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=MESSAGE_LIMIT)
+        return cls(reader, writer)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def submit(self, program, registers=None, ram=None, ram_address=0, ram_size=256, max_instructions=None,
+                     engine='interpreter', trace=False, dump_ram=None, detect_loops=False):
+        """
+            sends the job and waits for its result.
+            program and ram are bytes-like images, registers a list of 32 values, dump_ram a (start, end) range to return.
+        """
+        job_id = next(self.ids)
+        job = {'id': job_id, 'program': base64.b64encode(program).decode('ascii'), 'ram_address': ram_address,
+               'ram_size': ram_size, 'engine': engine, 'trace': trace}
+        if registers is not None:
+            job['registers'] = list(registers)
+        if ram is not None:
+            job['ram'] = base64.b64encode(ram).decode('ascii')
+        if max_instructions is not None:
+            job['max_instructions'] = max_instructions
+        if dump_ram is not None:
+            job['dump_ram'] = list(dump_ram)
+        if detect_loops:
+            job['detect_loops'] = True
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[job_id] = future
+
+        self.writer.write(json.dumps(job).encode('utf-8') + b'\n')
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        self.receiver.cancel()
+
+    #
+    # UTILITY FUNCTIONS
+    #
+    async def _receive(self):
+        try:
+            while line := await self.reader.readline():
+                message = json.loads(line)
+                job_id = message.get('id')
+
+                if message.get('type') == 'trace':
+                    self.traces.setdefault(job_id, []).append(base64.b64decode(message['data']))
+                    continue
+
+                if message.get('ram') is not None:
+                    message['ram'] = base64.b64decode(message['ram'])
+                if job_id in self.traces:
+                    message['trace'] = b''.join(self.traces.pop(job_id))
+
+                future = self.pending.pop(job_id, None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+                elif job_id is None:
+                    # the server couldn't parse a job, so it can't say which one
+                    raise ConnectionError(message.get('error'))
+        except Exception as e:
+            error = e
+        else:
+            error = ConnectionError("Connection closed by the server")
+
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pending.clear()
+
+
+def run_job(program, unix=None, host='127.0.0.1', port=8765, **job):
+    """ runs a single job without asyncio. Opens a new connection, so prefer SimulationClient for many jobs. """
+    async def run():
+        async with await SimulationClient.connect(unix, host, port) as client:
+            return await client.submit(program, **job)
+    return asyncio.run(run())
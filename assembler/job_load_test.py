@@ -0,0 +1,112 @@
+#########################################################
+#   Job server load test. Created on 18/10/26
+#   Intent: Sends many simulation jobs to job_server.py from several concurrent connections and reports
+#           the throughput (jobs/s) and the latency percentiles of the jobs.
+#
+#           Usage: python -m assembler.job_load_test examples/gcd.asm [--unix /tmp/simulator.sock | --host ... --port ...]
+#                                          [--jobs 1000] [--connections 8] [--in-flight 16] [--spawn]
+#           --spawn starts a server in a subprocess for the duration of the test.
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from .isa_compiler import ISA_compiler
+from .job_client import SimulationClient
+
+
+def assemble(assembly_file):
+    return ISA_compiler().assemble_file(assembly_file)[0]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def load_test(program, jobs, connections, in_flight, connect_arguments, max_instructions=None):
+    """ returns (elapsed seconds, list of job latencies in seconds, number of failed jobs) """
+    latencies = []
+    failures = 0
+    remaining = iter(range(jobs))
+
+    async def connection_worker():
+        nonlocal failures
+        async with await SimulationClient.connect(**connect_arguments) as client:
+            async def job_worker():
+                nonlocal failures
+                for _ in remaining:
+                    start = time.perf_counter()
+                    result = await client.submit(program, max_instructions=max_instructions)
+                    latencies.append(time.perf_counter() - start)
+                    failures += not result['ok']
+
+            await asyncio.gather(*(job_worker() for _ in range(in_flight)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(connection_worker() for _ in range(connections)))
+    return time.perf_counter() - start, latencies, failures
+
+
+def wait_for_server(connect_arguments, timeout=30):
+    async def try_connect():
+        client = await SimulationClient.connect(**connect_arguments)
+        await client.close()
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            asyncio.run(try_connect())
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the simulation job server")
+    parser.add_argument('program', help="assembly file simulated by every job")
+    parser.add_argument('--unix', default=None)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--jobs', type=int, default=1000)
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--in-flight', type=int, default=16, help="jobs waiting for their result per connection")
+    parser.add_argument('--max-instructions', type=int, default=None)
+    parser.add_argument('--spawn', action='store_true', help="start a server for the test")
+    parser.add_argument('--workers', type=int, default=None, help="workers of the spawned server")
+    args = parser.parse_args()
+
+    connect_arguments = {'unix': args.unix} if args.unix is not None else {'host': args.host, 'port': args.port}
+
+    server = None
+    if args.spawn:
+        # the server runs as a module of this package, which must be importable in the subprocess too
+        package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        environment = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_parent, os.environ.get('PYTHONPATH')])))
+        command = [sys.executable, '-m', f"{__package__}.job_server"]
+        command += ['--unix', args.unix] if args.unix is not None else ['--host', args.host, '--port', str(args.port)]
+        if args.workers is not None:
+            command += ['--workers', str(args.workers)]
+        server = subprocess.Popen(command, stdout=subprocess.DEVNULL, env=environment)
+
+    try:
+        if server is not None:
+            wait_for_server(connect_arguments)
+
+        elapsed, latencies, failures = asyncio.run(load_test(assemble(args.program), args.jobs, args.connections,
+                                                             args.in_flight, connect_arguments, args.max_instructions))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    latencies.sort()
+    print(f"{len(latencies)} jobs ({failures} failed) in {elapsed:.3f}s, {len(latencies) / elapsed:.1f} jobs/s")
+    print("latency: " + ', '.join(f"p{int(fraction * 100)} {1000 * percentile(latencies, fraction):.2f}ms"
+                                 for fraction in (0.5, 0.9, 0.99)) + f", max {1000 * max(latencies, default=0):.2f}ms")
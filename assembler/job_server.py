@@ -0,0 +1,266 @@
+#########################################################
+#   Simulation job server. Created on 18/10/26
+#   Intent: A long-lived server running simulation jobs, so that CI workers and tools don't pay the python startup
+#           and the module imports for every simulation. Listens on a Unix socket or TCP.
+#
+#           Protocol: newline separated JSON messages in both directions. Binary data is base64 encoded.
+#               job:     {"id": any, "program": program image, "registers": [32 values] (optional),
+#                         "ram": image (optional), "ram_address": where the RAM image goes (default 0),
+#                         "ram_size": bytes (default 256), "max_instructions": instruction budget (optional),
+#                         "engine": "interpreter" or "blocks", "trace": true to get the binary trace (trace_recorder.py),
+#                         "dump_ram": [start, end] to get a RAM range back,
+#                         "detect_loops": true to stop an infinite loop (loop_detector.py, interpreter engine only)}
+#               replies: {"id", "type": "trace", "data": chunk}    zero or more chunks of the trace file, in order
+#                        {"id", "type": "result", "ok", "error", "registers", "pc", "instruction_count",
+#                         "fused_instructions", "loop": [start, end, instructions] or null, "ram", "seconds"}
+#           A connection can send many jobs without waiting. Results are streamed back as soon as every job finishes,
+#           so they may come in a different order than the jobs; match them by id (look at job_client.py).
+#           A message longer than MESSAGE_LIMIT gets an error reply with a null id, and the server stops reading the
+#           connection. It's closed once the results of its accepted jobs are sent.
+#
+#           Jobs go through a bounded queue into a process pool. When the queue is full, the server stops reading
+#           from the connections, which pushes the backpressure back to the clients.
+#
+#           Usage: python -m assembler.job_server [--unix /tmp/simulator.sock | --host 127.0.0.1 --port 8765] [--workers N] [--queue 64]
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .job_client import MESSAGE_LIMIT
+from .simulator import AssemblySimulator
+from .trace_recorder import TraceRecorder
+
+TRACE_CHUNK = 1024 * 1024
+
+
+def run_job(job):
+    """ runs a single job dictionary (see the protocol above) inside a worker process. Returns (result dict, trace bytes or None). """
+    start = time.perf_counter()
+    simulator = AssemblySimulator(ram_size=job.get('ram_size', 256))
+    trace = None
+    error = None
+
+    try:
+        if 'registers' in job:
+            registers = job['registers']
+            if len(registers) != 32:
+                raise RuntimeError(f"Expected 32 register values, got {len(registers)}")
+            simulator.registers_file[:] = [value & 0xFF_FF_FF_FF for value in registers]
+            simulator.registers_file[0] = 0
+
+        if 'ram' in job:
+            simulator.RAM.load_image(base64.b64decode(job['ram']), job.get('ram_address', 0))
+
+        max_instructions = job.get('max_instructions')
+        observers = []
+        if job.get('trace'):
+            trace_file = io.BytesIO()
+            recorder = TraceRecorder(trace_file)
+            observers.append(recorder)
+
+        try:
+            simulator.simulate(base64.b64decode(job['program']), engine=job.get('engine', 'interpreter'), observers=observers,
+                               early_stopping=max_instructions is not None, max_iterations=max_instructions if max_instructions is not None else 2**32,
+                               detect_loops=job.get('detect_loops', False))
+        finally:
+            if job.get('trace'):
+                recorder.close()
+                trace = trace_file.getvalue()
+
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    result = {
+        'id': job.get('id'), 'type': 'result', 'ok': error is None, 'error': error,
+        'registers': list(simulator.registers_file),
+        'pc': getattr(simulator, 'pc', 0),
+        'instruction_count': getattr(simulator, 'instruction_count', 0),
+        'fused_instructions': getattr(simulator, 'fused_instructions', 0),
+        'loop': list(simulator.detected_loop) if getattr(simulator, 'detected_loop', None) else None,
+        'ram': None,
+    }
+    if 'dump_ram' in job and error is None:
+        start_address, end_address = job['dump_ram']
+        result['ram'] = base64.b64encode(bytes(simulator.RAM.dump_range(start_address, end_address))).decode('ascii')
+    result['seconds'] = time.perf_counter() - start
+    return result, trace
+
+
+class JobServer:
+    """
+        * workers    - number of worker processes, by default the number of cores.
+        * queue_size - maximal number of jobs waiting for a worker.
+
+        * functions interface - serve_unix, serve_tcp, close.
+    """
+    def __init__(self, workers=None, queue_size=64):
+        self.workers = workers or os.cpu_count()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.pool = self._new_pool()
+        self.server = None
+        self.tasks = []
+        self.completed = 0
+
+    async def serve_unix(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = await asyncio.start_unix_server(self._handle_connection, path=path, limit=MESSAGE_LIMIT)
+        await self._serve()
+
+    async def serve_tcp(self, host='127.0.0.1', port=8765):
+        self.server = await asyncio.start_server(self._handle_connection, host, port, limit=MESSAGE_LIMIT)
+        await self._serve()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for task in self.tasks:
+            task.cancel()
+        # waits for the running jobs, so that no worker process outlives the server
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    #
+    # UTILITY FUNCTIONS
+    #
+    async def _serve(self):
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        async with self.server:
+            await self.server.serve_forever()
+
+    def _new_pool(self):
+        # the workers are started on the first job. Forked ones would inherit the open client sockets,
+        # which then stay open after the server closes them, so they're spawned.
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    async def _worker(self):
+        """ takes the jobs from the queue and runs them in the process pool, one at a time """
+        loop = asyncio.get_running_loop()
+        while True:
+            job, connection = await self.queue.get()
+            pool = self.pool
+            try:
+                result, trace = await loop.run_in_executor(pool, run_job, job)
+            except Exception as e: # the worker process died, or the job couldn't be pickled
+                result, trace = {'id': job.get('id'), 'type': 'result', 'ok': False, 'error': f"{type(e).__name__}: {e}"}, None
+                if isinstance(e, BrokenProcessPool) and self.pool is pool:
+                    # a broken pool fails every job, so the next ones go to a new one
+                    self.pool = self._new_pool()
+                    pool.shutdown(wait=False)
+
+            self.completed += 1
+            self.queue.task_done()
+            await connection.send_result(result, trace)
+
+    async def _handle_connection(self, reader, writer):
+        connection = _Connection(writer)
+        try:
+            while line := await reader.readline():
+                try:
+                    job = json.loads(line)
+                    if not isinstance(job, dict) or 'program' not in job:
+                        raise ValueError("a job must be an object with a 'program'")
+                except ValueError as e:
+                    await connection.send({'id': None, 'type': 'result', 'ok': False, 'error': f"Invalid job: {e}"})
+                    continue
+
+                # blocks while the queue is full, so the connection isn't read any further
+                connection.pending += 1
+                await self.queue.put((job, connection))
+        except (ValueError, asyncio.LimitOverrunError): # the message is longer than MESSAGE_LIMIT
+            await connection.send({'id': None, 'type': 'result', 'ok': False,
+                                   'error': f"Invalid job: a message is longer than {MESSAGE_LIMIT} bytes"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            await connection.close()
+
+
+class _Connection:
+    """ serializes the writes of the worker tasks into a single client connection """
+    def __init__(self, writer):
+        self.writer = writer
+        self.lock = asyncio.Lock()
+        self.pending = 0 # the jobs in the queue or running, whose results aren't sent yet
+        self.done = asyncio.Event()
+
+    async def send(self, message):
+        async with self.lock:
+            await self._write(message)
+
+    async def send_result(self, result, trace):
+        async with self.lock:
+            if trace is not None:
+                for position in range(0, len(trace), TRACE_CHUNK):
+                    chunk = base64.b64encode(trace[position:position + TRACE_CHUNK]).decode('ascii')
+                    await self._write({'id': result['id'], 'type': 'trace', 'data': chunk})
+            await self._write(result)
+        self.pending -= 1
+        if not self.pending:
+            self.done.set()
+
+    async def close(self):
+        """ closes the connection once the results of all its jobs are sent """
+        if self.pending:
+            self.done.clear()
+            await self.done.wait()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def _write(self, message):
+        if self.writer.is_closing():
+            return
+        self.writer.write(json.dumps(message).encode('utf-8') + b'\n')
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+
+
+async def main(args):
+    server = JobServer(args.workers, args.queue)
+
+    # SIGTERM (e.g. Popen.terminate) stops serving like Ctrl+C, so that close() shuts the worker processes down
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError: # no signal handlers in the Windows event loop
+        pass
+
+    try:
+        if args.unix is not None:
+            print(f"Serving on {args.unix} with {server.workers} workers", flush=True)
+            await server.serve_unix(args.unix)
+        else:
+            print(f"Serving on {args.host}:{args.port} with {server.workers} workers", flush=True)
+            await server.serve_tcp(args.host, args.port)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve simulation jobs over a Unix socket or TCP")
+    parser.add_argument('--unix', default=None, help="Unix socket path. If not given, TCP is used")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None, help="number of processes, by default the number of cores")
+    parser.add_argument('--queue', type=int, default=64, help="maximal number of jobs waiting for a worker")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
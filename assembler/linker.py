@@ -0,0 +1,138 @@
+#########################################################
+#   Linker file. Created on 18/10/26
+#   Intent: Combines relocatable object files (object_file.py) into a single bytecode program, so that a program
+#           can be split into several .asm files.
+#
+#           The objects are placed one after another in the given order, so the first one starts at PC 0.
+#           Every label defined in any of the files can be used in all of them; a label defined twice is an error.
+#           The relocations are then applied: the final address of the label goes into the immediate field,
+#           masked to its width like the assembler masks it.
+#
+#           build() assembles the .asm files into objects first. Only the sources which changed since their object was
+#           written are assembled again, on a process pool when there's more than one. So are the objects written by
+#           another version of the assembler or with another opcode table (the fingerprint in the object's header).
+#
+#           Usage: python -m assembler.linker main.asm library.asm [other.o ...] [-o program] [--objects DIRECTORY] [--workers N]
+
+import argparse
+import hashlib
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+from .isa_compiler import ISA_compiler, assembler_fingerprint
+from .object_file import read_assembler, read_object
+
+WORD = struct.Struct(">I")
+
+
+def link(objects, names=None):
+    """
+        links the list of ObjectFiles. names - optional file names of the objects, for the error messages.
+        Returns (bytecode, labels), labels being label name -> final byte address.
+    """
+    names = names or [f"object {index}" for index in range(len(objects))]
+
+    # place the objects and collect their symbols
+    labels = {}
+    defined_in = {}
+    bases = []
+    base = 0
+    for obj, name in zip(objects, names):
+        bases.append(base)
+        for symbol, offset in obj.symbols.items():
+            if symbol in labels:
+                raise RuntimeError(f"duplicate label {symbol} in {defined_in[symbol]} and {name}")
+            labels[symbol] = base + offset
+            defined_in[symbol] = name
+        base += len(obj.code)
+
+    bytecode = bytearray(b''.join(obj.code for obj in objects))
+
+    # apply the relocations
+    for obj, name, base in zip(objects, names, bases):
+        for offset, bits, symbol in obj.relocations:
+            if symbol not in labels:
+                raise RuntimeError(f"no known label {symbol} in {name}")
+            position = base + offset
+            WORD.pack_into(bytecode, position, WORD.unpack_from(bytecode, position)[0] | (labels[symbol] & ((1 << bits) - 1)))
+
+    return bytes(bytecode), labels
+
+
+def link_files(object_file_names, output_file_name='isa-encoder-output'):
+    """ links the object files into the bytecode file. Returns the labels. """
+    bytecode, labels = link([read_object(name) for name in object_file_names], object_file_names)
+    with open(output_file_name, "wb") as f:
+        f.write(bytecode)
+    return labels
+
+
+def object_path(source_file_name, object_directory=None):
+    """ 'name.asm' -> 'name.o' next to it, or in object_directory, with a hash of the source path against name clashes """
+    stem = os.path.splitext(os.path.basename(source_file_name))[0]
+    if object_directory is None:
+        return os.path.join(os.path.dirname(source_file_name), stem + '.o')
+
+    path_hash = hashlib.sha1(os.path.abspath(source_file_name).encode('utf-8')).hexdigest()[:8]
+    return os.path.join(object_directory, f"{stem}-{path_hash}.o")
+
+
+def assemble_object(source_file_name, object_file_name):
+    """ assembles a single source into its object. Runs inside a worker process. """
+    ISA_compiler().encode_object(source_file_name, object_file_name)
+    return object_file_name
+
+
+def is_stale(source_file_name, object_file_name):
+    """ whether the object is missing, older than its source, or written by another assembler """
+    if not os.path.exists(object_file_name) or os.path.getmtime(object_file_name) < os.path.getmtime(source_file_name):
+        return True
+    try:
+        return read_assembler(object_file_name) != assembler_fingerprint()
+    except (RuntimeError, OSError): # an older object format, or an unreadable file
+        return True
+
+
+def build(input_file_names, output_file_name='isa-encoder-output', object_directory=None, workers=None):
+    """
+        assembles the .asm inputs which changed since their objects were written (or whose objects are stale, see is_stale), and links them with the other
+        inputs (object files) in the given order. Returns (labels, list of the assembled sources).
+    """
+    if object_directory is not None:
+        os.makedirs(object_directory, exist_ok=True)
+
+    object_names = []
+    stale = []
+    for name in input_file_names:
+        if not name.endswith('.asm'):
+            object_names.append(name)
+            continue
+
+        object_name = object_path(name, object_directory)
+        object_names.append(object_name)
+        if is_stale(name, object_name):
+            stale.append((name, object_name))
+
+    if len(stale) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers or min(len(stale), os.cpu_count())) as executor:
+            for future in [executor.submit(assemble_object, source, obj) for source, obj in stale]:
+                future.result()
+    else:
+        for source, obj in stale:
+            assemble_object(source, obj)
+
+    return link_files(object_names, output_file_name), [source for source, _ in stale]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assemble and link several assembly and object files into one program")
+    parser.add_argument('inputs', nargs='+', help=".asm sources and .o objects, in the order of the program")
+    parser.add_argument('-o', '--output', default='isa-encoder-output')
+    parser.add_argument('--objects', default=None, help="directory of the objects, by default next to the sources")
+    parser.add_argument('--workers', type=int, default=None, help="processes assembling the changed sources")
+    args = parser.parse_args()
+
+    labels, assembled = build(args.inputs, args.output, args.objects, args.workers)
+    print(f"Assembled {len(assembled)} of {sum(name.endswith('.asm') for name in args.inputs)} sources, "
+          f"linked {len(args.inputs)} files into {args.output}")
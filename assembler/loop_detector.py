@@ -0,0 +1,117 @@
+#########################################################
+#   Loop detector file. Created on 18/10/26
+#   Intent: Finds programs stuck in an infinite loop. The machine is deterministic, so if it reaches the exact same
+#           state (PC, registers and RAM) twice, it runs the same instructions between them forever.
+#
+#           The state is only compared at the targets of taken backward branches and jumps, which every loop passes.
+#           Comparing the full state there would cost as much as the loop itself, so the detector keeps a hash of it:
+#               registers - hashed directly, they are only 32 values.
+#               RAM       - hashed incrementally. Every byte has the term hash((address, value)), and the memory hash is
+#                           the XOR of the terms of the changed bytes. Stores only mark their bytes dirty; the hash is
+#                           updated for the dirty bytes at the next check, so it never scans the memory.
+#           Only a single state is remembered, and it's replaced at power-of-two distances (Brent's cycle detection),
+#           so the memory cost is constant however long the program runs. A hash match is verified against the saved
+#           registers and RAM, so a reported loop is always an exactly repeated state.
+#
+#           It's a simulator observer, which simulate(detect_loops=True) adds by itself. When it finds a loop the
+#           simulation stops and the loop is kept in simulator.detected_loop.
+
+from collections import namedtuple
+
+from . import opcodes as op
+
+STORES = {op.Opcode.SB, op.Opcode.SH, op.Opcode.SW}
+
+# start, end   - the lowest and the highest byte address of the looping code.
+# instructions - the number of instructions of a single repetition.
+Loop = namedtuple('Loop', ['start', 'end', 'instructions'])
+
+
+class LoopDetected(Exception):
+    """ raised by LoopDetector.on_step. The simulator stops at next_cursor_byte and keeps the loop in detected_loop. """
+    def __init__(self, loop, next_cursor_byte):
+        super().__init__(f"Infinite loop between {loop.start:#06x} and {loop.end:#06x}, "
+                         f"repeating every {loop.instructions} instructions")
+        self.loop = loop
+        self.next_cursor_byte = next_cursor_byte
+
+
+class LoopDetector:
+    """
+        * functions interface - before_step, on_step.
+        \t before_step - marks the RAM bytes of stores dirty.
+        \t on_step     - checks the state after every taken backward branch or jump. Raises LoopDetected.
+
+        checks is the number of compared states.
+    """
+    def __init__(self):
+        self.steps = 0            # executed instructions
+        self.checks = 0
+
+        self.memory_hash = 0
+        self.first_values = {}    # RAM address -> value before the first store to it
+        self.values = {}          # RAM address -> value included in memory_hash
+        self.dirty = set()        # RAM addresses stored to since the last check
+
+        self.saved = None         # (pc, registers, memory hash) of the remembered state
+        self.saved_values = {}    # values of the remembered state, to verify a hash match
+        self.saved_step = 0
+        self.power = 1            # Brent's cycle detection: the remembered state is replaced every power checks
+        self.distance = 0
+        self.start = self.end = 0 # the code range executed since the remembered state
+
+    def before_step(self, simulator, cursor_byte, word):
+        if word >> 24 not in STORES:
+            return
+
+        access = simulator.memory_access(word)
+        if access is None: # a malformed register byte, the simulator reports it
+            return
+        address, width, _ = access
+        size = len(simulator.RAM)
+        for byte_address in range(address, min(address + width, size)): # a store outside of the RAM faults anyway
+            if byte_address not in self.values:
+                self.first_values[byte_address] = self.values[byte_address] = simulator.RAM.read_byte(byte_address)
+            self.dirty.add(byte_address)
+
+    def on_step(self, simulator, cursor_byte, word, next_cursor_byte):
+        self.steps += 1
+        if next_cursor_byte > cursor_byte:
+            return
+
+        self.checks += 1
+        self._update_memory_hash(simulator)
+        state = (next_cursor_byte, tuple(simulator.registers_file), self.memory_hash)
+        self.start = min(self.start, next_cursor_byte)
+        self.end = max(self.end, cursor_byte)
+
+        if state == self.saved and self._same_memory():
+            raise LoopDetected(Loop(self.start, self.end, self.steps - self.saved_step), next_cursor_byte)
+
+        self.distance += 1
+        if self.saved is None or self.distance == self.power:
+            self.saved = state
+            self.saved_values = dict(self.values)
+            self.saved_step = self.steps
+            self.power *= 2
+            self.distance = 0
+            self.start, self.end = next_cursor_byte, cursor_byte
+
+    #
+    # UTILITY FUNCTIONS
+    #
+    def _update_memory_hash(self, simulator):
+        values = self.values
+        for address in self.dirty:
+            value = simulator.RAM.read_byte(address)
+            old = values[address]
+            if value != old:
+                self.memory_hash ^= hash((address, old)) ^ hash((address, value))
+                values[address] = value
+        self.dirty.clear()
+
+    def _same_memory(self):
+        """ whether the RAM equals the remembered one. Bytes stored to after it was remembered had their first value then. """
+        saved_values = self.saved_values
+        first_values = self.first_values
+        return all(saved_values.get(address, first_values[address]) == value for address, value in self.values.items())
@@ -0,0 +1,156 @@
+#########################################################
+#   Macro-op fusion file. Created on 18/10/26
+#   Intent: A fusion stage on top of the predecoded table of the simulator. Common adjacent pairs and triples of compiled
+#           code are recognized once, when the program is loaded, and run as a single superinstruction, which saves
+#           the fetch, dispatch and count of the interpreter loop for the fused instructions:
+#               SEQZ rd, rs      ; BEQ/BNEQ rd, r0, target     (compare with zero and branch, look at examples/gcd.asm)
+#               ADDI rd, rs, imm ; B* on rd, target            (step a counter and compare-branch on it)
+#               ADDI ...         ; SEQZ rd, rs ; BEQ/BNEQ rd, r0, target
+#
+#           Only instructions which can't raise are fused, so a fault always happens at the address of a single instruction.
+#           The fused entry replaces only the table entry of the first instruction of the group; a jump into the middle
+#           of a group runs the remaining instructions unfused. The architectural state after every superinstruction is
+#           exactly the state after its instructions run unfused.
+#
+#           Instructions run inside superinstructions are counted in fused_instructions, reported after every run.
+
+from . import opcodes as op
+
+MASK = 0xFF_FF_FF_FF
+
+COMPARE_BRANCHES = {op.Opcode.BEQ, op.Opcode.BNEQ}
+BRANCHES = {op.Opcode.BEQ, op.Opcode.BNEQ, op.Opcode.BLT, op.Opcode.BLE, op.Opcode.BLTS, op.Opcode.BLTES}
+
+
+class MacroFusion:
+    """
+        * simulator - the AssemblySimulator with a loaded program.
+
+        * functions interface - run, invalidate.
+        \t run        - runs the program from the byte address until it reaches the end. Returns the final address.
+        \t invalidate - refuses the groups which contain the byte address. Called when code gets overwritten.
+
+        fused_groups is the number of superinstructions in the table, fused_instructions the number of executed
+        instructions which ran inside them.
+    """
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.fused_instructions = 0
+
+        # (handler, arg1, arg2, arg3, number of instructions), indexed like simulator.decoded
+        self.table = [self._entry(index) for index in range(len(simulator.decoded))]
+        self.fused_groups = sum(entry[4] > 1 for entry in self.table)
+
+    def run(self, cursor_byte=0, end_address=None, max_instructions=None):
+        """
+            runs the fused table starting at cursor_byte, until the address reaches end_address (by default the end of the program).
+            If max_instructions is given, stops after exactly that many instructions; a group which would cross it runs unfused.
+        """
+        if end_address is None:
+            end_address = self.simulator.program_size
+
+        table = self.table
+        count = self.simulator.instruction_count
+        try:
+            if max_instructions is None:
+                while cursor_byte < end_address:
+                    handler, arg1, arg2, arg3, length = table[cursor_byte >> 2]
+                    cursor_byte = handler(arg1, arg2, arg3, cursor_byte) + 4
+                    count += length
+            else:
+                stop_count = count + max_instructions
+                decoded = self.simulator.decoded
+                while cursor_byte < end_address and count < stop_count:
+                    handler, arg1, arg2, arg3, length = table[cursor_byte >> 2]
+                    if count + length > stop_count:
+                        handler, arg1, arg2, arg3 = decoded[cursor_byte >> 2]
+                        length = 1
+                    cursor_byte = handler(arg1, arg2, arg3, cursor_byte) + 4
+                    count += length
+        finally:
+            # superinstructions never raise, so a failing instruction is never counted and the PC stays at it
+            self.simulator.pc = cursor_byte
+            self.simulator.instruction_count = count
+
+        return cursor_byte
+
+    def invalidate(self, address):
+        """ rebuilds the entries of the groups which may contain the instruction at the byte address """
+        index = address >> 2
+        for start in range(max(0, index - 2), index + 1):
+            self.table[start] = self._entry(start)
+        self.fused_groups = sum(entry[4] > 1 for entry in self.table)
+
+    #
+    # FUSION
+    #
+    def _entry(self, index):
+        """ returns the superinstruction starting at the instruction index, or the unfused entry """
+        simulator = self.simulator
+        words = simulator.program_words
+
+        opcodes = [self._opcode(index + offset) for offset in range(3)]
+
+        if opcodes[0] == op.Opcode.ADDI and opcodes[1] == op.Opcode.SEQZ and self._is_zero_branch(index + 1):
+            return self._fuse_addi(index, self._fuse_seqz_branch(index + 1))
+
+        if opcodes[0] == op.Opcode.SEQZ and self._is_zero_branch(index):
+            return self._fuse_seqz_branch(index)
+
+        if opcodes[0] == op.Opcode.ADDI and opcodes[1] in BRANCHES:
+            rd = (words[index] >> 16) & 0xFF
+            _, reg1, reg2, _ = simulator.decoded[index + 1]
+            if rd in (reg1, reg2):
+                return self._fuse_addi(index, simulator.decoded[index + 1] + (1,))
+
+        return simulator.decoded[index] + (1,)
+
+    def _opcode(self, index):
+        """ the opcode at the instruction index, or None if there's no valid instruction """
+        if index >= len(self.simulator.decoded) or self.simulator.decoded[index][0] == self.simulator._op_invalid:
+            return None
+        return self.simulator.program_words[index] >> 24
+
+    def _is_zero_branch(self, index):
+        """ whether the instruction index is SEQZ rd, rs followed by BEQ/BNEQ comparing rd with r0 """
+        if self._opcode(index + 1) not in COMPARE_BRANCHES:
+            return False
+
+        rd = (self.simulator.program_words[index] >> 16) & 0xFF
+        _, reg1, reg2, _ = self.simulator.decoded[index + 1]
+        return (reg1, reg2) in ((rd, 0), (0, rd))
+
+    def _fuse_seqz_branch(self, index):
+        registers = self.simulator.registers_file
+        _, rd, rs, _ = self.simulator.decoded[index]
+        _, _, _, target = self.simulator.decoded[index + 1]
+        # rd == r0 stays 0, so the comparison with r0 is always equal
+        taken_if_zero = self._opcode(index + 1) == op.Opcode.BNEQ
+
+        def seqz_branch(rd, rs, target, cursor_byte):
+            zero = registers[rs] == 0 and rd != 0
+            if rd:
+                registers[rd] = int(zero)
+            self.fused_instructions += 2
+            if zero == taken_if_zero:
+                return target - 4
+            return cursor_byte + 4
+
+        return (seqz_branch, rd, rs, target, 2)
+
+    def _fuse_addi(self, index, rest):
+        """ fuses ADDI at the instruction index with the entry of the following instructions """
+        registers = self.simulator.registers_file
+        _, rd, rs, imm = self.simulator.decoded[index]
+        imm = self.simulator._sign_extend(imm, 8, 32)
+        handler, arg1, arg2, arg3, length = rest
+        # an unfused rest counts itself as a single instruction, a fused one counts all of its instructions
+        fused_count = 2 if length == 1 else 1
+
+        def addi_rest(rd, rs, imm, cursor_byte):
+            if rd:
+                registers[rd] = (registers[rs] + imm) & MASK
+            self.fused_instructions += fused_count
+            return handler(arg1, arg2, arg3, cursor_byte + 4)
+
+        return (addi_rest, rd, rs, imm, length + 1)
@@ -0,0 +1,259 @@
+#########################################################
+#   Memory file. Created on 18/10/26
+#   Intent: Byte addressable RAM for the simulator. Behaves like the memory of the Verilog CPU:
+#           every address holds a single byte and half-words and words are stored in big endian order
+#           (the same order the instructions are encoded in, look at opcodes.py).
+#
+#           There are three implementations with the same interface:
+#               Memory       - a single bytearray. The fastest one, for small memories (the default 256 bytes).
+#               PagedMemory  - fixed-size pages, allocated on the first write. Untouched memory costs nothing,
+#                              so the address space can be as large as the 32 bit addresses allow.
+#               MappedMemory - a file mapped with mmap, for very large images. The OS loads the pages lazily.
+#           Use make_memory to pick one.
+#
+#           Loading an image, dumping a range or taking a snapshot is a slice operation instead of a loop over the cells.
+#           dump_pages returns only the allocated parts of the memory, so snapshots of sparse memories are cheap.
+
+import mmap
+import os
+import struct
+
+HALF = struct.Struct(">H")
+WORD = struct.Struct(">I")
+
+# memories up to this size are a single bytearray by default
+FLAT_MEMORY_LIMIT = 64 * 1024
+DEFAULT_PAGE_SIZE = 4096
+
+
+def make_memory(size=256, page_size=None, file_name=None):
+    """
+        Returns the memory of size bytes.
+        file_name - if given, the memory is a MappedMemory of that file.
+        page_size - if given, the memory is a PagedMemory with pages of that size (power of 2).
+        Otherwise small memories are a single bytearray, and memories larger than FLAT_MEMORY_LIMIT are paged.
+    """
+    if file_name is not None:
+        return MappedMemory(file_name, size)
+    if page_size is not None:
+        return PagedMemory(size, page_size)
+    if size > FLAT_MEMORY_LIMIT:
+        return PagedMemory(size, DEFAULT_PAGE_SIZE)
+    return Memory(size)
+
+
+class Memory:
+    """
+        * size - the number of bytes. Addresses go from 0 to size-1.
+
+        * functions interface:
+        \t read_byte, read_half, read_word    - read an unsigned value at the address.
+        \t write_byte, write_half, write_word - write the lowest 8, 16 or 32 bits of the value at the address.
+        \t load_image - copies a bytes-like object into the memory, starting at the address.
+        \t dump_range - returns a memoryview of the range. Doesn't copy anything, so it reflects later writes.
+        \t dump_pages - returns a list of (address, memoryview) of the allocated parts of the memory. Zero copy as well.
+        \t snapshot   - returns an immutable copy of the whole memory.
+        \t clear      - sets every byte to 0.
+
+        Accessing any byte outside of the memory raises an IndexError.
+    """
+    def __init__(self, size=256):
+        self.size = size
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+
+    def __len__(self):
+        return self.size
+
+    def read_byte(self, address):
+        self._check(address, 1)
+        return self.data[address]
+
+    def read_half(self, address):
+        self._check(address, 2)
+        return HALF.unpack_from(self.data, address)[0]
+
+    def read_word(self, address):
+        self._check(address, 4)
+        return WORD.unpack_from(self.data, address)[0]
+
+    def write_byte(self, address, value):
+        self._check(address, 1)
+        self.data[address] = value & 0xFF
+
+    def write_half(self, address, value):
+        self._check(address, 2)
+        HALF.pack_into(self.data, address, value & 0xFFFF)
+
+    def write_word(self, address, value):
+        self._check(address, 4)
+        WORD.pack_into(self.data, address, value & 0xFF_FF_FF_FF)
+
+    def load_image(self, image, address=0):
+        """ copies the bytes-like image into memory at the address. """
+        self._check(address, len(image))
+        self.view[address:address + len(image)] = image
+
+    def dump_range(self, start=0, end=None):
+        """ returns a zero-copy memoryview of bytes [start, end). Call bytes() on it to keep the current values. """
+        if end is None:
+            end = self.size
+        self._check(start, end - start)
+        return self.view[start:end]
+
+    def dump_pages(self):
+        return [(0, self.view)]
+
+    def snapshot(self):
+        return bytes(self.data)
+
+    def clear(self):
+        self.view[:] = bytes(self.size)
+
+    def _check(self, address, length):
+        if address < 0 or length < 0 or address + length > self.size:
+            raise IndexError(f"Memory access out of bounds: {length} byte(s) at address {address}. Memory size is {self.size} bytes")
+
+
+class MappedMemory(Memory):
+    """
+        Memory backed by the file_name file, mapped with mmap. The file is created or extended to size bytes if needed,
+        as a sparse file, so untouched memory doesn't take disk space either. Writes go straight into the file.
+        All of it counts as allocated: dump_pages returns the whole image, so a checkpoint copies all of it.
+        Call close() when done.
+    """
+    def __init__(self, file_name, size):
+        self.size = size
+        self.file = open(file_name, "r+b" if os.path.exists(file_name) else "w+b")
+        if os.fstat(self.file.fileno()).st_size < size:
+            self.file.truncate(size)
+
+        self.data = mmap.mmap(self.file.fileno(), size)
+        self.view = memoryview(self.data)
+
+    def clear(self):
+        for start in range(0, self.size, DEFAULT_PAGE_SIZE):
+            end = min(start + DEFAULT_PAGE_SIZE, self.size)
+            self.view[start:end] = bytes(end - start)
+
+    def close(self):
+        self.view.release()
+        self.data.close()
+        self.file.close()
+
+
+class PagedMemory(Memory):
+    """
+        Memory made of page_size byte pages (page_size must be a power of 2), allocated on the first write.
+        Reading an unallocated page returns zeros and doesn't allocate it.
+        Accesses crossing a page boundary are split into bytes.
+    """
+    def __init__(self, size, page_size=DEFAULT_PAGE_SIZE):
+        if page_size <= 0 or page_size & (page_size - 1):
+            raise RuntimeError(f"Page size must be a power of 2, got {page_size}")
+
+        self.size = size
+        self.page_size = page_size
+        self.page_shift = page_size.bit_length() - 1
+        self.page_mask = page_size - 1
+        self.pages = {} # page index -> bytearray
+
+    def read_byte(self, address):
+        self._check(address, 1)
+        page = self.pages.get(address >> self.page_shift)
+        return 0 if page is None else page[address & self.page_mask]
+
+    def read_half(self, address):
+        return self._read(address, 2, HALF)
+
+    def read_word(self, address):
+        return self._read(address, 4, WORD)
+
+    def write_byte(self, address, value):
+        self._check(address, 1)
+        self._page(address >> self.page_shift)[address & self.page_mask] = value & 0xFF
+
+    def write_half(self, address, value):
+        self._write(address, 2, HALF, value & 0xFFFF)
+
+    def write_word(self, address, value):
+        self._write(address, 4, WORD, value & 0xFF_FF_FF_FF)
+
+    def load_image(self, image, address=0):
+        """ copies the image page by page. Pages which would stay all zero are not allocated. """
+        self._check(address, len(image))
+        image = memoryview(image).cast('B')
+
+        position = 0
+        while position < len(image):
+            offset = (address + position) & self.page_mask
+            length = min(self.page_size - offset, len(image) - position)
+            chunk = image[position:position + length]
+
+            index = (address + position) >> self.page_shift
+            if index in self.pages or chunk.tobytes().strip(b'\x00'):
+                self._page(index)[offset:offset + length] = chunk
+            position += length
+
+    def dump_range(self, start=0, end=None):
+        """ returns a zero-copy memoryview if the range is inside a single allocated page, otherwise a copy as bytes. """
+        if end is None:
+            end = self.size
+        self._check(start, end - start)
+
+        index = start >> self.page_shift
+        if end - start <= self.page_size and (end - 1) >> self.page_shift == index and index in self.pages:
+            offset = start & self.page_mask
+            return memoryview(self.pages[index])[offset:offset + end - start]
+
+        return bytes(self._read_bytes(start, end - start))
+
+    def dump_pages(self):
+        return [(index << self.page_shift, memoryview(page)) for index, page in sorted(self.pages.items())]
+
+    def snapshot(self):
+        return bytes(self._read_bytes(0, self.size))
+
+    def clear(self):
+        self.pages.clear()
+
+    #
+    # UTILITY FUNCTIONS
+    #
+    def _page(self, index):
+        """ returns the page, allocating it if needed """
+        page = self.pages.get(index)
+        if page is None:
+            page = self.pages[index] = bytearray(self.page_size)
+        return page
+
+    def _read(self, address, width, packer):
+        self._check(address, width)
+        offset = address & self.page_mask
+        if offset + width <= self.page_size:
+            page = self.pages.get(address >> self.page_shift)
+            return 0 if page is None else packer.unpack_from(page, offset)[0]
+
+        return int.from_bytes(self._read_bytes(address, width), byteorder="big")
+
+    def _write(self, address, width, packer, value):
+        self._check(address, width)
+        offset = address & self.page_mask
+        if offset + width <= self.page_size:
+            packer.pack_into(self._page(address >> self.page_shift), offset, value)
+        else:
+            for i, byte in enumerate(value.to_bytes(width, byteorder="big")):
+                self.write_byte(address + i, byte)
+
+    def _read_bytes(self, address, length):
+        """ copies length bytes starting at the address into a bytearray """
+        result = bytearray(length)
+        position = 0
+        while position < length:
+            offset = (address + position) & self.page_mask
+            chunk = min(self.page_size - offset, length - position)
+            page = self.pages.get((address + position) >> self.page_shift)
+            if page is not None:
+                result[position:position + chunk] = page[offset:offset + chunk]
+            position += chunk
+        return result
@@ -0,0 +1,109 @@
+#########################################################
+#   Object file. Created on 18/10/26
+#   Intent: Relocatable object files, so that a program can be split into several .asm files, which are assembled
+#           separately (ISA_compiler.encode_object) and combined by linker.py.
+#
+#           An object holds:
+#               code        - the encoded instructions of the file, as if it started at byte address 0.
+#                             The immediate fields which refer to labels are 0.
+#               symbols     - label name -> byte offset in the code, for every label defined in the file.
+#               relocations - (offset, bits, symbol) for every label reference: the instruction at offset gets the
+#                             final address of symbol in its lowest bits (8 for DSI, 16 for DI, 24 for I), masked like
+#                             the assembler masks them.
+#               assembler   - the fingerprint of the assembler which wrote it (assembler_fingerprint in isa_compiler.py),
+#                             so that linker.py rebuilds the objects of an older assembler or opcode table.
+#
+#           Layout (big endian, like everything else in the assembler):
+#               header      - magic 'ASMO', format version (16 bits), assembler fingerprint (32 bytes),
+#                             code length in bytes (32 bits), number of symbols (32 bits), number of relocations (32 bits)
+#               code
+#               symbols     - offset (32 bits), name length (16 bits) and the UTF-8 name of every symbol
+#               relocations - offset (32 bits), bits (8 bits), name length (16 bits) and the UTF-8 name of the symbol
+
+import struct
+from collections import namedtuple
+
+MAGIC = b'ASMO'
+VERSION = 2
+
+HEADER = struct.Struct(">4sH32sIII")
+SYMBOL = struct.Struct(">IH")
+RELOCATION = struct.Struct(">IBH")
+
+ObjectFile = namedtuple('ObjectFile', ['code', 'symbols', 'relocations', 'assembler'], defaults=(bytes(32),))
+Relocation = namedtuple('Relocation', ['offset', 'bits', 'symbol'])
+
+
+def pack_object(obj):
+    """ returns the ObjectFile as bytes """
+    parts = [HEADER.pack(MAGIC, VERSION, obj.assembler, len(obj.code), len(obj.symbols), len(obj.relocations)), bytes(obj.code)]
+
+    for name, offset in obj.symbols.items():
+        encoded = name.encode('utf-8')
+        parts.append(SYMBOL.pack(offset, len(encoded)))
+        parts.append(encoded)
+
+    for offset, bits, symbol in obj.relocations:
+        encoded = symbol.encode('utf-8')
+        parts.append(RELOCATION.pack(offset, bits, len(encoded)))
+        parts.append(encoded)
+    return b''.join(parts)
+
+
+def unpack_header(data):
+    """ returns (assembler fingerprint, code length, number of symbols, number of relocations) of the packed object """
+    if len(data) < HEADER.size:
+        raise RuntimeError("Invalid object file: too short")
+
+    magic, version, assembler, code_length, symbol_count, relocation_count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise RuntimeError("Invalid object file: wrong magic")
+    if version != VERSION:
+        raise RuntimeError(f"Unsupported object file version {version}, expected {VERSION}")
+    return assembler, code_length, symbol_count, relocation_count
+
+
+def unpack_object(data):
+    """ returns the ObjectFile packed by pack_object """
+    assembler, code_length, symbol_count, relocation_count = unpack_header(data)
+
+    try:
+        position = HEADER.size
+        code = bytes(data[position:position + code_length])
+        position += code_length
+
+        symbols = {}
+        for _ in range(symbol_count):
+            offset, length = SYMBOL.unpack_from(data, position)
+            position += SYMBOL.size
+            symbols[bytes(data[position:position + length]).decode('utf-8')] = offset
+            position += length
+
+        relocations = []
+        for _ in range(relocation_count):
+            offset, bits, length = RELOCATION.unpack_from(data, position)
+            position += RELOCATION.size
+            relocations.append(Relocation(offset, bits, bytes(data[position:position + length]).decode('utf-8')))
+            position += length
+    except (struct.error, UnicodeDecodeError) as e:
+        raise RuntimeError(f"Invalid object file: {e}")
+
+    if len(code) != code_length or position != len(data):
+        raise RuntimeError("Invalid object file: wrong length")
+    return ObjectFile(code, symbols, relocations, assembler)
+
+
+def write_object(obj, file_name):
+    with open(file_name, "wb") as f:
+        f.write(pack_object(obj))
+
+
+def read_object(file_name):
+    with open(file_name, "rb") as f:
+        return unpack_object(f.read())
+
+
+def read_assembler(file_name):
+    """ returns the assembler fingerprint of the object file, reading only its header """
+    with open(file_name, "rb") as f:
+        return unpack_header(f.read(HEADER.size))[0]
@@ -2,6 +2,7 @@
 # Intent: Store all opcodes byte representations in a convenient way. Also contains explanations of the low-level design of ISA.
 #           For high-level explanation visit explan_assembly.md
 
+import functools
 from enum import IntEnum
 
 # first 3 bits are always free. In a sense, you can have at least 8 different opcodes for each type.
@@ -157,3 +158,15 @@ class Opcode(IntEnum):
     JAL   = 0B00000_001 | JUMPING_BIT | IMMEDIATE_BIT # DI type! Jumps to the immediate value and saves the return address in the destination register.
 
     J     = 0B00000_010 | JUMPING_BIT | IMMEDIATE_BIT # I type!  Jumps to the immediate value (24 bits)
+
+
+@functools.lru_cache(maxsize=None)
+def lookup_tables():
+    """
+        returns (opcode name -> value, opcode value -> name, register name -> number).
+        Built on the first call and shared by the assemblers, lexers and simulators, so creating them doesn't iterate
+        the enum again. Don't modify the tables.
+    """
+    return ({opcode.name: opcode.value for opcode in Opcode},
+            {opcode.value: opcode.name for opcode in Opcode},
+            {'r'+str(i): i for i in range(32)})
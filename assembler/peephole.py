@@ -0,0 +1,285 @@
+#########################################################
+#   Peephole optimizer file. Created on 18/10/26
+#   Intent: An optional pass between AssemblyLexer and the encoder (ISA_compiler(optimize=True)), which removes the
+#           instructions that can't change the result of the program. Hand-written and generated assembly is full of them.
+#
+#           It works on the token stream, so the labels stay where they were and the encoder computes all the addresses
+#           and branch targets after the removal, as usual. The rewrites, in the order they're applied:
+#               no-op       - 'add rX, rX, r0', 'addi rX, rX, 0', 'or rX, rX, rX', shifts by 0 and the like.
+#               dead write  - an instruction whose result is overwritten before anything reads it, e.g. the first of
+#                             'lli r1, 5' 'lli r1, 7', or of 'add r1, r2, r3' 'lui r1, 0' 'lli r1, 0'. Writes into r0 too.
+#               jump to next - 'j label' and branches, whose label is right after them.
+#
+#           Liveness is basic: it's computed backwards inside a basic block (the instructions between two labels, or
+#           after a branch or a jump), with every register live at the end of the block. The registers are split into
+#           their upper and lower halves, because LUI and LLI write only one half of the register and keep the other.
+#           Instructions which may fault (DIV, REM, shifts by a register, loads and stores) or change the PC are never
+#           removed, neither is NOP, which may be there on purpose. Every register is live before them, as a fault shows
+#           all the registers.
+#
+#           A branch, J or JAL to a numeric address (e.g. 'j 16') gets its address moved back by the instructions removed
+#           before it. Nothing is removed between such a jump and a later address it jumps to, until the address is reached,
+#           so that the count is known when the jump is written.
+#           JALR targets are computed at run time and aren't moved: a numeric code address built in a register (e.g. with
+#           LLI) and used by JALR lands on another instruction after a removal. Use labels there, or don't optimize.
+#
+#           The optimizer streams: it holds only the current basic block and the addresses of the removed instructions.
+#           If the input is malformed, the rest of it is passed to the encoder untouched, so that it reports the error.
+#
+#           Usage: python -m assembler.peephole program.asm [-o program] - assembles with the optimization and prints the report.
+
+import argparse
+import bisect
+import functools
+import itertools
+from collections import Counter, namedtuple
+
+from . import opcodes as op
+from .tokens import Token
+
+# the number of operand tokens of every instruction type, look at isa_compiler.py
+OPERANDS = {'DSS': 3, 'DSI': 3, 'DS': 2, 'DI': 2, 'I': 1}
+IMMEDIATES = {'NUMERIC', 'HEX', 'SIGNED', 'IDENTIFIER'}
+
+HIGH, LOW = 0, 1
+ALL_LIVE = frozenset((register, half) for register in range(1, 32) for half in (HIGH, LOW))
+
+BRANCHES = {'BEQ', 'BNEQ', 'BLT', 'BLE', 'BLTS', 'BLTES'}
+STORES = {'SB', 'SH', 'SW'}
+# a basic block ends after these
+BLOCK_ENDS = BRANCHES | {'J', 'JAL', 'JALR'}
+# their immediate is a code address
+NUMERIC_JUMPS = BRANCHES | {'J', 'JAL'}
+# the only effect of these is writing the destination register
+REMOVABLE = {'ADD', 'MUL', 'MULH', 'SLT', 'SLTS', 'SEQZ', 'AND', 'OR', 'NOT', 'XOR',
+             'ADDI', 'ANDI', 'ORI', 'XORI', 'SLLI', 'SRLI', 'SRAI', 'SLTI', 'SLTSI', 'LUI', 'LLI'}
+
+# 'name rX, rX, r0' and 'name rX, r0, rX' are no-ops
+NOOP_WITH_R0 = {'ADD', 'OR', 'XOR'}
+# 'name rX, rX, r0' is a no-op
+NOOP_WITH_R0_SECOND = {'SLL', 'SRL', 'SRA'}
+# 'name rX, rX, 0' is a no-op
+NOOP_WITH_0 = {'ADDI', 'ORI', 'XORI', 'SLLI', 'SRLI', 'SRAI'}
+# 'name rX, rX, rX' is a no-op
+NOOP_SAME = {'AND', 'OR'}
+
+# tokens  - the opcode token and its operand tokens.
+# writes  - (register, half) pairs which the instruction writes, reads - which it reads. r0 is never in them.
+# target  - the label of a J or of a branch, None for the other instructions.
+# address - the byte address of the instruction in the input, before any removal.
+Instruction = namedtuple('Instruction', ['tokens', 'name', 'writes', 'reads', 'target', 'address'])
+
+
+def _opcode_type(opcode):
+    if opcode & op.IMMEDIATE_BIT:
+        if opcode in (op.Opcode.JAL, op.Opcode.LUI, op.Opcode.LLI):
+            return 'DI'
+        return 'I' if opcode == op.Opcode.J else 'DSI'
+    return 'DS' if opcode == op.Opcode.SEQZ else 'DSS'
+
+
+@functools.lru_cache(maxsize=None)
+def _instruction_types():
+    """ opcode name -> instruction type, built on the first use """
+    return {name: _opcode_type(opcode) for name, opcode in op.lookup_tables()[0].items()}
+
+
+def _full(register):
+    return {(register, HIGH), (register, LOW)} if register else set()
+
+
+class PeepholeOptimizer:
+    """
+        * functions interface - optimize, report.
+        \t optimize - yields the tokens of the token stream, without the removed instructions.
+        \t report   - the text summary of the removed instructions.
+
+        removed - rewrite name -> the number of instructions it removed.
+    """
+    def __init__(self):
+        self.types = _instruction_types()
+        self.removed = Counter()
+        self.removed_addresses = [] # input byte addresses of the removed instructions, ascending
+        self.keep_until = 0         # nothing below this input address is removed, a numeric jump targets it
+
+    def optimize(self, tokens):
+        tokens = iter(tokens)
+        block = []
+        jump = None # a block-ending J or branch, held until it's known whether its label is right after it
+        held = [] # the labels after the jump
+        labels = set() # the labels since the last instruction
+
+        for item in self._instructions(tokens):
+            # a label starts a new basic block
+            if not isinstance(item, Instruction) and item.token_type == 'LABEL':
+                yield from self._flush(block)
+                block = []
+                labels.add(item.value)
+                if jump is None:
+                    yield item
+                else:
+                    held.append(item)
+                continue
+
+            if jump is not None:
+                if jump.target in labels and jump.address >= self.keep_until:
+                    self._remove(jump, 'jump to next')
+                else:
+                    yield from jump.tokens
+                yield from held
+                jump, held = None, []
+            labels = set()
+
+            if not isinstance(item, Instruction): # EOF, or the untouched rest of a malformed input
+                yield from self._flush(block)
+                block = []
+                yield item
+                continue
+
+            block.append(item)
+            if item.name in BLOCK_ENDS:
+                last = block.pop()
+                yield from self._flush(block)
+                block = []
+                if last.target is not None:
+                    jump = last
+                elif last.name in NUMERIC_JUMPS and last.tokens[-1].token_type != 'IDENTIFIER':
+                    yield from self._moved(last)
+                else:
+                    yield from last.tokens
+
+    def report(self):
+        if not self.removed:
+            return "removed 0 instructions"
+        details = ', '.join(f"{count} {name}" for name, count in self.removed.most_common())
+        return f"removed {sum(self.removed.values())} instructions: {details}"
+
+    #
+    # UTILITY FUNCTIONS
+    #
+    def _instructions(self, tokens):
+        """ groups the tokens into Instructions. Labels and EOF are yielded as they are, and so is everything after a malformed instruction. """
+        address = 0
+        for token in tokens:
+            if token.token_type != 'OPCODE':
+                yield token
+                if token.token_type == 'LABEL':
+                    continue
+                yield from tokens
+                return
+
+            instruction_type = self.types[token.value]
+            args = tuple(itertools.islice(tokens, OPERANDS[instruction_type]))
+            instruction = self._instruction(token, instruction_type, args, address)
+            if instruction is None:
+                yield from (token,) + args
+                yield from tokens
+                return
+            yield instruction
+            address += 4
+
+    def _instruction(self, token, instruction_type, args, address):
+        """ the Instruction of the opcode token and its operands, or None if they're malformed """
+        registers = OPERANDS[instruction_type] - (instruction_type in ('DSI', 'DI', 'I'))
+        if (len(args) < OPERANDS[instruction_type]
+                or any(arg.token_type != 'REGISTER' for arg in args[:registers])
+                or any(arg.token_type not in IMMEDIATES for arg in args[registers:])):
+            return None
+
+        name = token.value
+        numbers = [int(arg.value[1:]) for arg in args[:registers]]
+        tokens = (token,) + args
+
+        if name in BRANCHES or name in STORES:
+            return Instruction(tokens, name, set(), _full(numbers[0]) | _full(numbers[1]),
+                               args[2].value if name in BRANCHES and args[2].token_type == 'IDENTIFIER' else None, address)
+        if name == 'J':
+            return Instruction(tokens, name, set(), set(), args[0].value if args[0].token_type == 'IDENTIFIER' else None, address)
+        if name == 'LUI':
+            return Instruction(tokens, name, {(numbers[0], HIGH)} if numbers[0] else set(), set(), None, address)
+        if name == 'LLI':
+            return Instruction(tokens, name, {(numbers[0], LOW)} if numbers[0] else set(), set(), None, address)
+
+        reads = set()
+        for number in numbers[1:]:
+            reads |= _full(number)
+        return Instruction(tokens, name, _full(numbers[0]), reads, None, address)
+
+    def _moved(self, instruction):
+        """ the tokens of a jump to a numeric address, with the address moved back by the removed instructions before it """
+        target = self._value(instruction.tokens[-1])
+        if target > instruction.address:
+            # the instructions up to the target aren't removed, so only the ones removed so far move it
+            self.keep_until = max(self.keep_until, target)
+        moved = target - 4 * bisect.bisect_left(self.removed_addresses, target)
+
+        token = instruction.tokens[-1]
+        return instruction.tokens[:-1] + (Token('NUMERIC', str(moved), token.line, token.column),)
+
+    def _remove(self, instruction, rewrite):
+        self.removed[rewrite] += 1
+        self.removed_addresses.append(instruction.address)
+
+    def _flush(self, block):
+        """ yields the tokens of the basic block which are left after the no-op and the dead write rewrites """
+        kept = []
+        noops = set()
+        for instruction in block:
+            if instruction.address >= self.keep_until and self._is_noop(instruction):
+                noops.add(instruction.address)
+            else:
+                kept.append(instruction)
+
+        # backwards, with everything live at the end of the block
+        live = set(ALL_LIVE)
+        dead = set()
+        for index in range(len(kept) - 1, -1, -1):
+            instruction = kept[index]
+            if instruction.name in REMOVABLE:
+                if not instruction.writes & live and instruction.address >= self.keep_until:
+                    dead.add(instruction.address)
+                    continue
+                live -= instruction.writes
+                live |= instruction.reads
+            else:
+                # the other instructions may fault, and all the registers are seen when the simulation stops
+                live = set(ALL_LIVE)
+
+        for instruction in block:
+            if instruction.address in noops:
+                self._remove(instruction, 'no-op')
+            elif instruction.address in dead:
+                self._remove(instruction, 'dead write')
+            else:
+                yield from instruction.tokens
+
+    def _is_noop(self, instruction):
+        tokens = instruction.tokens
+        name = instruction.name
+        if name in NOOP_WITH_R0:
+            destination, first, second = (token.value for token in tokens[1:])
+            if (first == destination and second == 'r0') or (second == destination and first == 'r0'):
+                return True
+        if name in NOOP_WITH_R0_SECOND:
+            return tokens[2].value == tokens[1].value and tokens[3].value == 'r0'
+        if name in NOOP_SAME:
+            return tokens[1].value == tokens[2].value == tokens[3].value
+        if name in NOOP_WITH_0:
+            return tokens[2].value == tokens[1].value and tokens[3].token_type != 'IDENTIFIER' and self._value(tokens[3]) == 0
+        return False
+
+    def _value(self, token):
+        return int(token.value, 16) if token.token_type == 'HEX' else int(token.value)
+
+
+if __name__ == "__main__":
+    from .isa_compiler import ISA_compiler
+
+    parser = argparse.ArgumentParser(description="Assemble a program with the peephole optimization and report what it removed")
+    parser.add_argument('program', help="assembly source")
+    parser.add_argument('-o', '--output', default='isa-encoder-output')
+    args = parser.parse_args()
+
+    compiler = ISA_compiler(optimize=True)
+    compiler.encode(args.program, args.output)
+    print(compiler.optimizer.report())
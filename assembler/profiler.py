@@ -0,0 +1,165 @@
+#########################################################
+#   Profiler file. Created on 18/10/26
+#   Intent: Instruction-level profiler for simulated programs, to find what to optimize in the generated code.
+#           It's a simulator observer (look at AssemblySimulator.simulate), which counts:
+#               executions per PC and per opcode,
+#               taken/not-taken per branch (and the targets of every taken branch or jump),
+#               loads and stores per RAM address.
+#           Counting is a few dictionary increments per instruction, without any output, so it's cheap enough to leave on.
+#
+#           report() lists the hot loops (backward branches and jumps, sorted by trip count), the hottest instructions,
+#           the opcode mix, the branches and the hottest RAM addresses. Addresses are symbolized as label+offset
+#           with the label table of the assembler (ISA_compiler.labels after encode).
+#
+#           Usage: python -m assembler.profiler program.asm [--top N]
+
+import argparse
+import bisect
+from collections import defaultdict
+
+from . import opcodes as op
+from .simulator import AssemblySimulator, MEMORY_ACCESSES
+
+OPCODE_NAMES = {opcode.value: opcode.name for opcode in op.Opcode}
+
+# opcode bits selecting the class and the subclass, look at opcodes.py
+CLASS_MASK = 0b0_11_1_0_000
+
+
+class Symbols:
+    """ symbolizes code addresses with the label table (label name -> byte address) of the assembler """
+    def __init__(self, labels=None):
+        self.labels = sorted((address, name) for name, address in (labels or {}).items())
+        self.addresses = [address for address, _ in self.labels]
+
+    def symbolize(self, address):
+        """ returns 'label+offset' of the nearest label at or before the address, or the hex address if there's none """
+        index = bisect.bisect_right(self.addresses, address) - 1
+        if index < 0:
+            return f"{address:#06x}"
+
+        label_address, name = self.labels[index]
+        offset = address - label_address
+        return f"{name}+{offset}" if offset else name
+
+
+class Profiler:
+    """
+        * labels - dictionary of label name -> byte address, used to symbolize addresses in the report.
+
+        * functions interface - before_step, on_step, report, symbolize, opcodes, hot_loops, branches.
+        \t before_step, on_step - called by the simulator around every executed instruction.
+        \t report    - returns the text report.
+        \t symbolize - returns 'label+offset' of the code address.
+        \t opcodes, hot_loops, branches - the counts the report is made of.
+    """
+    def __init__(self, labels=None):
+        self.executions = defaultdict(int) # pc -> number of executions
+        self.taken = defaultdict(int)      # (pc, target) -> number of times the branch or jump went to target
+        self.loads = defaultdict(int)      # RAM address -> number of loads
+        self.stores = defaultdict(int)     # RAM address -> number of stores
+        self.program_words = []            # instruction words of the profiled program, per opcode counts are derived from them
+
+        self.set_labels(labels or {})
+
+    def set_labels(self, labels):
+        self.symbols = Symbols(labels)
+
+    def before_step(self, simulator, cursor_byte, word):
+        self.executions[cursor_byte] += 1
+
+        # the address has to be computed before a load overwrites its base register
+        if word >> 24 in MEMORY_ACCESSES:
+            access = simulator.memory_access(word)
+            if access is not None:
+                address, _, is_store = access
+                (self.stores if is_store else self.loads)[address] += 1
+
+    def on_step(self, simulator, cursor_byte, word, next_cursor_byte):
+        self.program_words = simulator.program_words
+        taken = simulator.branch_taken(word)
+        if taken is None: # jumps always go to their target, the other instructions to the next one
+            taken = (word >> 24) & CLASS_MASK == op.JUMPING_BIT
+        if taken:
+            self.taken[(cursor_byte, next_cursor_byte)] += 1
+
+    #
+    # REPORT
+    #
+    def symbolize(self, address):
+        return self.symbols.symbolize(address)
+
+    def opcodes(self):
+        """ returns the dictionary of opcode -> number of executions """
+        counts = defaultdict(int)
+        for pc, count in self.executions.items():
+            counts[self.program_words[pc >> 2] >> 24] += count
+        return counts
+
+    def hot_loops(self):
+        """ returns the list of (target, branch pc, trip count) of backward branches and jumps, hottest first """
+        loops = [(target, pc, count) for (pc, target), count in self.taken.items() if target <= pc]
+        return sorted(loops, key=lambda loop: (-loop[2], loop[0]))
+
+    def branches(self):
+        """ returns the list of (pc, executions, taken, not taken) of the conditional branches, by pc """
+        taken = defaultdict(int)
+        for (pc, _), count in self.taken.items():
+            taken[pc] += count
+
+        result = []
+        for pc, executions in sorted(self.executions.items()):
+            if (self.program_words[pc >> 2] >> 24) & CLASS_MASK == op.BRANCHING_BIT:
+                result.append((pc, executions, taken[pc], executions - taken[pc]))
+        return result
+
+    def report(self, top=10):
+        opcodes = self.opcodes()
+        total = sum(opcodes.values())
+        lines = [f"Profile: {total} instructions, {len(self.executions)} distinct PCs"]
+
+        lines.append("\nHot loops (backward branch targets by trip count):")
+        for target, pc, count in self.hot_loops()[:top]:
+            lines.append(f"  {count:>10}  {self.symbolize(target)} ({target:#06x}) <- {self.symbolize(pc)} ({pc:#06x}), "
+                         f"{(pc - target) // 4 + 1} instructions")
+
+        lines.append("\nHottest instructions:")
+        hottest = sorted(self.executions.items(), key=lambda item: (-item[1], item[0]))[:top]
+        for pc, count in hottest:
+            lines.append(f"  {count:>10} {100 * count / total:6.2f}%  {pc:#06x} {self.symbolize(pc):<20} {self._format_word(self.program_words[pc >> 2])}")
+
+        lines.append("\nOpcodes:")
+        for opcode, count in sorted(opcodes.items(), key=lambda item: (-item[1], item[0])):
+            lines.append(f"  {count:>10} {100 * count / total:6.2f}%  {OPCODE_NAMES.get(opcode, bin(opcode))}")
+
+        lines.append("\nBranches (executed, taken, not taken):")
+        for pc, executions, taken, not_taken in self.branches():
+            lines.append(f"  {pc:#06x} {self.symbolize(pc):<20} {executions:>10} {taken:>10} {not_taken:>10}")
+
+        for title, counts in (("Loads", self.loads), ("Stores", self.stores)):
+            lines.append(f"\n{title} per address ({sum(counts.values())} total):")
+            for address, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:top]:
+                lines.append(f"  {count:>10}  {address}")
+
+        return '\n'.join(lines)
+
+    def _format_word(self, word):
+        return f"{OPCODE_NAMES.get(word >> 24, bin(word >> 24))} {(word >> 16) & 0xFF} {(word >> 8) & 0xFF} {word & 0xFF}"
+
+
+def profile_file(assembly_file, **simulate_arguments):
+    """ assembles and simulates the assembly file with a profiler. Returns (simulator, profiler). """
+    simulator = AssemblySimulator()
+    profiler = Profiler()
+    profiler.set_labels(simulator.simulate_assembly(assembly_file, observers=[profiler], **simulate_arguments))
+    return simulator, profiler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assemble, simulate and profile an assembly program")
+    parser.add_argument('program')
+    parser.add_argument('--top', type=int, default=10, help="number of listed loops, instructions and addresses")
+    args = parser.parse_args()
+
+    _, profiler = profile_file(args.program)
+    print(profiler.report(args.top))
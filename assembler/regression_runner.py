@@ -0,0 +1,192 @@
+#########################################################
+#   Regression runner. Created on 18/10/26
+#   Intent: Runs a whole directory of assembly programs and compares their final state with the expected one.
+#           Every program is assembled with ISA_compiler and simulated with AssemblySimulator in a separate process,
+#           using a process pool sized to the number of cores. Results are printed as soon as each program finishes,
+#           followed by the throughput (programs per second and simulated instructions per second).
+#
+#           The expected state of 'name.asm' is stored next to it in 'name.expected.json':
+#               {
+#                   "registers": {"r1": 33, "r2": 0},       register name -> final value
+#                   "ram":       {"0": 255},                 address -> final byte
+#                   "ram_words": {"4": 1234},                address -> final big endian word
+#                   "max_instructions": 100000,             optional instruction limit
+#                   "detect_loops": true,                    optional, fails a program stuck in an infinite loop
+#                                                            (interpreter engine only, look at loop_detector.py)
+#                   "optimize": true                         optional, assembles with the peephole optimizer (peephole.py)
+#               }
+#           Only the listed registers and addresses are compared. A program without the file passes if it runs without errors.
+#
+#           With --cache, the assembled programs are kept in an on-disk cache (assembly_cache.py), so only the changed
+#           sources get reassembled on the next run.
+#
+#           Usage: python -m assembler.regression_runner examples [--engine blocks] [--workers N] [--cache [DIRECTORY]]
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .assembly_cache import AssemblyCache
+from .isa_compiler import ISA_compiler
+from .simulator import AssemblySimulator
+
+
+def find_programs(directory):
+    """
+        returns the sorted list of (assembly file path, expected state dict or None, error) in the directory.
+        error is the message of an expected state file which can't be read, None otherwise.
+    """
+    programs = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.asm'):
+            continue
+
+        path = os.path.join(directory, name)
+        expected_path = path[:-len('.asm')] + '.expected.json'
+
+        expected = None
+        error = None
+        if os.path.exists(expected_path):
+            try:
+                with open(expected_path, "r") as f:
+                    expected = json.load(f)
+            except (ValueError, OSError) as e:
+                error = f"invalid {os.path.basename(expected_path)}: {type(e).__name__}: {e}"
+
+        programs.append((path, expected, error))
+    return programs
+
+
+def compare_state(simulator, expected):
+    """ returns the list of differences between the simulator's state and the expected one """
+    differences = []
+
+    for reg, value in expected.get('registers', {}).items():
+        if reg not in simulator.registers_dict:
+            differences.append(f"unknown register {reg} in the expected state")
+            continue
+        actual = simulator.registers_file[simulator.registers_dict[reg]]
+        if actual != value:
+            differences.append(f"{reg} = {actual}, expected {value}")
+
+    for address, value in expected.get('ram', {}).items():
+        actual = simulator.RAM.read_byte(int(address))
+        if actual != value:
+            differences.append(f"ram[{address}] = {actual}, expected {value}")
+
+    for address, value in expected.get('ram_words', {}).items():
+        actual = simulator.RAM.read_word(int(address))
+        if actual != value:
+            differences.append(f"ram word[{address}] = {actual}, expected {value}")
+
+    return differences
+
+
+def run_program(path, expected, engine='interpreter', cache_directory=None):
+    """
+        Assembles and simulates a single program. Runs inside a worker process.
+        cache_directory - if given, the assembly is cached there (look at assembly_cache.py).
+        Returns (path, passed, number of executed instructions, number of fused instructions, seconds, list of messages).
+    """
+    expected = expected or {}
+    start = time.perf_counter()
+
+    simulator = AssemblySimulator()
+    try:
+        cache = AssemblyCache(cache_directory) if cache_directory is not None else None
+        bytecode, _ = ISA_compiler(cache, optimize=expected.get('optimize', False)).assemble_file(path)
+
+        max_instructions = expected.get('max_instructions')
+        simulator.simulate(bytecode, engine=engine,
+                           early_stopping=max_instructions is not None,
+                           max_iterations=max_instructions if max_instructions is not None else 2**32,
+                           detect_loops=expected.get('detect_loops', False))
+
+        # a malformed expected state fails only this program
+        differences = compare_state(simulator, expected)
+
+    except Exception as e:
+        return (path, False, simulator.instruction_count, simulator.fused_instructions, time.perf_counter() - start,
+                [f"{type(e).__name__}: {e}"])
+
+    if simulator.detected_loop is not None:
+        loop = simulator.detected_loop
+        differences.insert(0, f"infinite loop between {loop.start:#06x} and {loop.end:#06x}, "
+                              f"repeating every {loop.instructions} instructions")
+    return (path, not differences, simulator.instruction_count, simulator.fused_instructions, time.perf_counter() - start, differences)
+
+
+def run_directory(directory, engine='interpreter', workers=None, output=sys.stdout, cache_directory=None):
+    """ runs every program of the directory on a process pool, streaming the results. Returns True if all of them passed. """
+    programs = find_programs(directory)
+    if not programs:
+        print(f"No .asm programs found in {directory}", file=output)
+        return True
+
+    passed = 0
+    instructions = 0
+    start = time.perf_counter()
+
+    def report(path, ok, count, fused, seconds, messages):
+        print(f"{'PASS' if ok else 'FAIL'} {path} ({count} instructions, {fused} fused, {seconds:.3f}s)", file=output, flush=True)
+        for message in messages:
+            print(f"    {message}", file=output)
+
+    # a program whose expected state can't be read fails without running
+    for path, _, error in programs:
+        if error is not None:
+            report(path, False, 0, 0, 0.0, [error])
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(run_program, path, expected, engine, cache_directory)
+                   for path, expected, error in programs if error is None]
+
+        for future in as_completed(futures):
+            path, ok, count, fused, seconds, messages = future.result()
+            passed += ok
+            instructions += count
+            report(path, ok, count, fused, seconds, messages)
+
+    elapsed = time.perf_counter() - start
+    print(f"\n{passed}/{len(programs)} passed in {elapsed:.3f}s. "
+          f"{len(programs) / elapsed:.1f} programs/s, {instructions / elapsed:.0f} instructions/s", file=output)
+
+    return passed == len(programs)
+
+
+# just for testing: programs which fail must be reported, not abort the run
+TESTING = False
+if TESTING and __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "unassemblable.asm"), "w") as f:
+            f.write("add r1, r2\n")
+        with open(os.path.join(directory, "malformed.asm"), "w") as f:
+            f.write("addi r1, r0, 5\n")
+        with open(os.path.join(directory, "malformed.expected.json"), "w") as f:
+            f.write("{ not json")
+
+        output = io.StringIO()
+        passed = run_directory(directory, workers=1, output=output)
+        if passed or output.getvalue().count("FAIL") != 2:
+            print("REGRESSION RUNNER: TEST FAILED.\n" + output.getvalue())
+        else:
+            print("\nREGRESSION RUNNER: TEST PASSED.\n")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assemble and simulate a directory of .asm programs, comparing them with name.expected.json")
+    parser.add_argument('directory')
+    parser.add_argument('--engine', default='interpreter', choices=['interpreter', 'blocks'])
+    parser.add_argument('--workers', type=int, default=None, help="number of processes, by default the number of cores")
+    parser.add_argument('--cache', nargs='?', const='', default=None, metavar='DIRECTORY',
+                        help="cache the assembled programs, by default in $ISA_CACHE_DIR or ~/.cache/isa_assembler")
+    args = parser.parse_args()
+
+    sys.exit(0 if run_directory(args.directory, args.engine, args.workers, cache_directory=args.cache) else 1)
@@ -7,302 +7,657 @@
 
 # TODO: write a better test. Compare the result with desired output.
 
-import opcodes as op
+from . import opcodes as op
 import struct
+import zlib
 
-from assembly_lexer import AssemblyLexer
+from .memory import make_memory
+from .macro_fusion import MacroFusion
+from .loop_detector import LoopDetector, LoopDetected
+from .checkpoint import pack_checkpoint, unpack_checkpoint
+
+WORD = struct.Struct(">I")
+
+# opcode -> (number of accessed bytes, is store). Used by memory_access.
+MEMORY_ACCESSES = {op.Opcode.LB: (1, False), op.Opcode.LH: (2, False), op.Opcode.LW: (4, False),
+                   op.Opcode.SB: (1, True),  op.Opcode.SH: (2, True),  op.Opcode.SW: (4, True)}
+
+# opcode -> condition(value of the first register, value of the second) of the branch, the same as its _op_ function.
+# Used by branch_taken.
+BRANCH_CONDITIONS = {op.Opcode.BEQ:   lambda a, b: a == b,
+                     op.Opcode.BNEQ:  lambda a, b: a != b,
+                     op.Opcode.BLT:   lambda a, b: abs(a) < abs(b),
+                     op.Opcode.BLE:   lambda a, b: abs(a) <= abs(b),
+                     op.Opcode.BLTS:  lambda a, b: a < b,
+                     op.Opcode.BLTES: lambda a, b: a < b}
 
 class AssemblySimulator:
-    def __init__(self):
-        self.opcodes_dict = {op.name: op.value for op in op.Opcode}
-        self.registers_dict = {'r'+str(i): i for i in range(32)}
+    def __init__(self, ram_size=256, page_size=None, ram_file=None):
+        """
+            ram_size - the number of RAM bytes. Addresses outside of it raise an IndexError.
+            page_size - if given, RAM is allocated lazily in pages of that size, so untouched memory costs nothing.
+                        Memories larger than 64KiB are paged by default. Look at memory.py.
+            ram_file - if given, RAM is backed by this file, mapped with mmap. For very large images.
+        """
+        self.opcodes_dict, self.opcode_names, self.registers_dict = op.lookup_tables()
+        self.dispatch_table = self._build_dispatch_table()
 
-        self.registers_file = {'r'+str(i): 0 for i in range(32)}
-        self.RAM = {i : 0 for i in range(256)} # 256 byte ram
+        self.registers_file = [0] * 32 # indexed by the register number, r0 is registers_file[0]
+        self.RAM = make_memory(ram_size, page_size, ram_file) # 256 byte ram by default
+
+        # set again by load_program, so that a simulator whose program failed to load still has them
+        self.pc = 0
+        self.instruction_count = 0
+        self.fused_instructions = 0
+        self.detected_loop = None
 
     def simulate(self, input_file_name='isa-encoder-output', log_registers = False, log_ram=False,
                  print_instructions = False,
-                 early_stopping = False, max_iterations=2**32):
+                 early_stopping = False, max_iterations=2**32, engine='interpreter',
+                 resume_from=None, checkpoint_every=None, checkpoint_file=None, observers=None, fusion=True,
+                 detect_loops=False):
         """
             * notice: file must be in bytecode instruction form, not handwritten assembly file.
             Simulates the machine code file assembly. Uses 32 registers and a 256 byte ram.
 
+            input_file_name - the bytecode file name, or the bytecode itself as a bytes-like object (bytes, bytearray,
+                     memoryview), e.g. from ISA_compiler.assemble, which is simulated without touching any file.
+
             log_registers - if True, prints the registers' values at every iteration.
             log_ram - if True, prints the ram values at every iteration.
-            early_stopping - if True, iterates only till max_iterations argument. Each iteration is a single 32 bit instruction.
+            early_stopping - if True, stops after max_iterations executed instructions (an instruction budget of this call,
+                     also when it resumes from a checkpoint). The stopped run's PC and count stay in self.pc and
+                     self.instruction_count, but every call loads the program again, which resets them. To continue the run,
+                     save it with save_checkpoint and simulate again with resume_from.
+            engine - 'interpreter' executes the instructions one by one. 'blocks' translates basic blocks into python functions
+                     (look at block_translator.py), which is several times faster, but doesn't support per-instruction logging.
+            fusion - if True, the 'interpreter' engine runs common instruction pairs and triples as single superinstructions
+                     (look at macro_fusion.py). The state is exactly the same as without fusion. It's used only without logging,
+                     observers and checkpoints, which need every single instruction. The number of instructions
+                     executed inside superinstructions is saved into self.fused_instructions.
+            resume_from - checkpoint file name (look at checkpoint.py). If given, the simulation continues from the saved state.
+            checkpoint_every - if given, the state is saved into self.last_checkpoint every checkpoint_every instructions.
+                     Each checkpoint copies the allocated RAM, the whole image of a ram_file (look at checkpoint.py).
+                     The 'blocks' engine saves it at the end of the first block after that many instructions.
+            checkpoint_file - if given together with checkpoint_every, every automatic checkpoint is also written into this file.
+            observers - list of objects with an on_step(simulator, cursor_byte, word, next_cursor_byte) function, called after
+                     every executed instruction with its address, its instruction word and the address of the next one,
+                     and/or a before_step(simulator, cursor_byte, word) function, called before the instruction executes
+                     (e.g. TraceRecorder in trace_recorder.py, Profiler in profiler.py). Only the 'interpreter' engine supports them.
+            detect_loops - if True, stops when the machine repeats an exact state, i.e. it's stuck in an infinite loop
+                     (look at loop_detector.py). The loop is saved into self.detected_loop, which is None otherwise.
+                     Only the 'interpreter' engine supports it.
         """
 
-        # read file data
-        data = ""
-        with open(input_file_name, "rb") as f:
-            data = f.read()
+        # read file data, unless the bytecode itself is given
+        if isinstance(input_file_name, (bytes, bytearray, memoryview)):
+            data = input_file_name
+        else:
+            with open(input_file_name, "rb") as f:
+                data = f.read()
 
-        i = 0
-        while (i < len(data)):
-            if early_stopping and i >= max_iterations*4:
-                break
+        # decode the whole program once. The loop below only fetches and executes.
+        self.load_program(data)
 
-            chunk = data[i:i+4]
+        if resume_from is not None:
+            self.load_checkpoint(resume_from)
 
-            word = int.from_bytes(chunk, byteorder="big")
-            
-            # Instruction masking. Opcode is supposed to be the first byte, arg1 second byte, arg2 third and arg4 the forth.
-            # After masking they are shifted to get the real bytecode representation
-            opcode = (word     & 0xFF_00_00_00) >> 24
-            arg1 =   (word     & 0x00_FF_00_00) >> 16
-            arg2 =   (word     & 0x00_00_FF_00) >> 8
-            arg3 =   (word     & 0x00_00_00_FF)
+        self.checkpoint_file = checkpoint_file
+        max_instructions = max_iterations if early_stopping else None
 
+        observers = list(observers or ())
+        if detect_loops:
+            observers.append(LoopDetector())
+        before_step = [observer.before_step for observer in observers if hasattr(observer, 'before_step')]
+        on_step = [observer.on_step for observer in observers if hasattr(observer, 'on_step')]
+        logging = log_registers or log_ram or print_instructions or observers
+        logging_before = print_instructions or before_step
 
-            # find type and opcode
-            typ = self._find_opcode_type(opcode)
-            opcode_reversed = self._opcode_reverse(opcode, i)
-            if print_instructions:
-                print('\n',opcode_reversed, arg1, arg2, arg3, " : ", i)
+        if engine == 'blocks':
+            if logging:
+                raise RuntimeError("The 'blocks' engine doesn't support logging or observers. Use the 'interpreter' engine instead")
 
-            # depending on the type, decode the instruction and add to the text. Notice the default case is upper-case.
-            if typ == 'DSS':
-                reg1_reverse = self._register_reverse(arg1, i)
-                reg2_reverse = self._register_reverse(arg2, i)
-                reg3_reverse = self._register_reverse(arg3, i)
+            from .block_translator import BlockTranslator # imported only when used, it's not needed for a quick start
+            self.block_translator = BlockTranslator(self)
+            self.block_translator.run(self.pc, self.program_size, checkpoint_every=checkpoint_every,
+                                      max_instructions=max_instructions)
+            return
 
-                self.simulate_dss(opcode_reversed, reg1_reverse, reg2_reverse, reg3_reverse)
-            elif typ == 'DSI':
-                reg1_reverse = self._register_reverse(arg1, i)
-                reg2_reverse = self._register_reverse(arg2, i)
+        elif engine != 'interpreter':
+            raise RuntimeError(f"Unknown simulation engine {repr(engine)}. Use 'interpreter' or 'blocks'")
 
-                # change the index in case of branching or jumping
-                i = self.simulate_dsi(opcode_reversed, reg1_reverse, reg2_reverse, arg3, i)
+        if fusion and not logging and not checkpoint_every:
+            self.macro_fusion = MacroFusion(self)
+            try:
+                self.macro_fusion.run(self.pc, self.program_size, max_instructions=max_instructions)
+            finally:
+                self.fused_instructions = self.macro_fusion.fused_instructions
+            return
+
+        i = self.pc
+        count = self.instruction_count
+        next_checkpoint = count + checkpoint_every if checkpoint_every else -1
+        stop_count = count + max_instructions if early_stopping else -1
+        try:
+            while (i < self.program_size):
+                if count == stop_count:
+                    break
+
+                handler, arg1, arg2, arg3 = self.decoded[i >> 2]
+                current = i
+
+                if logging_before:
+                    word = self.program_words[i >> 2]
+                    if print_instructions:
+                        print('\n',self.opcode_names.get(word >> 24, bin(word >> 24)), (word >> 16) & 0xFF, (word >> 8) & 0xFF, word & 0xFF, " : ", i)
+
+                    for hook in before_step:
+                        hook(self, i, word)
+
+                # every opcode costs a single call. Branches and jumps return the changed index.
+                i = handler(arg1, arg2, arg3, i)
+                count += 1
+
+                if logging:
+                    if log_registers:
+                        for value in self.registers_file:
+                            print(value, end = ',')
+                        print()
+
+                    if log_ram:
+                        print("RAM ___________")
+                        for value in self.RAM.dump_range():
+                            print(value, end = ',')
+                        print()
+
+                    for hook in on_step:
+                        hook(self, current, self.program_words[current >> 2], i + 4)
+
+                i += 4
+
+                if count == next_checkpoint:
+                    self._auto_checkpoint(i, count)
+                    next_checkpoint += checkpoint_every
+        except LoopDetected as loop:
+            i = loop.next_cursor_byte
+            self.detected_loop = loop.loop
+        finally:
+            self.pc = i
+            self.instruction_count = count
+
+    def simulate_assembly(self, assembly_file_name, **simulate_arguments):
+        """
+            Assembles the assembly file with ISA_compiler and simulates it. simulate_arguments are passed to simulate.
+            Returns the assembler's label table (label name -> byte address), e.g. to symbolize profiler reports.
+        """
+        from .isa_compiler import ISA_compiler # the assembler isn't needed to simulate bytecode
+        bytecode, labels = ISA_compiler().assemble_file(assembly_file_name)
+        self.simulate(bytecode, **simulate_arguments)
+        return labels
+
+    def simulate_source(self, source, **simulate_arguments):
+        """ like simulate_assembly, but takes the assembly source text. Nothing is read from or written into files. """
+        from .isa_compiler import ISA_compiler
+        bytecode, labels = ISA_compiler().assemble(source)
+        self.simulate(bytecode, **simulate_arguments)
+        return labels
 
-            elif typ == 'DS':
-                reg1_reverse = self._register_reverse(arg1, i)
-                arg2_full = word & 0x00_00_FF_FF 
+    #
+    # CHECKPOINTS
+    #
+    def checkpoint(self):
+        """ returns the current machine state (registers, RAM, PC, instruction count) packed into bytes. """
+        return pack_checkpoint(self)
 
-                reg2_reverse = self._register_reverse(arg2_full, i)
+    def restore(self, checkpoint):
+        """ restores the machine state returned by checkpoint(). The same program must be loaded. """
+        unpack_checkpoint(self, checkpoint)
 
-                self.simulate_ds(opcode_reversed, reg1_reverse, reg2_reverse)
-                
-            elif typ == 'DI':
-                reg1_reverse = self._register_reverse(arg1, i)
-                arg2_full = word & 0x00_00_FF_FF 
+    def save_checkpoint(self, file_name):
+        with open(file_name, "wb") as f:
+            f.write(pack_checkpoint(self))
 
-                i = self.simulate_di(opcode_reversed, reg1_reverse, arg2_full, i)
+    def load_checkpoint(self, file_name):
+        with open(file_name, "rb") as f:
+            unpack_checkpoint(self, f.read())
 
-            elif typ == 'I':
-                reg1_reverse = self._register_reverse(arg1, i)
-                arg1_full = word & 0x00_FF_FF_FF 
+    def _auto_checkpoint(self, cursor_byte, count):
+        """ called by the engines every checkpoint_every instructions """
+        self.pc = cursor_byte
+        self.instruction_count = count
+        self.last_checkpoint = pack_checkpoint(self)
 
-                i = self.simulate_i(opcode_reversed, arg1_full)
+        if self.checkpoint_file is not None:
+            with open(self.checkpoint_file, "wb") as f:
+                f.write(self.last_checkpoint)
 
-            if log_registers:
-                for r in self.registers_file:
-                    print(self.registers_file[r], end = ',')
-                print()
+    #
+    # PREDECODING
+    #
+    def load_program(self, data):
+        """
+            Loads the bytecode (bytes-like object) and predecodes every 32 bit word into the per-PC table self.decoded.
+            Each entry is a (handler, arg1, arg2, arg3) tuple with the register numbers and immediates already extracted,
+            so the simulation loop never masks fields or searches the lookup dictionaries.
+            Trailing bytes that don't form a full word are ignored.
+        """
+        data = memoryview(data).cast('B')
+        self.program_size = (len(data) // 4) * 4
+        self.program_words = [word for (word,) in WORD.iter_unpack(data[:self.program_size])]
+
+        # translated blocks and fused superinstructions belong to the previous program
+        self.block_translator = None
+        self.macro_fusion = None
+        self.fused_instructions = 0 # the number of instructions executed inside fused superinstructions
+        self.program_crc = zlib.crc32(data)
+
+        self.pc = 0 # the byte address of the next instruction
+        self.instruction_count = 0 # the number of executed instructions
+        self.last_checkpoint = None
+        self.detected_loop = None # Loop(start, end, instructions) if detect_loops stopped an infinite loop
+
+        # the same few words repeat a lot in a program, so each distinct word is decoded only once
+        decoded_words = {}
+        self.decoded = []
+        for index, word in enumerate(self.program_words):
+            if word not in decoded_words:
+                decoded_words[word] = self._decode_word(word, index * 4)
+            self.decoded.append(decoded_words[word])
+
+    def write_code(self, address, word):
+        """
+            Overwrites the instruction word at the byte address (must be 4 byte aligned and inside the program).
+            The program memory is separate from RAM, so this is the only way to modify code. It invalidates the predecoded
+            entry, the superinstructions and the translated blocks of that address, so the next fetch executes the new instruction.
+        """
+        if address % 4 != 0 or not (0 <= address < self.program_size):
+            raise RuntimeError(f"Code write to invalid address {address}. Program size is {self.program_size} bytes")
 
-            if log_ram:
-                print("RAM ___________")
-                for addr in self.RAM:
-                    print(self.RAM[addr], end = ',')
-                print()
+        word &= 0xFF_FF_FF_FF
+        self.program_words[address >> 2] = word
+        self.decoded[address >> 2] = self._decode_word(word, address)
 
-            i += 4
+        if self.block_translator is not None:
+            self.block_translator.invalidate(address)
+        if self.macro_fusion is not None:
+            self.macro_fusion.invalidate(address)
+
+    def memory_access(self, word):
+        """
+            returns (address, number of bytes, is store) of the load or store instruction word, computed from the current
+            register values, or None for any other instruction. A load may overwrite its own base register,
+            so call it before the instruction executes.
+        """
+        access = MEMORY_ACCESSES.get(word >> 24)
+        if access is None:
+            return None
+
+        width, is_store = access
+        base = (word >> 16) & 0xFF if is_store else (word >> 8) & 0xFF
+        if base >= len(self.registers_file):
+            return None
+
+        imm = word & 0xFF
+        if width != 1: # byte accesses use the offset unsigned, like _op_lb and _op_sb
+            imm = self._sign_extend(imm, 8, 32)
+        return ((self.registers_file[base] + imm) & 0xFF_FF_FF_FF, width, is_store)
+
+    def branch_taken(self, word):
+        """
+            returns whether the branch instruction word jumps with the current register values, or None for any other
+            instruction. Branches don't write registers, so it can be called after the branch executes too.
+            Unlike comparing the next PC with PC + 4, it also tells a taken branch to the next instruction.
+        """
+        condition = BRANCH_CONDITIONS.get(word >> 24)
+        if condition is None:
+            return None
+
+        reg1, reg2 = (word >> 16) & 0xFF, (word >> 8) & 0xFF
+        if max(reg1, reg2) >= len(self.registers_file):
+            return None
+        return condition(self.registers_file[reg1], self.registers_file[reg2])
+
+    def _decode_word(self, word, cursor_byte):
+        """ decodes a single instruction word into the (handler, arg1, arg2, arg3) tuple, used by simulation. """
+
+        # Instruction masking. Opcode is supposed to be the first byte, arg1 second byte, arg2 third and arg4 the forth.
+        # After masking they are shifted to get the real bytecode representation
+        opcode = (word     & 0xFF_00_00_00) >> 24
+        arg1 =   (word     & 0x00_FF_00_00) >> 16
+        arg2 =   (word     & 0x00_00_FF_00) >> 8
+        arg3 =   (word     & 0x00_00_00_FF)
+
+        try:
+            # find type and opcode
+            typ = self._find_opcode_type(opcode)
+            self._opcode_reverse(opcode, cursor_byte)
+            handler = self.dispatch_table[opcode]
+
+            # registers are kept as numbers, the register file is indexed by them
+            if typ == 'DSS':
+                return (handler, self._register_number(arg1, cursor_byte), self._register_number(arg2, cursor_byte), self._register_number(arg3, cursor_byte))
+            elif typ == 'DSI':
+                return (handler, self._register_number(arg1, cursor_byte), self._register_number(arg2, cursor_byte), arg3)
+            elif typ == 'DS':
+                return (handler, self._register_number(arg1, cursor_byte), self._register_number(word & 0x00_00_FF_FF, cursor_byte), None)
+            elif typ == 'DI':
+                return (handler, self._register_number(arg1, cursor_byte), word & 0x00_00_FF_FF, None)
+            else:
+                return (handler, word & 0x00_FF_FF_FF, None, None)
+
+        except SyntaxError as e:
+            # data words and garbage are allowed in the program, as long as they're never executed
+            return (self._op_invalid, str(e), None, None)
+
+    #
+    # OPCODE DISPATCH
+    #
+    def _build_dispatch_table(self):
+        """
+            Builds the list of handlers, indexed by the numeric opcode value (0-255). Every handler has the same signature
+            handler(arg1, arg2, arg3, cursor_byte) and returns the cursor byte, changed in case of branching or jumping.
+            Adding a new opcode means writing its handler and adding a single line here.
+        """
+        handlers = {
+            # DSS
+            op.Opcode.NOP:   self._op_nop,
+            op.Opcode.ADD:   self._op_add,
+            op.Opcode.MUL:   self._op_mul,
+            op.Opcode.MULH:  self._op_mulh,
+            op.Opcode.DIV:   self._op_div,
+            op.Opcode.REM:   self._op_rem,
+            op.Opcode.AND:   self._op_and,
+            op.Opcode.OR:    self._op_or,
+            op.Opcode.XOR:   self._op_xor,
+            op.Opcode.NOT:   self._op_not,
+            op.Opcode.SLL:   self._op_sll,
+            op.Opcode.SRL:   self._op_srl,
+            op.Opcode.SRA:   self._op_sra,
+            op.Opcode.SLT:   self._op_slt,
+            op.Opcode.SLTS:  self._op_slts,
+            # DSI
+            op.Opcode.ADDI:  self._op_addi,
+            op.Opcode.ANDI:  self._op_andi,
+            op.Opcode.ORI:   self._op_ori,
+            op.Opcode.XORI:  self._op_xori,
+            op.Opcode.SLLI:  self._op_slli,
+            op.Opcode.SRLI:  self._op_srli,
+            op.Opcode.SRAI:  self._op_srai,
+            op.Opcode.SLTI:  self._op_slti,
+            op.Opcode.SLTSI: self._op_sltsi,
+            op.Opcode.LB:    self._op_lb,
+            op.Opcode.LH:    self._op_lh,
+            op.Opcode.LW:    self._op_lw,
+            op.Opcode.SB:    self._op_sb,
+            op.Opcode.SH:    self._op_sh,
+            op.Opcode.SW:    self._op_sw,
+            op.Opcode.BEQ:   self._op_beq,
+            op.Opcode.BNEQ:  self._op_bneq,
+            op.Opcode.BLT:   self._op_blt,
+            op.Opcode.BLE:   self._op_ble,
+            op.Opcode.BLTS:  self._op_blts,
+            op.Opcode.BLTES: self._op_bltes,
+            op.Opcode.JALR:  self._op_jalr,
+            # DS
+            op.Opcode.SEQZ:  self._op_seqz,
+            # DI
+            op.Opcode.JAL:   self._op_jal,
+            op.Opcode.LUI:   self._op_lui,
+            op.Opcode.LLI:   self._op_lli,
+            # I
+            op.Opcode.J:     self._op_j,
+        }
+
+        table = [None] * 256
+        for opcode, handler in handlers.items():
+            table[opcode] = handler
+        return table
+
+    def _dispatch(self, opcode, expected_type, arg1, arg2, arg3, cursor_byte):
+        """ executes the opcode given by its name through the dispatch table. Raises an error if the opcode is not of the expected type. """
+        value = self.opcodes_dict.get(opcode)
+        if value is None or self._find_opcode_type(value) != expected_type:
+            raise RuntimeError(f"Unknown opcode {repr(opcode)} during {expected_type.lower()} simulation")
+
+        return self.dispatch_table[value](arg1, arg2, arg3, cursor_byte)
 
     #
     # OPCODE TYPE SIMULATIONS
+    # Kept for executing a single instruction by its name. The simulation loop calls the handlers directly.
     #
+    # registers are given by their names ('r0' through 'r31')
     def simulate_dss(self, opcode, reg1, reg2, reg3):
-        # ARITHMETIC:   add, mul, mulh, div, rem
-        # LOGIC:        and, or, xor, not
-        # SHIFT:        sll, srl, sra
-        # COMPARE:      slt, slts, seqz
+        self._dispatch(opcode, 'DSS', self.registers_dict[reg1], self.registers_dict[reg2], self.registers_dict[reg3], 0)
+
+    def simulate_dsi(self, opcode, reg1, reg2, imm, cursor_byte):
+        return self._dispatch(opcode, 'DSI', self.registers_dict[reg1], self.registers_dict[reg2], imm, cursor_byte)
+
+    def simulate_ds(self, opcode, reg1, reg2):
+        self._dispatch(opcode, 'DS', self.registers_dict[reg1], self.registers_dict[reg2], None, 0)
+
+    def simulate_di(self, opcode, reg, imm, cursor_byte):
+        return self._dispatch(opcode, 'DI', self.registers_dict[reg], imm, None, cursor_byte)
+
+    def simulate_i(self, opcode, imm):
+        return self._dispatch(opcode, 'I', imm, None, None, 0)
+
+    #
+    # OPCODE HANDLERS
+    #
+
+    # DSS. opcode destination, source1, source2
+    # ARITHMETIC:   add, mul, mulh, div, rem
+    # LOGIC:        and, or, xor, not
+    # SHIFT:        sll, srl, sra
+    # COMPARE:      slt, slts
+    def _op_nop(self, reg1, reg2, reg3, cursor_byte):
+        return cursor_byte
+
+    def _op_add(self, reg1, reg2, reg3, cursor_byte):
+        self._write_register(reg1, self.registers_file[reg2] + self.registers_file[reg3])
+        return cursor_byte
+
+    def _op_mul(self, reg1, reg2, reg3, cursor_byte):
+        self._write_register(reg1, (self.registers_file[reg2] * self.registers_file[reg3]) & 0x0000_FFFF)
+        return cursor_byte
+
+    def _op_mulh(self, reg1, reg2, reg3, cursor_byte):
+        result = self.registers_file[reg2] * self.registers_file[reg3]
+        self._write_register(reg1, (result << 16) & 0xFFFF_0000)
+        return cursor_byte
+
+    def _op_div(self, reg1, reg2, reg3, cursor_byte):
         reg2_val = self.registers_file[reg2]
         reg3_val = self.registers_file[reg3]
+        if reg3_val == 0:
+            raise ZeroDivisionError(f"Divison by zero at div instruction DIV r{reg1}, r{reg2}, r{reg3}. Values of registers: {self.registers_file[reg1]}, {reg2_val}, {reg3_val}")
 
-        #ARITHMETIC
+        self._write_register(reg1, int(reg2_val / reg3_val))
+        return cursor_byte
 
-        if opcode == 'ADD':
-            self._write_register(reg1, reg2_val + reg3_val)
-        elif opcode == 'MUL':
-            self._write_register(reg1, (reg2_val * reg3_val) & 0x0000_FFFF)
-        elif opcode == 'MULH':
-            result = reg2_val * reg3_val
-            self._write_register(reg1, (result << 16) & 0xFFFF_0000)
-        elif opcode == 'DIV':
-            try:
-                self._write_register(reg1, int(reg2_val / reg3_val))
-            except:
-                raise ZeroDivisionError(f"Divison by zero at div instruction {opcode} {reg1}, {reg2}, {reg3}. Values of registers: {self.registers_file[reg1]}, {reg2_val}, {reg3_val}")
-        elif opcode == 'REM':
-            self._write_register(reg1, reg2_val % reg3_val)
-        
-        #LOGIC
-        elif opcode == 'AND':
-            self._write_register(reg1, reg2_val & reg3_val)
-        elif opcode == 'OR':
-            self._write_register(reg1, reg2_val | reg3_val)
-        elif opcode == 'XOR':
-            self._write_register(reg1, reg2_val ^ reg3_val)
-        elif opcode == 'NOT':
-            self._write_register(reg1, ~reg2_val)
-            
-        #SHIFTING
-        elif opcode == 'SLL':
-            self._write_register(reg1, reg2_val << reg3_val)
-        elif opcode == 'SRL':
-            self._write_register(reg1, reg2_val >> reg3_val)
-        elif opcode == 'SRA':
-            self.registers_file[reg1] = reg2_val >> reg3_val if reg2_val >= 0 else -((-reg2_val) >> reg3_val)
-
-
-        #COMPARE
-        elif opcode == 'SLT':
-            self._write_register(reg1, int(abs(reg2_val) < abs(reg3_val)))
-        elif opcode == 'SLTS':
-            self._write_register(reg1, int(reg2_val < reg3_val))
-
-        elif opcode == 'NOP':
-            pass
-    
-        else:
-            raise RuntimeError(f"Unknown opcode {repr(opcode)} during dss simulation")
+    def _op_rem(self, reg1, reg2, reg3, cursor_byte):
+        self._write_register(reg1, self.registers_file[reg2] % self.registers_file[reg3])
+        return cursor_byte
 
+    def _op_and(self, reg1, reg2, reg3, cursor_byte):
+        self._write_register(reg1, self.registers_file[reg2] & self.registers_file[reg3])
+        return cursor_byte
 
-    def simulate_dsi(self, opcode, reg1, reg2, imm, cursor_byte):
+    def _op_or(self, reg1, reg2, reg3, cursor_byte):
+        self._write_register(reg1, self.registers_file[reg2] | self.registers_file[reg3])
+        return cursor_byte
 
-        reg1_val = self.registers_file[reg1]
+    def _op_xor(self, reg1, reg2, reg3, cursor_byte):
+        self._write_register(reg1, self.registers_file[reg2] ^ self.registers_file[reg3])
+        return cursor_byte
+
+    def _op_not(self, reg1, reg2, reg3, cursor_byte):
+        self._write_register(reg1, ~self.registers_file[reg2])
+        return cursor_byte
+
+    def _op_sll(self, reg1, reg2, reg3, cursor_byte):
+        self._write_register(reg1, self.registers_file[reg2] << self.registers_file[reg3])
+        return cursor_byte
+
+    def _op_srl(self, reg1, reg2, reg3, cursor_byte):
+        self._write_register(reg1, self.registers_file[reg2] >> self.registers_file[reg3])
+        return cursor_byte
+
+    def _op_sra(self, reg1, reg2, reg3, cursor_byte):
         reg2_val = self.registers_file[reg2]
+        reg3_val = self.registers_file[reg3]
+        self._write_register(reg1, reg2_val >> reg3_val if reg2_val >= 0 else -((-reg2_val) >> reg3_val))
+        return cursor_byte
 
-        # addi, andi, ori, xori, slli, srli, srai, slti, sltsi
-        if opcode == 'ADDI':
-            imm = self._sign_extend(imm, 8, 32)
+    def _op_slt(self, reg1, reg2, reg3, cursor_byte):
+        self._write_register(reg1, int(abs(self.registers_file[reg2]) < abs(self.registers_file[reg3])))
+        return cursor_byte
 
-            self._write_register(reg1, reg2_val + imm)
-        elif opcode == 'ANDI':
-            self._write_register(reg1, reg2_val & imm)
-        elif opcode == 'ORI':
-            self._write_register(reg1, reg2_val | imm)
-        elif opcode == 'XORI':
-            self._write_register(reg1, reg2_val ^ imm)
-
-        #SHIFTING
-        elif opcode == 'SLLI':
-            self._write_register(reg1, reg2_val << imm)
-        elif opcode == 'SRLI':
-            self._write_register(reg1, reg2_val >> imm)
-        elif opcode == 'SRAI':
-            self.registers_file[reg1] = reg2_val >> imm if reg2_val >= 0 else -((-reg2_val) >> imm)
-
-        #COMPARE
-        elif opcode == 'SLTI':
-            self._write_register(reg1, int(abs(reg2_val) < abs(imm)))
-        elif opcode == 'SLTSI':
-            imm = self._sign_extend(imm, 8, 32)
-            self._write_register(reg1, int(reg2_val < imm))
+    def _op_slts(self, reg1, reg2, reg3, cursor_byte):
+        self._write_register(reg1, int(self.registers_file[reg2] < self.registers_file[reg3]))
+        return cursor_byte
 
-        #LOADING
-        elif opcode == 'LB':
+    # DSI. opcode destination, source, immediate
+    # addi, andi, ori, xori, slli, srli, srai, slti, sltsi
+    def _op_addi(self, reg1, reg2, imm, cursor_byte):
+        self._write_register(reg1, self.registers_file[reg2] + self._sign_extend(imm, 8, 32))
+        return cursor_byte
 
-            self._write_register(reg1, self.RAM[reg2_val + imm] & 0xFF)
-        elif opcode == 'LH':
-            imm = self._sign_extend(imm, 8, 16)
+    def _op_andi(self, reg1, reg2, imm, cursor_byte):
+        self._write_register(reg1, self.registers_file[reg2] & imm)
+        return cursor_byte
 
-            self._write_register(reg1, self.RAM[reg2_val + imm] & 0xFFFF)
-        elif opcode == 'LW':
-            imm = self._sign_extend(imm, 8, 32)
+    def _op_ori(self, reg1, reg2, imm, cursor_byte):
+        self._write_register(reg1, self.registers_file[reg2] | imm)
+        return cursor_byte
+
+    def _op_xori(self, reg1, reg2, imm, cursor_byte):
+        self._write_register(reg1, self.registers_file[reg2] ^ imm)
+        return cursor_byte
 
-            self._write_register(reg1, self.RAM[reg2_val + imm])
+    def _op_slli(self, reg1, reg2, imm, cursor_byte):
+        self._write_register(reg1, self.registers_file[reg2] << imm)
+        return cursor_byte
 
-    
-        #SAVING
-        elif opcode == 'SB':
+    def _op_srli(self, reg1, reg2, imm, cursor_byte):
+        self._write_register(reg1, self.registers_file[reg2] >> imm)
+        return cursor_byte
 
-            self.RAM[reg1_val + imm] = reg2_val & 0xFF
-        elif opcode == 'SH':
-            imm = self._sign_extend(imm, 8, 16)
+    def _op_srai(self, reg1, reg2, imm, cursor_byte):
+        reg2_val = self.registers_file[reg2]
+        self._write_register(reg1, reg2_val >> imm if reg2_val >= 0 else -((-reg2_val) >> imm))
+        return cursor_byte
 
-            self.RAM[reg1_val + imm] = reg2_val & 0xFFFF
-        elif opcode == 'SW':
-            imm = self._sign_extend(imm, 8, 32)
+    def _op_slti(self, reg1, reg2, imm, cursor_byte):
+        self._write_register(reg1, int(abs(self.registers_file[reg2]) < abs(imm)))
+        return cursor_byte
 
-            self.RAM[reg1_val + imm] = reg2_val
-
-        # branching beq, bneq, blt, ble, blts, bltes
-
-        # note that branches never sign extend. The immediate is supposed to be a label.
-        elif opcode == 'BEQ':
-            if reg1_val == reg2_val:
-                return imm - 4
-        elif opcode == 'BNEQ':
-
-            if reg1_val != reg2_val:
-                return imm - 4
-        elif opcode == 'BLT':
-            if abs(reg1_val) < abs(reg2_val):
-                return imm - 4
-        elif opcode == 'BLE':
-            if abs(reg1_val) <= abs(reg2_val):
-                return imm - 4
-        elif opcode == 'BLTS':
-            # we don't sign extend the immediate value cuz we assume label is only positive
-
-            if reg1_val < reg2_val:
-                return imm - 4
-        elif opcode == 'BLTES':
-
-            if reg1_val < reg2_val:
-                return imm - 4
-        
-        # jump
-        elif opcode == 'JALR':
-            self._write_register(reg1, cursor_byte)
-            return reg2_val + imm
-        
-        else:
-            raise RuntimeError(f"Unknown opcode {repr(opcode)} during dsi simulation")
+    def _op_sltsi(self, reg1, reg2, imm, cursor_byte):
+        self._write_register(reg1, int(self.registers_file[reg2] < self._sign_extend(imm, 8, 32)))
+        return cursor_byte
 
+    # LOADING. Loads from ram at source + offset into destination. Loads are unsigned, half-words and words are big endian.
+    # The byte variants use the offset as unsigned, half-word and word variants as signed. Addresses wrap around at 32 bits.
+    def _op_lb(self, reg1, reg2, imm, cursor_byte):
+        self._write_register(reg1, self.RAM.read_byte((self.registers_file[reg2] + imm) & 0xFF_FF_FF_FF))
         return cursor_byte
 
-    def simulate_ds(self, opcode, reg1, reg2):
-        if opcode == 'SEQZ':
-            val = int(self.registers_file[reg2] == 0)
-            self._write_register(reg1, val)
-            
-        else:
-            raise RuntimeError(f"Unknown opcode {repr(opcode)} during ds simulation")     
+    def _op_lh(self, reg1, reg2, imm, cursor_byte):
+        self._write_register(reg1, self.RAM.read_half((self.registers_file[reg2] + self._sign_extend(imm, 8, 32)) & 0xFF_FF_FF_FF))
+        return cursor_byte
 
-    def simulate_di(self, opcode, reg, imm, cursor_byte):
-        
-        # opcode 8, reg 8, imm 16
-        
-        # these 3 operations are unsigned
-        if opcode == 'JAL':
-            self._write_register(reg, cursor_byte)
+    def _op_lw(self, reg1, reg2, imm, cursor_byte):
+        self._write_register(reg1, self.RAM.read_word((self.registers_file[reg2] + self._sign_extend(imm, 8, 32)) & 0xFF_FF_FF_FF))
+        return cursor_byte
+
+    # SAVING. Saves the lowest 1, 2 or 4 bytes of source into ram at destination + offset
+    def _op_sb(self, reg1, reg2, imm, cursor_byte):
+        self.RAM.write_byte((self.registers_file[reg1] + imm) & 0xFF_FF_FF_FF, self.registers_file[reg2])
+        return cursor_byte
+
+    def _op_sh(self, reg1, reg2, imm, cursor_byte):
+        self.RAM.write_half((self.registers_file[reg1] + self._sign_extend(imm, 8, 32)) & 0xFF_FF_FF_FF, self.registers_file[reg2])
+        return cursor_byte
+
+    def _op_sw(self, reg1, reg2, imm, cursor_byte):
+        self.RAM.write_word((self.registers_file[reg1] + self._sign_extend(imm, 8, 32)) & 0xFF_FF_FF_FF, self.registers_file[reg2])
+        return cursor_byte
+
+    # BRANCHING. beq, bneq, blt, ble, blts, bltes
+    # note that branches never sign extend. The immediate is supposed to be a label.
+    def _op_beq(self, reg1, reg2, imm, cursor_byte):
+        if self.registers_file[reg1] == self.registers_file[reg2]:
             return imm - 4
-        
-        elif opcode == 'LUI':
-            self._write_register(reg, (self.registers_file[reg] & 0x0000_FFFF) | (imm << 16))
-        elif opcode == 'LLI':
-            self._write_register(reg, (self.registers_file[reg] & 0xFFFF_0000) | imm)
+        return cursor_byte
 
-        else:
-            raise RuntimeError(f"Unknown opcode {repr(opcode)} during di simulation")     
-        
-        return cursor_byte 
-    
-    def simulate_i(self, opcode, imm):
-        # notice we don't treat imm as signed
-        # opcode 8, reg 8, imm 16
-        if opcode == 'J':
+    def _op_bneq(self, reg1, reg2, imm, cursor_byte):
+        if self.registers_file[reg1] != self.registers_file[reg2]:
             return imm - 4
-        else:
-            raise RuntimeError(f"Unknown opcode {repr(opcode)} during i simulation" )     
+        return cursor_byte
+
+    def _op_blt(self, reg1, reg2, imm, cursor_byte):
+        if abs(self.registers_file[reg1]) < abs(self.registers_file[reg2]):
+            return imm - 4
+        return cursor_byte
+
+    def _op_ble(self, reg1, reg2, imm, cursor_byte):
+        if abs(self.registers_file[reg1]) <= abs(self.registers_file[reg2]):
+            return imm - 4
+        return cursor_byte
+
+    def _op_blts(self, reg1, reg2, imm, cursor_byte):
+        if self.registers_file[reg1] < self.registers_file[reg2]:
+            return imm - 4
+        return cursor_byte
+
+    def _op_bltes(self, reg1, reg2, imm, cursor_byte):
+        if self.registers_file[reg1] < self.registers_file[reg2]:
+            return imm - 4
+        return cursor_byte
+
+    # jump. The source is read before the return address is written, in case they're the same register
+    def _op_jalr(self, reg1, reg2, imm, cursor_byte):
+        target = self.registers_file[reg2] + imm
+        self._write_register(reg1, cursor_byte)
+        return target
+
+    # DS. opcode destination, source
+    def _op_seqz(self, reg1, reg2, _unused, cursor_byte):
+        self._write_register(reg1, int(self.registers_file[reg2] == 0))
+        return cursor_byte
+
+    # DI. opcode destination, immediate. These 3 operations are unsigned
+    def _op_jal(self, reg, imm, _unused, cursor_byte):
+        self._write_register(reg, cursor_byte)
+        return imm - 4
+
+    def _op_lui(self, reg, imm, _unused, cursor_byte):
+        self._write_register(reg, (self.registers_file[reg] & 0x0000_FFFF) | (imm << 16))
+        return cursor_byte
+
+    def _op_lli(self, reg, imm, _unused, cursor_byte):
+        self._write_register(reg, (self.registers_file[reg] & 0xFFFF_0000) | imm)
+        return cursor_byte
+
+    # I. opcode immediate. Notice we don't treat imm as signed
+    def _op_j(self, imm, _unused1, _unused2, cursor_byte):
+        return imm - 4
+
+    def _op_invalid(self, message, _unused1, _unused2, cursor_byte):
+        """ the handler of words that couldn't be decoded at load time. They are reported only when actually executed. """
+        raise SyntaxError(message)
 
     def _write_register(self, reg, val):
-        """ writes into the register, where reg is the name ('r0' through 'r31'). Keeps r0 constantly 0."""
-        if reg == 'r0':
+        """ writes into the register, where reg is the number (0 through 31). Keeps r0 constantly 0."""
+        if reg == 0:
             return 0
         self.registers_file[reg] = val & 0xFF_FF_FF_FF
 
+    def _register_number(self, number, error_occurance_place):
+        """ validates the register byte representation and returns it unchanged. """
+        self._register_reverse(number, error_occurance_place)
+        return number
+
     def _sign_extend(self, value, input_bits, output_bits):
         """
             if the number is negative in input_bits size, it extends the number into output_bits size, while keeping the value.
@@ -356,6 +711,6 @@ class AssemblySimulator:
 
 TESTING = True
 
-if TESTING:
+if TESTING and __name__ == "__main__":
     simulator = AssemblySimulator()
     simulator.simulate('output', log_registers=True, print_instructions=True, log_ram=True)
\ No newline at end of file
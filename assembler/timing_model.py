@@ -0,0 +1,215 @@
+#########################################################
+#   Timing model file. Created on 18/10/26
+#   Intent: Cycle-approximate model of an in-order scalar pipeline, to estimate how fast a program runs on the Verilog CPU.
+#           It's a simulator observer (look at AssemblySimulator.simulate), so the functional simulation stays the same
+#           and the model only counts cycles:
+#               * every instruction issues in 1 cycle, and the pipeline takes (depth - 1) cycles to fill.
+#               * an instruction with latency N stalls the pipeline for N - 1 cycles (MUL/MULH/DIV/REM vs single cycle ALU ops).
+#               * an instruction reading the destination of the load right before it stalls for load_use_penalty cycles.
+#               * a taken branch flushes branch_penalty cycles (branches are predicted not taken). With a predictor
+#                 (look at branch_predictor.py) every mispredicted branch flushes them instead.
+#               * J and JAL redirect the fetch for jump_penalty cycles, JALR (register target) for indirect_jump_penalty cycles.
+#
+#           Latencies are data-driven: CLASS_LATENCIES is keyed by the opcode classes of opcodes.py (ARITHMETIC_BIT, LOGIC_BIT,
+#           LOADSTORE_BIT, BRANCHING_BIT), and OPCODE_LATENCIES overrides single opcodes. Both can be replaced per model.
+#
+#           With caches (a CacheModel of cache_model.py, passed to simulate as well) the cycles lost to cache misses
+#           are added as 'memory' stalls.
+#
+#           report() prints the total cycles, CPI and the stall cycles per opcode class and cause.
+#
+#           Usage: python -m assembler.timing_model program.asm [--depth 5] [--branch-penalty 2] [--load-use-penalty 1] [--predictor 2-bit]
+
+import argparse
+from collections import defaultdict
+
+from . import opcodes as op
+from .branch_predictor import BackwardTaken, OneBit, TwoBit, GShare
+from .simulator import AssemblySimulator
+
+# opcode bits selecting the class, look at opcodes.py
+CLASS_MASK = 0b0_11_0_0_000
+CLASS_NAMES = {op.ARITHMETIC_BIT: 'arithmetic', op.LOGIC_BIT: 'logic', op.LOADSTORE_BIT: 'load/store', op.BRANCHING_BIT: 'branching'}
+
+# execution latency in cycles of every opcode class
+CLASS_LATENCIES = {
+    op.ARITHMETIC_BIT: 1,
+    op.LOGIC_BIT:      1,
+    op.LOADSTORE_BIT:  1,
+    op.BRANCHING_BIT:  1,
+}
+
+# opcodes which don't take their class's latency
+OPCODE_LATENCIES = {
+    op.Opcode.MUL:  3,
+    op.Opcode.MULH: 3,
+    op.Opcode.DIV:  20,
+    op.Opcode.REM:  20,
+}
+
+LOADS = {op.Opcode.LB, op.Opcode.LH, op.Opcode.LW}
+STORES = {op.Opcode.SB, op.Opcode.SH, op.Opcode.SW}
+BRANCHES = {op.Opcode.BEQ, op.Opcode.BNEQ, op.Opcode.BLT, op.Opcode.BLE, op.Opcode.BLTS, op.Opcode.BLTES}
+DS_OPCODES = {op.Opcode.SEQZ}
+DI_OPCODES = {op.Opcode.LUI, op.Opcode.LLI} # they keep half of the destination, so they read it as well
+NO_REGISTERS = {op.Opcode.NOP, op.Opcode.J}
+
+# kinds of control flow
+SEQUENTIAL, BRANCH, JUMP, INDIRECT_JUMP = range(4)
+
+
+def register_usage(word):
+    """ returns (tuple of read registers, written register or None) of the instruction word """
+    opcode = word >> 24
+    arg1, arg2, arg3 = (word >> 16) & 0xFF, (word >> 8) & 0xFF, word & 0xFF
+
+    if opcode in NO_REGISTERS:
+        return (), None
+    if opcode == op.Opcode.JAL:
+        return (), arg1
+    if opcode in DI_OPCODES:
+        return (arg1,), arg1
+    if opcode in STORES or opcode in BRANCHES:
+        return (arg1, arg2), None
+    if opcode in DS_OPCODES or opcode & op.IMMEDIATE_BIT:   # DS, DSI (ALU immediates, loads, JALR)
+        return (arg2,), arg1
+    return (arg2, arg3), arg1                               # DSS
+
+
+class TimingModel:
+    """
+        * pipeline_depth        - number of pipeline stages.
+        * class_latencies       - opcode class -> latency in cycles, CLASS_LATENCIES by default.
+        * opcode_latencies      - opcode -> latency, overriding the class. OPCODE_LATENCIES by default.
+        * load_use_penalty      - stall of an instruction using the result of the load right before it.
+        * branch_penalty        - cycles lost by a taken branch.
+        * jump_penalty          - cycles lost by J and JAL.
+        * indirect_jump_penalty - cycles lost by JALR.
+        * caches                - CacheModel whose lost cycles are added to every instruction, or None.
+        * predictor             - branch predictor (branch_predictor.py) used by the model. Don't share it with other observers.
+
+        * functions interface - on_step, cycles, cpi, report.
+    """
+    def __init__(self, pipeline_depth=5, class_latencies=None, opcode_latencies=None,
+                 load_use_penalty=1, branch_penalty=2, jump_penalty=1, indirect_jump_penalty=2, caches=None, predictor=None):
+        self.pipeline_depth = pipeline_depth
+        self.class_latencies = dict(CLASS_LATENCIES if class_latencies is None else class_latencies)
+        self.opcode_latencies = dict(OPCODE_LATENCIES if opcode_latencies is None else opcode_latencies)
+        self.load_use_penalty = load_use_penalty
+        self.branch_penalty = branch_penalty
+        self.jump_penalty = jump_penalty
+        self.indirect_jump_penalty = indirect_jump_penalty
+        self.caches = caches
+        self.predictor = predictor
+
+        self.instructions = 0
+        self.issue_cycles = 0
+        self.stalls = defaultdict(lambda: defaultdict(int)) # class name -> cause -> stall cycles
+
+        self.load_destination = None # destination register of the previous instruction, if it was a load
+        self.decoded = {}            # instruction word -> (class name, latency, read registers, load destination, control flow kind)
+
+    def on_step(self, simulator, cursor_byte, word, next_cursor_byte):
+        info = self.decoded.get(word)
+        if info is None:
+            info = self.decoded[word] = self._decode(word)
+        class_name, latency, sources, load_destination, kind = info
+
+        cycles = latency
+        if latency > 1:
+            self.stalls[class_name]['latency'] += latency - 1
+
+        if self.load_destination is not None and self.load_destination in sources:
+            cycles += self.load_use_penalty
+            self.stalls[class_name]['load-use'] += self.load_use_penalty
+
+        if kind != SEQUENTIAL:
+            penalty = self._control_penalty(simulator, kind, cursor_byte, word)
+            if penalty:
+                cycles += penalty
+                self.stalls[class_name]['branch' if kind == BRANCH else 'jump'] += penalty
+
+        if self.caches is not None and self.caches.last_cycles_lost:
+            cycles += self.caches.last_cycles_lost
+            self.stalls[class_name]['memory'] += self.caches.last_cycles_lost
+
+        self.instructions += 1
+        self.issue_cycles += cycles
+        self.load_destination = load_destination
+
+    def cycles(self):
+        """ total cycles, including the pipeline fill """
+        if not self.instructions:
+            return 0
+        return self.issue_cycles + self.pipeline_depth - 1
+
+    def cpi(self):
+        return self.cycles() / self.instructions if self.instructions else 0.0
+
+    def report(self):
+        lines = [f"Timing: {self.instructions} instructions, {self.cycles()} cycles, CPI {self.cpi():.3f} "
+                 f"({self.pipeline_depth} stage pipeline)"]
+
+        total = sum(sum(causes.values()) for causes in self.stalls.values())
+        lines.append(f"\nStall cycles per opcode class ({total} total):")
+        for class_name, causes in sorted(self.stalls.items()):
+            breakdown = ', '.join(f"{cause} {cycles}" for cause, cycles in sorted(causes.items()))
+            lines.append(f"  {class_name:<12} {sum(causes.values()):>10}  ({breakdown})")
+
+        return '\n'.join(lines)
+
+    #
+    # UTILITY FUNCTIONS
+    #
+    def _control_penalty(self, simulator, kind, cursor_byte, word):
+        if kind == BRANCH:
+            taken = simulator.branch_taken(word)
+            if self.predictor is None:
+                return self.branch_penalty if taken else 0
+
+            target = word & 0xFF # branches jump to the absolute address in the immediate
+            predicted = self.predictor.predict(cursor_byte, target)
+            self.predictor.update(cursor_byte, target, taken)
+            return self.branch_penalty if predicted != taken else 0
+        if kind == JUMP:
+            return self.jump_penalty
+        return self.indirect_jump_penalty
+
+    def _decode(self, word):
+        opcode = word >> 24
+        op_class = opcode & CLASS_MASK
+        latency = self.opcode_latencies.get(opcode, self.class_latencies.get(op_class, 1))
+
+        sources, destination = register_usage(word)
+        # r0 is never written, so nothing waits for it
+        sources = tuple(reg for reg in sources if reg != 0)
+        load_destination = destination if opcode in LOADS and destination != 0 else None
+
+        kind = SEQUENTIAL
+        if opcode in BRANCHES:
+            kind = BRANCH
+        elif opcode in (op.Opcode.J, op.Opcode.JAL):
+            kind = JUMP
+        elif opcode == op.Opcode.JALR:
+            kind = INDIRECT_JUMP
+
+        return (CLASS_NAMES.get(op_class, bin(op_class)), latency, sources, load_destination, kind)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assemble and simulate a program, estimating its cycles with a pipeline timing model")
+    parser.add_argument('program')
+    parser.add_argument('--depth', type=int, default=5, help="number of pipeline stages")
+    parser.add_argument('--load-use-penalty', type=int, default=1)
+    parser.add_argument('--branch-penalty', type=int, default=2)
+    parser.add_argument('--jump-penalty', type=int, default=1)
+    parser.add_argument('--indirect-jump-penalty', type=int, default=2)
+    parser.add_argument('--predictor', choices=['not-taken', 'backward-taken', '1-bit', '2-bit', 'gshare'], default='not-taken')
+    args = parser.parse_args()
+
+    predictors = {'not-taken': None, 'backward-taken': BackwardTaken(), '1-bit': OneBit(), '2-bit': TwoBit(), 'gshare': GShare()}
+    model = TimingModel(args.depth, load_use_penalty=args.load_use_penalty, branch_penalty=args.branch_penalty,
+                        jump_penalty=args.jump_penalty, indirect_jump_penalty=args.indirect_jump_penalty,
+                        predictor=predictors[args.predictor])
+    AssemblySimulator().simulate_assembly(args.program, observers=[model])
+    print(model.report())
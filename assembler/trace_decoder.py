@@ -0,0 +1,89 @@
+#########################################################
+#   Trace decoder. Created on 18/10/26
+#   Intent: Turns a binary trace file written by TraceRecorder (trace_recorder.py) into text, one line per executed instruction:
+#               <index> <pc>: <opcode> <field> <field> <field>    [r<n> <- <value>] [mem[<address>] <- <value> (<n> bytes)]
+#           Records can be filtered by PC range, opcode, written register and written memory range.
+#
+#           Usage: python -m assembler.trace_decoder trace.bin [--pc 0x10:0x40] [--register r3] [--address 0:16] [--opcode ADD] [--limit N]
+
+import argparse
+import sys
+
+from . import opcodes as op
+from .trace_recorder import read_trace
+
+OPCODE_NAMES = {opcode.value: opcode.name for opcode in op.Opcode}
+
+
+def parse_range(text):
+    """ parses 'start:end' (end excluded) or a single address into (start, end). Numbers can be in any python base (0x10) """
+    if ':' in text:
+        start, end = text.split(':', 1)
+        return int(start, 0), int(end, 0)
+    start = int(text, 0)
+    return start, start + 1
+
+
+def filter_trace(records, pc_range=None, register=None, address_range=None, opcode=None):
+    """ yields (index, record) of the records matching all of the given filters. Index is the position in the whole trace. """
+    for index, record in enumerate(records):
+        pc, word, reg, _, address, _, width = record
+
+        if pc_range is not None and not pc_range[0] <= pc < pc_range[1]:
+            continue
+        if opcode is not None and word >> 24 != opcode:
+            continue
+        if register is not None and reg != register:
+            continue
+        # a store matches if any of its bytes is in the range
+        if address_range is not None and (address is None or address + width <= address_range[0] or address >= address_range[1]):
+            continue
+
+        yield index, record
+
+
+def format_record(index, record):
+    pc, word, reg, value, address, stored, width = record
+
+    text = f"{index:>10} {pc:#010x}: {OPCODE_NAMES.get(word >> 24, bin(word >> 24)):<6} {(word >> 16) & 0xFF:>3} {(word >> 8) & 0xFF:>3} {word & 0xFF:>3}"
+    if reg is not None:
+        text += f"    r{reg} <- {value}"
+    if address is not None:
+        text += f"    mem[{address}] <- {stored} ({width} bytes)"
+    return text
+
+
+def decode_trace(file_name, output=sys.stdout, limit=None, **filters):
+    """ writes the filtered records of the trace file as text into output. Returns the number of written lines. """
+    written = 0
+    for index, record in filter_trace(read_trace(file_name), **filters):
+        if limit is not None and written >= limit:
+            break
+        print(format_record(index, record), file=output)
+        written += 1
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode and filter a binary execution trace written by TraceRecorder")
+    parser.add_argument('trace')
+    parser.add_argument('--pc', type=parse_range, help="PC range start:end (end excluded), or a single PC")
+    parser.add_argument('--register', help="only instructions writing this register, e.g. r3")
+    parser.add_argument('--address', type=parse_range, help="only stores touching this memory range start:end, or a single address")
+    parser.add_argument('--opcode', help="only this opcode, e.g. ADD")
+    parser.add_argument('--limit', type=int, default=None, help="maximal number of printed records")
+    args = parser.parse_args()
+
+    register = None
+    if args.register is not None:
+        if not args.register.lower().startswith('r') or not args.register[1:].isdigit() or int(args.register[1:]) > 31:
+            parser.error(f"Invalid register {args.register}, expected r0 to r31")
+        register = int(args.register[1:])
+
+    opcode = None
+    if args.opcode is not None:
+        if args.opcode.upper() not in op.Opcode.__members__:
+            parser.error(f"Unknown opcode {args.opcode}")
+        opcode = op.Opcode[args.opcode.upper()].value
+
+    decode_trace(args.trace, limit=args.limit, pc_range=args.pc, register=register, address_range=args.address, opcode=opcode)
@@ -0,0 +1,139 @@
+#########################################################
+#   Execution trace recorder. Created on 18/10/26
+#   Intent: Records every executed instruction as a fixed-size binary record, instead of printing the whole
+#           machine state after every instruction (log_registers, log_ram). The records are packed into a
+#           preallocated ring buffer, which is written into the file in bulk when it gets full.
+#           Decode the file into text with trace_decoder.py.
+#
+#           File layout: header (magic 'CPUT', version, record size), followed by the records.
+#           Record layout (big endian, 22 bytes):
+#               PC (32 bits), instruction word (32 bits), flags (8 bits), destination register (8 bits),
+#               new register value (32 bits), memory address (32 bits), stored value (32 bits)
+#           flags: bit 0 - a register was written, bit 1 - memory was written, bits 2-4 - number of stored bytes.
+#           Fields which don't apply to the instruction are 0.
+#
+#           The recorder is a simulator observer: pass it to AssemblySimulator.simulate(observers=[recorder]).
+
+import os
+import struct
+
+from . import opcodes as op
+
+MAGIC = b'CPUT'
+VERSION = 1
+
+HEADER = struct.Struct(">4sHH")
+RECORD = struct.Struct(">IIBBIII")
+
+REGISTER_WRITTEN = 0b01
+MEMORY_WRITTEN = 0b10
+
+MASK = 0xFF_FF_FF_FF
+
+STORE_WIDTHS = {op.Opcode.SB: 1, op.Opcode.SH: 2, op.Opcode.SW: 4}
+
+# every opcode writes its destination register, except for these
+NO_REGISTER_WRITE = {op.Opcode.NOP, op.Opcode.SB, op.Opcode.SH, op.Opcode.SW, op.Opcode.J,
+                     op.Opcode.BEQ, op.Opcode.BNEQ, op.Opcode.BLT, op.Opcode.BLE, op.Opcode.BLTS, op.Opcode.BLTES}
+REGISTER_WRITERS = {opcode.value for opcode in op.Opcode if opcode not in NO_REGISTER_WRITE}
+
+
+class TraceRecorder:
+    """
+        * file_name - the trace file. If None, nothing is written and the buffer keeps the last 'capacity' records.
+                      It can also be a binary file object (e.g. io.BytesIO), which close leaves open.
+        * capacity  - the number of records in the ring buffer.
+
+        * functions interface - on_step, flush, close, records.
+        \t on_step - called by the simulator after every executed instruction.
+        \t flush   - writes the buffered records into the file.
+        \t close   - flushes and closes the file. Use the recorder as a context manager to close it automatically.
+        \t records - returns the buffered records (oldest first) as tuples, see decode_record.
+    """
+    def __init__(self, file_name=None, capacity=64 * 1024):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD.size)
+        self.position = 0   # byte position of the next record in the buffer
+        self.wrapped = False # whether the buffer without a file has been overwritten from the start
+        self.count = 0      # total number of recorded instructions
+
+        self.file = None
+        self.owns_file = isinstance(file_name, (str, bytes, os.PathLike))
+        if file_name is not None:
+            self.file = open(file_name, "wb") if self.owns_file else file_name
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def on_step(self, simulator, cursor_byte, word, next_cursor_byte):
+        opcode = word >> 24
+        flags = reg = value = address = stored = 0
+
+        if opcode in REGISTER_WRITERS:
+            flags = REGISTER_WRITTEN
+            reg = (word >> 16) & 0xFF
+            value = simulator.registers_file[reg]
+
+        elif opcode in STORE_WIDTHS:
+            # stores don't change registers, so the address can be computed after the execution
+            address, width, _ = simulator.memory_access(word)
+            flags = MEMORY_WRITTEN | (width << 2)
+            stored = (simulator.RAM.read_byte, simulator.RAM.read_half, None, simulator.RAM.read_word)[width - 1](address)
+
+        RECORD.pack_into(self.buffer, self.position, cursor_byte & MASK, word, flags, reg, value, address, stored)
+        self.position += RECORD.size
+        self.count += 1
+
+        if self.position == len(self.buffer):
+            if self.file is not None:
+                self.flush()
+            else:
+                self.position = 0
+                self.wrapped = True
+
+    def flush(self):
+        if self.file is not None and self.position:
+            self.file.write(memoryview(self.buffer)[:self.position])
+            self.position = 0
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            if self.owns_file:
+                self.file.close()
+            self.file = None
+
+    def records(self):
+        """ the records still in the buffer, oldest first """
+        if self.wrapped:
+            data = self.buffer[self.position:] + self.buffer[:self.position]
+        else:
+            data = self.buffer[:self.position]
+        return [decode_record(record) for record in RECORD.iter_unpack(data)]
+
+
+def decode_record(record):
+    """
+        turns the unpacked record into (pc, word, register or None, register value, address or None, stored value, stored bytes)
+    """
+    pc, word, flags, reg, value, address, stored = record
+    return (pc, word,
+            reg if flags & REGISTER_WRITTEN else None, value,
+            address if flags & MEMORY_WRITTEN else None, stored, (flags >> 2) & 0b111)
+
+
+def read_trace(file_name, chunk_records=64 * 1024):
+    """ yields the decoded records of the trace file, reading it in large chunks """
+    with open(file_name, "rb") as f:
+        magic, version, record_size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise RuntimeError(f"{file_name} is not a trace file, or has an unsupported version")
+
+        while chunk := f.read(chunk_records * RECORD.size):
+            usable = len(chunk) - len(chunk) % RECORD.size
+            for record in RECORD.iter_unpack(chunk[:usable]):
+                yield decode_record(record)
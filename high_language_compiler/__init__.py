@@ -0,0 +1,4 @@
+#########################################################
+#   High language compiler package. Created on 18/10/26
+#   Intent: The lexer, parsers and the semantic analysis of the high level language, importable as a package.
+#           Nothing is imported here eagerly, import the modules themselves, e.g. 'from high_language_compiler.lexer import Lexer'.
@@ -16,9 +16,9 @@
 # ^ The lexer is ready.
 
 import textwrap
-from tokens import Token, Tokens, OPERATORS, KEYWORDS, PUNCTUATIONS, NUMBERS
+from .tokens import Token, Tokens, OPERATORS, KEYWORDS, PUNCTUATIONS, NUMBERS
 
-from iterator import Iterator
+from .iterator import Iterator
 
 
 class Lexer:
@@ -5,9 +5,9 @@
 
 # # note for 22/6. For now I will work on simple mathematical expressions. Keywords will be worked later
 
-from tokens import Token, Tokens, OPERATORS, KEYWORDS, PUNCTUATIONS, NUMBERS
-from iterator import Iterator
-from expression import Expression
+from .tokens import Token, Tokens, OPERATORS, KEYWORDS, PUNCTUATIONS, NUMBERS
+from .iterator import Iterator
+from .expression import Expression
 
 # TODO: note the TDD design. Write the tests.
 
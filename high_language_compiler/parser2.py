@@ -68,9 +68,9 @@
 
 # TODO : Some minor tweeks and enhancements. Better error logging. Do more tests. Prettier tree printing. See if you can solve the problem with writing semicolon after the cloing bracket, or at least add it to the documentation.
 
-from iterator import Iterator
-from tokens import Tokens
-from abstract_syntax_tree import AST
+from .iterator import Iterator
+from .tokens import Tokens
+from .abstract_syntax_tree import AST
 
 class Parser2:
     def __init__(self, verbose=False):
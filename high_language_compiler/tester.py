@@ -1,9 +1,9 @@
-from tokens import Token, Tokens
-from lexer import Lexer
-from parser import Parser
-from abstract_syntax_tree import AST
-from semantic_analysis import Semantic_Analyser
-import parser2
+from .tokens import Token, Tokens
+from .lexer import Lexer
+from .parser import Parser
+from .abstract_syntax_tree import AST
+from .semantic_analysis import Semantic_Analyser
+from . import parser2
 
 class LexerTester:
     """
@@ -145,14 +145,16 @@ function hello(a,b){
 """
 
 
-l = Lexer(a)
-test_tokens = l.tokenize()
+# the example runs only as a script, importing the testers does nothing
+if __name__ == "__main__":
+    l = Lexer(a)
+    test_tokens = l.tokenize()
 
-# print(test_tokens)
+    # print(test_tokens)
 
-parser = parser2.Parser2()
-ast = parser.parse(test_tokens)
-print(ast)
+    parser = parser2.Parser2()
+    ast = parser.parse(test_tokens)
+    print(ast)
 
-analyser = Semantic_Analyser()
-analyser.analyse(ast)
\ No newline at end of file
+    analyser = Semantic_Analyser()
+    analyser.analyse(ast)